@@ -0,0 +1,256 @@
+import json
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+
+BUCKET_SECONDS = 15 * 60   # 場地使用率的時間格 (15 分鐘)
+NIGHT_CUTOFF_HOURS = 6     # 打過午夜還算前一晚：凌晨 6 點前都算前一天
+DB_FILE = "analytics.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nights (
+    started REAL PRIMARY KEY,
+    date    TEXT NOT NULL,
+    stats   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nights_date ON nights (date);
+"""
+
+
+def night_of(ts):
+    """epoch 秒屬於哪一晚 (YYYY-MM-DD)"""
+    return datetime.fromtimestamp(ts - NIGHT_CUTOFF_HOURS * 3600).strftime("%Y-%m-%d")
+
+
+def pair_key(a, b):
+    """兩人的 key：用名字 (跨晚也對得上)，和 pairing.pair_key 用 id 不同"""
+    return "\t".join(sorted((a, b)))
+
+
+def _bump(table, key, *amounts):
+    """table[key] 是計數列表，每格加上 amounts
+
+    整格換成新列表、不就地修改：寫進日誌的值會直接成為存檔狀態的一部分。
+    """
+    row = [x + n for x, n in zip(table.get(key) or [0] * len(amounts), amounts)]
+    table[key] = row
+    return row
+
+
+class SessionStats:
+    """一個晚上的統計 (每打完一場更新一次，顯示時不用重掃比賽紀錄)
+
+    players: 名字 -> [場數, 在場上的秒數, 勝場]
+    pairs:   "甲\\t乙" -> [搭檔次數, 對手次數] (名字排序後用 tab 連接)
+    mix:     場地 -> {"分組/分組/分組/分組": 場數}
+    util:    場地 -> {時間格: 打球秒數} (時間格 = epoch 秒 // BUCKET_SECONDS)
+
+    observe() 會記下改到哪些路徑，take_changes() 取出來給 App 寫進日誌，
+    每場只寫十幾個小欄位，不用每次存整份。
+    """
+
+    def __init__(self, started=None, players=None, pairs=None, mix=None, util=None):
+        self.started = time.time() if started is None else started
+        self.players = dict(players or {})
+        self.pairs = dict(pairs or {})
+        self.mix = {str(c): dict(v) for c, v in (mix or {}).items()}
+        self.util = {str(c): dict(v) for c, v in (util or {}).items()}
+        self._changes = []
+
+    def observe(self, record, levels):
+        """記一場四人的比賽 (levels 依 record.players() 的順序)"""
+        names = record.players()
+        if len(names) != 4:
+            return False
+        seconds = max(0.0, record.end - record.start) if record.start and record.end else 0.0
+        winners = {1: record.team1, 2: record.team2}.get(record.winner, ())
+        for name in names:
+            row = _bump(self.players, name, 1, seconds, 1 if name in winners else 0)
+            self._changes.append((("players", name), row))
+        for team in (record.team1, record.team2):
+            key = pair_key(*team)
+            self._changes.append((("pairs", key), _bump(self.pairs, key, 1, 0)))
+        for a in record.team1:
+            for b in record.team2:
+                key = pair_key(a, b)
+                self._changes.append((("pairs", key), _bump(self.pairs, key, 0, 1)))
+        court = str(record.court)
+        combo = "/".join(sorted(levels))
+        court_mix = self.mix[court] = dict(self.mix.get(court, {}))
+        court_mix[combo] = court_mix.get(combo, 0) + 1
+        self._changes.append((("mix", court, combo), court_mix[combo]))
+        if seconds:
+            # 跨好幾格的比賽按時間拆開
+            court_util = self.util[court] = dict(self.util.get(court, {}))
+            t = record.start
+            while t < record.end:
+                bucket = int(t // BUCKET_SECONDS)
+                step = min(record.end, (bucket + 1) * BUCKET_SECONDS) - t
+                key = str(bucket)
+                court_util[key] = court_util.get(key, 0.0) + step
+                self._changes.append((("util", court, key), court_util[key]))
+                t += step
+        return True
+
+    def take_changes(self):
+        """取出上次以來改到的 [(路徑, 新值)] (同一路徑只留最後一次)"""
+        changes, self._changes = self._changes, []
+        return list(dict(changes).items())
+
+    def rename(self, old_name, new_name):
+        if old_name in self.players:
+            self.players[new_name] = self.players.pop(old_name)
+        for key in [k for k in self.pairs if old_name in k.split("\t")]:
+            a, b = key.split("\t")
+            self.pairs[pair_key(new_name if a == old_name else a, new_name if b == old_name else b)] = \
+                self.pairs.pop(key)
+
+    def to_dict(self):
+        # 外層複製一份；每一格在 observe() 時都是整格換新，不會被就地修改
+        return {"started": self.started, "players": dict(self.players), "pairs": dict(self.pairs),
+                "mix": dict(self.mix), "util": dict(self.util)}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(data.get("started"), data.get("players"), data.get("pairs"),
+                   data.get("mix"), data.get("util"))
+
+    def night(self):
+        return night_of(self.started)
+
+    @classmethod
+    def rebuild(cls, records, level_of):
+        """舊存檔沒有統計時，從還留著的比賽紀錄重建最後一晚 (開始時間取那晚最早那場，重建幾次都一樣)"""
+        records = [r for r in records if len(r.players()) == 4 and r.end]
+        if records:
+            last = night_of(max(r.end for r in records))
+            records = [r for r in records if night_of(r.end) == last]
+        times = [r.start or r.end for r in records]
+        stats = cls(started=min(times) if times else None)
+        for r in sorted(records, key=lambda r: r.end or 0):
+            stats.observe(r, [level_of(n) for n in r.players()])
+        stats.take_changes()
+        return stats
+
+
+def merge(nights):
+    """把好幾個晚上的統計加總 (給日期範圍用)，回傳新的 SessionStats"""
+    total = SessionStats(started=min((n.started for n in nights), default=None))
+    for night in nights:
+        for name, row in night.players.items():
+            old = total.players.get(name, [0, 0.0, 0])
+            total.players[name] = [x + y for x, y in zip(old, row)]
+        for key, row in night.pairs.items():
+            old = total.pairs.get(key, [0, 0])
+            total.pairs[key] = [x + y for x, y in zip(old, row)]
+        for court, combos in night.mix.items():
+            court_mix = total.mix.setdefault(court, {})
+            for combo, n in combos.items():
+                court_mix[combo] = court_mix.get(combo, 0) + n
+        for court, buckets in night.util.items():
+            court_util = total.util.setdefault(court, {})
+            for bucket, seconds in buckets.items():
+                court_util[bucket] = court_util.get(bucket, 0.0) + seconds
+    return total
+
+
+# --- 給畫面用的表格 ---
+
+def player_rows(stats):
+    """每人場數、在場時間、勝場 (依場數排序)"""
+    rows = []
+    for name, (games, seconds, wins) in stats.players.items():
+        rows.append({
+            "球員": name,
+            "場數": games,
+            "在場 (分)": round(seconds / 60),
+            "平均每場 (分)": round(seconds / 60 / games, 1) if games else 0.0,
+            "勝場": wins,
+        })
+    rows.sort(key=lambda r: (-r["場數"], r["球員"]))
+    return rows
+
+
+def pair_cells(stats, names, kind=0):
+    """熱度圖用的 [(甲, 乙, 次數)]；kind 0 = 搭檔、1 = 對手"""
+    names = list(names)
+    cells = []
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            n = stats.pairs.get(pair_key(a, b), (0, 0))[kind]
+            if n:
+                cells.append((a, b, n))
+                cells.append((b, a, n))
+    return cells
+
+
+def mix_rows(stats):
+    """每面場地各種分組組合打了幾場"""
+    rows = []
+    for court in sorted(stats.mix, key=int):
+        for combo, n in sorted(stats.mix[court].items(), key=lambda x: -x[1]):
+            rows.append({"場地": int(court), "組合": combo, "場數": n})
+    return rows
+
+
+def utilization(nights):
+    """各時段 (當地時間，15 分鐘一格) 的場地使用率 [(時段, 使用率)]
+
+    分母 = 那個時段有開場的晚上 × 當晚用過的場地數 × 格長，多個晚上時依時段平均。
+    """
+    busy, capacity = {}, {}
+    for night in nights:
+        buckets = [int(b) for court in night.util.values() for b in court]
+        if not buckets:
+            continue
+        courts = len(night.util)
+        for bucket in range(min(buckets), max(buckets) + 1):
+            label = datetime.fromtimestamp(bucket * BUCKET_SECONDS).strftime("%H:%M")
+            capacity[label] = capacity.get(label, 0.0) + courts * BUCKET_SECONDS
+            for court_util in night.util.values():
+                busy[label] = busy.get(label, 0.0) + court_util.get(str(bucket), 0.0)
+    # 打過午夜的晚上：凌晨的時段排在最後
+    order = sorted(capacity, key=lambda label: (label < "06:00", label))
+    return [(label, busy.get(label, 0.0) / capacity[label]) for label in order]
+
+
+class NightArchive:
+    """每個晚上的統計存一列 (SQLite)，查好幾週只要合併幾十列，不用重掃比賽封存檔"""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def save(self, stats):
+        """寫入 (或更新) 這個晚上的統計；同一晚以開始時間區分，清除重來算另一晚"""
+        if not stats.players:
+            return
+        date = stats.night()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO nights (started, date, stats) VALUES (?, ?, ?)",
+                         (stats.started, date, json.dumps(stats.to_dict(), ensure_ascii=False)))
+
+    def discard(self, started):
+        """刪掉某一晚 (復原換日後的第一場時，那一晚就不存在了)"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM nights WHERE started = ?", (started,))
+
+    def load(self, start_date=None, end_date=None):
+        """日期範圍內 (含頭尾，YYYY-MM-DD) 每個晚上的 SessionStats"""
+        sql, args = "SELECT stats FROM nights WHERE 1=1", []
+        if start_date:
+            sql += " AND date >= ?"
+            args.append(start_date)
+        if end_date:
+            sql += " AND date <= ?"
+            args.append(end_date)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql + " ORDER BY started", args).fetchall()
+        return [SessionStats.from_dict(json.loads(row[0])) for row in rows]
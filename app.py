@@ -1,54 +1,283 @@
+import os
+import time
+from contextlib import contextmanager
 import streamlit as st
 import random
-import json
-import os
-import base64
-from datetime import datetime
-from openai import OpenAI
+from datetime import datetime, timedelta
+import analytics
+import imagecache
+import matchlog
+import metrics
+from clubs import ClubRegistry, DEFAULT_CLUB, club_id
+import roster_import
+from scheduler import Scheduler, LEVELS, LEVEL_ICONS
+from storage import Cursor
+from undo import Step, UndoLog
+
+_page_started = time.perf_counter()
+_page_done = False   # 整頁畫完才設成 True；之後的局部重整看得到 (fragment 用的是這一輪的全域變數)
 
 # 設定頁面配置
 st.set_page_config(page_title="🏸 羽球非同步輪替系統", page_icon="🏸", layout="wide")
 
+METRICS_FILE = os.environ.get("BADMINTON_METRICS_FILE", "metrics.prom")   # 開啟計時時定期寫出
+
 # --- 讀取 API Key ---
-# 優先從 Streamlit Secrets 讀取
-api_key = st.secrets.get("OPENAI_API_KEY", None)
+# 優先從 Streamlit Secrets 讀取 (整個程式讀一次就好，不用每次重跑都解析)
+@st.cache_resource
+def get_api_key():
+    return st.secrets.get("OPENAI_API_KEY", None)
+
+api_key = get_api_key()
+
+@st.cache_resource
+def get_debug_key():
+    """效能面板的通關碼 (沒設定時面板不開放)"""
+    return st.secrets.get("DEBUG_KEY", None)
+
+@st.cache_resource
+def get_clubs():
+    """所有球團的存檔 (最近用到的幾個留在記憶體，整個程式共用一份)"""
+    return ClubRegistry()
+
+# 球團由網址參數決定 (?club=代號)，沒給就是預設球團
+_club = club_id(st.query_params.get("club"))
+if st.session_state.get("club", _club) != _club:
+    # 同一個分頁換了球團：這個 session 裡的東西都是別的球團的
+    st.session_state.clear()
+st.session_state.club = _club
+if 'cursor' not in st.session_state:
+    st.session_state.cursor = Cursor()   # 這個 session 看過的存檔版本
 
-DATA_FILE = "badminton_state.json"
+def current_club():
+    return get_clubs().get(st.session_state.club)
 
+def get_store():
+    return current_club().store
+
+@metrics.timed("app.save_state_ms")
 def save_state():
-    """儲存目前狀態到 JSON"""
-    data = {
-        "players": st.session_state.players,
-        "courts": st.session_state.courts,
-        "court_status": st.session_state.court_status,
-        "history": st.session_state.history,
-        "openai_usage": st.session_state.get('openai_usage', {}) # NEW: Persist usage stats
-    }
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    """寫入完整快照 (快照 + 日誌壓縮)，內容是存檔目前的狀態 (含其他裝置的修改)"""
+    get_store().snapshot()
+    get_directory().flush()
 
-def load_state():
-    """從 JSON 讀取狀態"""
-    if os.path.exists(DATA_FILE):
+@metrics.timed("app.sync_state_ms")
+def sync_state():
+    """其他裝置有修改就換成最新狀態 (沒有變動時只花兩次 stat)，回傳是否有更新
+
+    每個修改動作開頭都先呼叫：按鈕 callback 和局部重整都不會跑到頁面開頭的同步。
+    """
+    data = get_store().sync(st.session_state.cursor)
+    if data is None:
+        return False
+    st.session_state.sched.reload(data)
+    st.session_state.openai_usage = data.get("openai_usage", {})
+    return True
+
+def log_change(op, *path, value=None, undo=True, **extra):
+    """把單筆修改追加到日誌，日誌太大時才寫完整快照
+
+    在 batch() 裡面時先收著，整個動作結束時一起寫成一行。
+    在 undoable() 裡面時順便記下修改前的值 (undo=False 的不記，例如封存)。
+    """
+    pending = st.session_state.get("pending_changes")
+    if pending is not None:
+        pending.append(((op, path, value, extra), undo))
+        return
+    write_changes([((op, path, value, extra), undo)])
+
+def write_changes(changes):
+    """[(修改, 要不要記給復原)] 一次寫進日誌 (一次鎖、一次 fsync)"""
+    journal = st.session_state.get("undo_journal")
+    befores = [] if journal is not None else None
+    if get_store().append_many([c for c, _ in changes], cursor=st.session_state.cursor, record=befores):
+        save_state()
+    if journal is not None:
+        journal.extend(b for b, (_, undo) in zip(befores, changes) if undo)
+
+@contextmanager
+def batch():
+    """這段裡的修改整批寫進日誌：一個動作只拿一次鎖、fsync 一次，當機時也不會只寫了一半
+
+    巢狀呼叫時併進外層那一批。
+    """
+    if st.session_state.get("pending_changes") is not None:
+        yield
+        return
+    pending = st.session_state.pending_changes = []
+    try:
+        yield
+    finally:
+        # 記憶體裡的狀態已經改了，中途出例外也要把已經做的寫下去
+        st.session_state.pending_changes = None
+        if pending:
+            write_changes(pending)
+
+@contextmanager
+def undoable(label):
+    """這段裡寫進日誌的修改算成一步，可以用「↩️ 復原」改回去
+
+    yield 一個 dict {名字: 累計場次 +幾場}，復原時會員名錄跟著扣回去。
+    巢狀呼叫時併進外層那一步。
+    """
+    if st.session_state.get("undo_journal") is not None:
+        yield {}
+        return
+    journal, games = [], {}
+    st.session_state.undo_journal = journal
+    try:
+        with batch():
+            yield games
+    finally:
+        st.session_state.undo_journal = None
+        st.session_state.undo.record(Step.from_journal(label, journal, games))
+
+def apply_undo(redo=False):
+    """復原 (或重做) 最近一步，回傳是否成功
+
+    只把這一步改到的欄位寫回去；其他裝置之後又改過同樣的欄位就不動，免得蓋掉別人的修改。
+    """
+    sync_state()
+    undo_log = st.session_state.undo
+    action = "重做" if redo else "復原"
+    step = undo_log.peek_redo() if redo else undo_log.peek_undo()
+    if step is None:
+        st.toast(f"沒有可以{action}的動作")
+        return False
+    if step.conflicts(get_store().state, undo=not redo):
+        undo_log.discard(step)
+        st.warning(f"「{step.label}」之後其他裝置又改過相關的名單或場地，無法{action}。")
+        return False
+    if redo:
+        undo_log.pop_redo()
+    else:
+        undo_log.pop_undo()
+    night_started = st.session_state.sched.stats.started
+    with batch():
+        for op, path, value, extra in step.events(undo=not redo):
+            log_change(op, *path, value=value, undo=False, **extra)
+    st.session_state.sched.reload(get_store().load(st.session_state.cursor))
+    if st.session_state.sched.stats.started < night_started:
+        # 復原的是換日後的第一場：那一晚還沒開始，從資料庫拿掉 (重做時會再存回去)
         try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                st.session_state.players = data.get("players", {})
-                
-                # JSON key 雖然存成字串，讀回來要轉回 int key
-                raw_courts = data.get("courts", {})
-                st.session_state.courts = {int(k): v for k, v in raw_courts.items()}
-                
-                # Load status
-                raw_status = data.get("court_status", {})
-                st.session_state.court_status = {int(k): v for k, v in raw_status.items()}
-
-                st.session_state.court_status = {int(k): v for k, v in raw_status.items()}
-                st.session_state.history = data.get("history", [])
-                st.session_state.openai_usage = data.get("openai_usage", {})
-            return True
+            current_club().nights.discard(night_started)
         except Exception as e:
-            st.error(f"讀取存檔失敗: {e}")
+            st.warning(f"數據統計儲存失敗: {e}")
+    save_night()
+
+    # 會員名錄的累計場次與戰力跟著改回去
+    sign = 1 if redo else -1
+    for name in step.players():
+        p = st.session_state.sched.get(name)
+        if p is None:
+            continue
+        get_directory().ensure(name, p.level, p.rating, p.rated_games)   # 復原改名時，舊名字可能已不在名錄
+        get_name_index().add(name)
+        get_directory().stage(name, games=sign * step.games.get(name, 0),
+                              level=p.level, rating=p.rating, rated_games=p.rated_games)
+    stage_next_group()
+    st.toast(f"已{action}：{step.label}", icon="↪️" if redo else "↩️")
+    return True
+
+def log_player(name):
+    log_change("set", "players", name, value=st.session_state.sched.get(name).to_dict())
+
+def log_new_player(name):
+    """新球員連同 id 計數器一起寫 (id 只增不減，移除的人的 id 不會再用)"""
+    with batch():
+        log_player(name)
+        log_change("set", "next_id", value=st.session_state.sched.next_id)
+
+def log_court(court_id):
+    sched = st.session_state.sched
+    log_change("set", "courts", court_id, value=sched.court_names(court_id))
+    log_change("set", "court_status", court_id, value=sched.court_status.get(court_id, "EDITING"))
+    if court_id in sched.court_started:
+        log_change("set", "court_started", court_id, value=sched.court_started[court_id])
+    else:
+        log_change("del", "court_started", court_id)
+
+def log_staged():
+    """預告名單有變才寫 (整份只有幾組人)"""
+    sched = st.session_state.sched
+    staged = {str(c_id): sched.names(pids) for c_id, pids in sched.staged.items()}
+    if (get_store().state or {}).get("staged", {}) != staged:
+        log_change("set", "staged", value=staged)
+
+def log_durations(names, levels):
+    durations = st.session_state.sched.durations
+    for level in set(levels):
+        if level in durations.levels:
+            log_change("set", "durations", "levels", level, value=durations.levels[level])
+    for name in names:
+        if name in durations.players:
+            log_change("set", "durations", "players", name, value=durations.players[name])
+
+def log_stats():
+    """今晚統計改到的格子寫進日誌 (存檔還沒有統計時整份寫一次)"""
+    stats = st.session_state.sched.stats
+    changes = stats.take_changes()
+    if (get_store().state or {}).get("stats", {}).get("started") != stats.started:
+        # 存檔還沒有統計，或剛換到新的一晚
+        log_change("set", "stats", value=stats.to_dict())
+        return
+    for path, value in changes:
+        log_change("set", "stats", *path, value=value)
+
+def save_night():
+    """今晚的統計寫進每晚一列的資料庫 (數據分析頁查日期範圍用)，換日收起來的前幾晚也一起存"""
+    sched = st.session_state.sched
+    try:
+        nights = current_club().nights
+        while sched.closed_nights:
+            nights.save(sched.closed_nights.pop(0))
+        nights.save(sched.stats)
+    except Exception as e:
+        st.warning(f"數據統計儲存失敗: {e}")
+
+def stage_next_group():
+    """開啟「提前預告」時，替快打完的場地先挑好下一組，回傳是否有變動"""
+    sched = st.session_state.sched
+    changed = sched.prune_stages()
+    if st.session_state.get("prestage", True) and sched.stage_next():
+        changed = True
+    if changed:
+        log_staged()
+    return changed
+
+def get_directory():
+    """這個球團的會員名錄 (SQLite)，同球團的 session 共用"""
+    return current_club().directory
+
+def get_name_index():
+    """這個球團的會員名字 + 別名索引 (只載入名字，同球團的 session 共用)"""
+    return current_club().names
+
+def import_legacy_members(data):
+    """舊存檔的球員與別名還不在會員名錄裡的話補進去"""
+    directory = get_directory()
+    members = get_name_index()
+    legacy = data.get("members", {})
+    for name, p in data.get("players", {}).items():
+        if name not in members:
+            directory.ensure(name, p.get("level", "有點累組"), p.get("rating"), p.get("rated_games", 0),
+                             legacy.get(name, []))
+            members.add(name, legacy.get(name, []))
+
+def load_state():
+    """讀取快照並重播日誌"""
+    try:
+        data = get_store().load(st.session_state.cursor)
+        if data is None:
+            return False
+        st.session_state.sched = Scheduler.from_dict(data)
+        st.session_state.openai_usage = data.get("openai_usage", {})
+        import_legacy_members(data)
+        # 開場時順便把舊日誌壓縮掉
+        save_state()
+        return True
+    except Exception as e:
+        st.error(f"讀取存檔失敗: {e}")
     return False
 
 # --- 初始化 Session State ---
@@ -57,22 +286,32 @@ if 'initialized' not in st.session_state:
         st.toast("已恢復上次的狀態", icon="📂")
     st.session_state.initialized = True
 
-if 'players' not in st.session_state:
-    st.session_state.players = {} 
-if 'courts' not in st.session_state:
-    st.session_state.courts = {1: [], 2: []}
-if 'court_status' not in st.session_state:
-    st.session_state.court_status = {1: "EDITING", 2: "EDITING"}
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'sched' not in st.session_state:
+    st.session_state.sched = Scheduler()
 if 'enable_balancing' not in st.session_state:
     st.session_state.enable_balancing = True
 if 'ocr_results' not in st.session_state:
     st.session_state.ocr_results = [] 
-if 'ocr_results' not in st.session_state:
-    st.session_state.ocr_results = [] 
+if 'ocr_batch' not in st.session_state:
+    st.session_state.ocr_batch = None   # 背景辨識中的截圖
+    st.session_state.ocr_notes = []
 if 'openai_usage' not in st.session_state:
     st.session_state.openai_usage = {} # {"YYYY-MM-DD": count}
+if 'undo' not in st.session_state:
+    st.session_state.undo = UndoLog()   # 這台裝置的復原 / 重做紀錄
+
+st.session_state.reruns = st.session_state.get("reruns", 0) + 1   # 這個分頁整頁重跑的次數
+metrics.count("app.reruns")
+
+sched = st.session_state.sched
+
+# 第一次使用時先寫一份基礎快照，之後的日誌才有地方重播
+if not get_store().exists():
+    _initial = sched.to_dict()
+    _initial["openai_usage"] = st.session_state.openai_usage
+    get_store().snapshot(_initial, cursor=st.session_state.cursor)
+elif sync_state():
+    st.toast("已同步其他裝置的修改", icon="🔄")
 
 # --- OpenAI Vision 處理函數 ---
 
@@ -84,278 +323,237 @@ def check_daily_limit():
     return count < DAILY_LIMIT, count, today
 
 def increment_usage(today):
+    """額度是每個球團各自計算 (存在球團自己的存檔裡)"""
+    sync_state()   # 同球團其他裝置可能剛用掉額度
     st.session_state.openai_usage[today] = st.session_state.openai_usage.get(today, 0) + 1
-    # Cleanup old dates (keep only last 7 days to keep file small)
-    keys = sorted(st.session_state.openai_usage.keys())
-    if len(keys) > 7:
-        for k in keys[:-7]:
-            del st.session_state.openai_usage[k]
-    save_state()
-
-def process_image_with_openai(uploaded_file):
-    """使用 OpenAI GPT-4o 辨識圖片中的人員名單"""
-    if not api_key:
-        st.error("找不到 API Key！請在 Streamlit Community Cloud 的 Settings > Secrets 中設定 OPENAI_API_KEY。")
-        return []
-
-    # Check Limit
-    allowed, count, today = check_daily_limit()
-    if not allowed:
-        st.error(f"⚠️ 今日 OpenAI 使用額度已達上限 ({DAILY_LIMIT}次)。請明天再試。")
-        return []
+    with batch():
+        log_change("set", "openai_usage", today, value=st.session_state.openai_usage[today])
+        # Cleanup old dates (keep only last 7 days to keep file small)
+        keys = sorted(st.session_state.openai_usage.keys())
+        if len(keys) > 7:
+            for k in keys[:-7]:
+                del st.session_state.openai_usage[k]
+                log_change("del", "openai_usage", k)
 
-    try:
-        # 將圖片轉為 Base64 (API Call)
-        base64_image = base64.b64encode(uploaded_file.getvalue()).decode('utf-8')
-        
-        client = OpenAI(api_key=api_key)
-
-        response = client.chat.completions.create(
-            model="gpt-4o", # 使用具備視覺能力的模型
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一個協助整理名單的助手。"
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "請辨識這張 Line 投票截圖中的人員名單。請忽略時間、電量、'打'、'不打'等標題文字。只回傳名字列表，一行一個名字。不要包含編號或任何 Markdown 符號。"},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
-        
-        # Increment usage only on success
-        increment_usage(today)
-        
-        content = response.choices[0].message.content
-        # 處理回傳的文字 (分割換行)
-        names = [line.strip() for line in content.split('\n') if line.strip()]
-        return names
+@st.cache_resource
+def get_openai_client():
+    """整個程式共用一個 client (連線池可以重複使用)
 
-    except Exception as e:
-        st.error(f"OpenAI API 呼叫失敗: {e}")
-        return []
+    openai 套件光 import 就要將近一秒，真的要呼叫時才載入。
+    """
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+@st.cache_resource
+def get_result_cache():
+    return imagecache.ResultCache()
+
+def start_import(uploaded_files):
+    """把所有截圖丟到背景辨識，畫面不會卡住"""
+    allowed, count, _ = check_daily_limit()
+    client = get_openai_client() if api_key else None
+    files = [(f.name, f.getvalue()) for f in uploaded_files]
+    st.session_state.ocr_batch = roster_import.ImportBatch(
+        files, get_result_cache(), client, max(0, DAILY_LIMIT - count))
+    st.session_state.ocr_results = []
+    st.session_state.ocr_notes = []
+
+def collect_import_results():
+    """收下背景完成的截圖：合併名單、記錄 OpenAI 用量，回傳是否全部完成"""
+    batch = st.session_state.ocr_batch
+    for fname, result in batch.poll():
+        if result["openai_calls"]:
+            increment_usage(check_daily_limit()[2])
+        note = f"{fname}: {len(result['names'])} 人"
+        if result["source"]:
+            note += f" ({result['source']})"
+        for err in result["errors"]:
+            note += f" ⚠️ {err}"
+        st.session_state.ocr_notes.append(note)
+    st.session_state.ocr_results = list(batch.names)
+    return batch.done
 
 # --- 核心邏輯函數 ---
+# 排程邏輯都在 scheduler.py，這裡只負責存檔與提示訊息
 
 def add_player(name, level="有點累組"):
+    """加入今晚名單；老會員沿用名錄裡的分組與戰力"""
+    sync_state()
     name = name.strip()
-    if len(name) < 1: return False
-    if name and name not in st.session_state.players:
-        st.session_state.players[name] = {
-            'games': 0, 
-            'active': True,
-            'level': level
-        }
-        save_state()
-        return True
-    return False
+    if not name or sched.get(name) is not None:
+        return False
+    # 名錄/名字索引每次現查：球會被擠出快取後，上一輪拿到的物件已經釋放
+    m = get_directory().check_in(name, level)
+    get_name_index().add(name)
+    p = sched.add_player(name, m.level, rating=m.rating, rated_games=m.rated_games)
+    if p is None:
+        return False
+    log_new_player(p.name)
+    return True
+
+def learn_alias(alias, name):
+    """記住截圖上的暱稱是哪位會員，下次直接對上"""
+    members = get_name_index()
+    if members.add_alias(alias, name):
+        get_directory().set_aliases(name, members.members[name])
 
 def remove_player(name):
-    if name in st.session_state.players:
-        for c_id, p_list in st.session_state.courts.items():
-            if name in p_list:
-                st.session_state.courts[c_id] = []
-        del st.session_state.players[name]
-        save_state()
+    sync_state()
+    with undoable(f"移除 {name}"):
+        cleared, dropped = sched.remove_player(name)
+        for c_id in cleared:
+            log_change("set", "courts", c_id, value=[])
+        for key in dropped:
+            log_change("del", "pairs", key)
+        log_change("del", "players", name)
+        stage_next_group()
 
 def edit_player(old_name, new_name, new_level, new_games):
     """編輯玩家資料"""
-    # 1. 如果名字沒變，只更新屬性
-    if old_name == new_name:
-        if old_name in st.session_state.players:
-            st.session_state.players[old_name]['level'] = new_level
-            st.session_state.players[old_name]['games'] = new_games
-            save_state()
-            return True
-    else:
-        # 2. 如果名字變了 (相當於改名)
-        # 檢查新名字是否衝突
-        if new_name in st.session_state.players:
-            st.error(f"名字 {new_name} 已存在！")
-            return False
-            
-        if old_name in st.session_state.players:
-            # 複製舊資料但更新屬性
-            data = st.session_state.players[old_name]
-            data['level'] = new_level
-            data['games'] = new_games
-            
-            # 建立新 key
-            st.session_state.players[new_name] = data
-            
-            # 刪除舊 key
-            del st.session_state.players[old_name]
-            
+    sync_state()
+    if new_name != old_name and sched.get(new_name) is not None:
+        st.error(f"名字 {new_name} 已存在！")
+        return False
+    if not sched.edit_player(old_name, new_name, new_level, new_games):
+        return False
+    with undoable(f"編輯 {old_name}"):
+        log_player(new_name)
+        if new_name != old_name:
+            log_change("del", "players", old_name)
+            log_change("set", "stats", value=sched.stats.to_dict())   # 統計裡的名字一起改
+            members = get_name_index()
+            members.rename(old_name, new_name)
+            get_directory().rename(old_name, new_name, members.members[new_name])
             # 更新場地上的名字 (如果他在場上)
-            for c_id, p_list in st.session_state.courts.items():
-                if old_name in p_list:
-                    # 找到並替換
-                    idx = p_list.index(old_name)
-                    p_list[idx] = new_name
-            
-            save_state()
-            return True
-    return False
+            pid = sched.ids[new_name]
+            for c_id, p_list in sched.courts.items():
+                if pid in p_list:
+                    log_change("set", "courts", c_id, value=sched.court_names(c_id))
+    p = sched.get(new_name)
+    get_directory().stage(new_name, level=p.level, rating=p.rating)
+    if new_name != old_name:
+        save_night()
+    return True
 
 def toggle_active(name):
-    if name in st.session_state.players:
-        st.session_state.players[name]['active'] = not st.session_state.players[name]['active']
-        save_state()
-
-def balance_teams(players):
-    if not st.session_state.get('enable_balancing', True):
-        p = list(players)
-        random.shuffle(p)
-        return p
-
-    weights = {"死亡之組": 3, "有點累組": 2, "休閒組": 1}
-    
-    def get_score(p_name):
-        lv = st.session_state.players[p_name].get('level', '有點累組')
-        return weights.get(lv, 2)
-
-    p0 = players[0]
-    others = players[1:]
-    
-    best_diff = float('inf')
-    best_combo = players 
-    
-    for i in range(3):
-        partner = others[i]
-        opponents = [x for x in others if x != partner]
-        
-        team1 = [p0, partner]
-        team2 = opponents
-        
-        score1 = get_score(team1[0]) + get_score(team1[1])
-        score2 = get_score(team2[0]) + get_score(team2[1])
-        
-        diff = abs(score1 - score2)
-        
-        if diff < best_diff:
-            best_diff = diff
-            random.shuffle(team1)
-            random.shuffle(team2)
-            if random.random() > 0.5:
-                best_combo = team1 + team2
-            else:
-                best_combo = team2 + team1
-        elif diff == best_diff:
-            if random.random() > 0.5:
-                random.shuffle(team1)
-                random.shuffle(team2)
-                if random.random() > 0.5:
-                    best_combo = team1 + team2
-                else:
-                    best_combo = team2 + team1
+    sync_state()
+    active = sched.toggle_active(name)
+    if active is not None:
+        with undoable(f"{name} {'回來' if active else '暫離'}"):
+            log_player(name)   # 連同可上場時間一起寫
+            stage_next_group()
 
-    return best_combo
+def archive_old_matches():
+    """把超出保留數量的舊比賽搬進 Parquet 封存檔，存檔只留最近幾場"""
+    old = sched.history.take_overflow()
+    if not old:
+        return
+    try:
+        matchlog.write_archive(old, archive_dir=current_club().archive_dir)
+    except Exception as e:
+        # 封存失敗就放回去，下次再試，避免紀錄遺失
+        sched.history.put_back(old)
+        st.warning(f"比賽紀錄封存失敗: {e}")
+        return
+    # 已經寫進封存檔的不能復原，不然之後會再封存一次
+    log_change("set", "history", value=sched.history.to_list(), undo=False)
 
-def get_next_players(exclude_players, count=4):
-    candidates = [
-        p for p, data in st.session_state.players.items() 
-        if data['active'] and p not in exclude_players
-    ]
-    
-    def is_compatible(group_names):
-        if not st.session_state.get('enable_balancing', True):
-            return True
-        levels = {st.session_state.players[n].get('level', '有點累組') for n in group_names}
-        if "死亡之組" in levels and "休閒組" in levels:
-            return False
-        return True
+def finish_and_next(court_id, winner=None, shown=None):
+    """結算場地並排下一組；shown 是按鈕當下畫面上的名單"""
+    sync_state()
+    if shown is not None and sched.court_names(court_id) != shown:
+        st.toast(f"場地 {court_id} 已被其他裝置更新，請確認後再操作。", icon="⚠️")
+        return
+    finished_ids = list(sched.courts.get(court_id, []))
+    finished = sched.court_names(court_id)
+    record, next_group = sched.finish_and_next(court_id, winner=winner)
+    with undoable(f"場地 {court_id} 結束") as games:
+        if record:
+            log_change("insert", "history", value=record.to_dict(), index=0)
+            log_durations(finished, [sched.level_of(pid) for pid in finished_ids])
+            log_stats()
+            archive_old_matches()
+            for name in finished:
+                log_player(name)
+                p = sched.get(name)
+                get_directory().stage(name, games=1, rating=p.rating, rated_games=p.rated_games)
+                games[name] = 1
+            if len(finished_ids) == 4:
+                for key, counts in sched.pair_updates(finished_ids).items():
+                    log_change("set", "pairs", key, value=counts)
+        log_court(court_id)
+        log_staged()
+        stage_next_group()
+    if record:
+        save_night()
 
-    ranked = sorted(candidates, key=lambda x: (st.session_state.players[x]['games'], random.random()))
-    
-    if len(ranked) < count:
-        return None
+    if next_group:
+        st.toast(f"場地 {court_id} 更新完畢！", icon="✅")
+    else:
+        st.toast("休息區人數不足 4 人，無法自動排下一場，請等待其他場地結束。", icon="⚠️")
 
-    for i in range(len(ranked)):
-        seed = ranked[i]
-        valid_group = [seed]
-        
-        for other in ranked:
-            if other == seed: continue
-            
-            temp_group = valid_group + [other]
-            if is_compatible(temp_group):
-                valid_group.append(other)
-            
-            if len(valid_group) == count:
-                return balance_teams(valid_group)
-    
-    return None
+def start_court(court_id, shown=None):
+    """空場按「開始安排」：直接採用畫面上預覽的那組
 
-def finish_and_next(court_id):
-    current_players = st.session_state.courts[court_id]
-    if current_players:
-        record = f"場地 {court_id}: {current_players[0]}+{current_players[1]} vs {current_players[2]}+{current_players[3]}"
-        st.session_state.history.insert(0, record)
-        
-        for p in current_players:
-            if p in st.session_state.players:
-                st.session_state.players[p]['games'] += 1
-    
-    st.session_state.courts[court_id] = []
-    
-    busy_players = []
-    for c_id, p_list in st.session_state.courts.items():
-        if c_id != court_id and p_list:
-            busy_players.extend(p_list)
-            
-    next_group = get_next_players(exclude_players=busy_players, count=4)
-    
-    if next_group:
-        st.session_state.courts[court_id] = next_group
-        st.session_state.court_status[court_id] = "EDITING"
+    shown 是按鈕當下畫面上的預覽；如果其他場地的操作讓預覽變了，就不排，
+    讓使用者先看到新的預覽。
+    """
+    sync_state()
+    if shown is not None and sched.preview().get(court_id) != shown:
+        st.toast("預計名單已更新，請確認後再按一次。", icon="⚠️")
+        return
+    if sched.start_court(court_id):
+        with undoable(f"安排場地 {court_id}"):
+            log_court(court_id)
+            log_staged()
         st.toast(f"場地 {court_id} 更新完畢！", icon="✅")
-        save_state()
     else:
-        st.warning("休息區人數不足 4 人，無法自動排下一場，請等待其他場地結束。")
+        st.toast("休息區人數不足 4 人，無法安排。", icon="⚠️")
+
+def fill_free_courts():
+    """多個空場時一次排滿 (整體最佳化，而不是一場一場搶人)"""
+    sync_state()
+    filled = sched.fill_courts()
+    with undoable(f"一次排滿 {len(filled)} 面場"):
+        for c_id in filled:
+            log_court(c_id)
+        log_staged()
+    if filled:
+        st.toast(f"已安排 {len(filled)} 面場地！", icon="✅")
+    else:
+        st.warning("休息區人數不足 4 人，無法安排。")
 
 def reset_court(court_id):
-    st.session_state.courts[court_id] = []
-    st.session_state.court_status[court_id] = "EDITING"
-    save_state()
+    sync_state()
+    sched.reset_court(court_id)
+    with undoable(f"清除場地 {court_id}"):
+        log_court(court_id)
+        log_staged()
 
 def remove_player_from_court(court_id, player_name):
-    if player_name in st.session_state.courts[court_id]:
-        st.session_state.courts[court_id].remove(player_name)
-        save_state()
+    sync_state()
+    if sched.remove_from_court(court_id, player_name):
+        with undoable(f"{player_name} 離開場地 {court_id}"):
+            log_change("set", "courts", court_id, value=sched.court_names(court_id))
 
 def start_game(court_id):
-    players = st.session_state.courts[court_id]
-    if len(players) == 4:
-        balanced = balance_teams(players)
-        st.session_state.courts[court_id] = balanced
-        st.session_state.court_status[court_id] = "PLAYING"
-        save_state()
+    sync_state()
+    if sched.start_game(court_id):
+        with undoable(f"場地 {court_id} 開始對戰"):
+            log_court(court_id)
+            stage_next_group()
         st.toast(f"場地 {court_id} 比賽開始！(已平衡戰力)")
     else:
-        st.warning("人數不足 4 人，無法開始")
+        st.toast("人數不足 4 人，無法開始", icon="⚠️")
 
 def manual_add_player(name):
-    target_court = None
-    active_courts = sorted(st.session_state.courts.keys())
-    for cid in active_courts: 
-        if len(st.session_state.courts[cid]) < 4:
-            target_court = cid
-            break
-            
+    sync_state()
+    target_court = sched.manual_add(name)
     if target_court:
-        st.session_state.courts[target_court].append(name)
+        with undoable(f"{name} 加入場地 {target_court}"):
+            log_change("set", "courts", target_court, value=sched.court_names(target_court))
+            log_staged()
         st.toast(f"已將 {name} 加入場地 {target_court}")
-        save_state()
         return True
     else:
         st.warning("所有場地已滿！")
@@ -363,10 +561,49 @@ def manual_add_player(name):
 
 # --- UI 介面 ---
 
+MAX_COURTS = 20
+COURTS_PER_ROW = 4
+PAGE_SIZE = 20
+HEATMAP_PLAYERS = 30   # 熱度圖最多顯示幾人 (場數最多的)
+
+def rerun_if_stale():
+    """局部重整時，本機狀態在上次整頁畫完後變了 (例如按了別的場地、勾選暫離)，就改成整頁重畫
+
+    一個場地的操作可能改變誰有空：其他場地的預覽、休息區與對戰紀錄都要跟著更新，
+    不然下一次按別的場地會拿到過期的預覽。只換順序 (開打分隊) 不會改版本，就只重畫那一格。
+    """
+    if _page_done and st.session_state.get("page_version") != sched.version:
+        st.rerun(scope="app")
+
+def fmt_p(name):
+    if name == "waiting...": return name
+    p_data = sched.get(name)
+    if not p_data: return name
+    icon = LEVEL_ICONS.get(p_data.level, "")
+    return f"{name} {icon}"
+
+def paginate(items, key):
+    """人數多時分頁顯示，每次只畫一頁，畫面成本不隨人數增加"""
+    pages = max(1, (len(items) + PAGE_SIZE - 1) // PAGE_SIZE)
+    if pages == 1:
+        return items
+    page = st.number_input(f"頁數 (共 {pages} 頁)", min_value=1, max_value=pages, value=1, key=key)
+    start = (page - 1) * PAGE_SIZE
+    return items[start:start + PAGE_SIZE]
+
 st.title("🏸 分組真的好難所以我做了一個自動輪替看板")
 
+@st.cache_resource
+def get_readme():
+    """說明頁的 README (整個程式只讀一次)"""
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "README.md"), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
 # --- 頁面導航 ---
-page = st.sidebar.radio("📍 選單", ["🏸 排程看板", "📘 使用說明 & 演算法"], index=0)
+page = st.sidebar.radio("📍 選單", ["🏸 排程看板", "🗓️ 整晚排程", "📊 數據分析", "📘 使用說明 & 演算法"], index=0)
 
 if page == "📘 使用說明 & 演算法":
     st.header("📘 系統使用說明")
@@ -380,17 +617,185 @@ if page == "📘 使用說明 & 演算法":
     OPENAI_API_KEY = "sk-proj-xxxxxxxxxxxxxx"
     ```
     """)
-    try:
-        with open("README.md", "r", encoding="utf-8") as f:
-            readme_content = f.read()
+    readme_content = get_readme()
+    if readme_content:
         st.markdown(readme_content)
-    except FileNotFoundError:
-        pass
     st.stop() 
 
+if page == "🗓️ 整晚排程":
+    import planner   # 只有這一頁用得到
+    st.header("🗓️ 整晚固定輪次排程")
+    st.caption("聯賽夜或固定時段租場用：用目前可上場的名單一次排好每一輪，可以下載 CSV 或列印。"
+               "場次平均優先，再來是戰力平衡與避免重複搭檔；死亡之組和休閒組不會同場。")
+    roster = [p for p in sched.players.values() if p.active]
+    pc1, pc2 = st.columns(2)
+    plan_courts = pc1.number_input("場地數", min_value=1, max_value=MAX_COURTS, value=max(1, len(sched.courts)))
+    plan_rounds = pc2.number_input("輪數", min_value=1, max_value=60, value=20)
+    st.write(f"可上場 {len(roster)} 人")
+    if st.button("🧮 產生排程", type="primary", disabled=len(roster) < 4):
+        with st.spinner("排程中..."):
+            st.session_state.evening_plan = planner.plan_evening(
+                [(p.name, p.level, p.rating) for p in roster], int(plan_courts), int(plan_rounds),
+                enable_balancing=st.session_state.get('enable_balancing', True))
+
+    plan = st.session_state.get("evening_plan")
+    if plan:
+        s = plan.stats
+        st.success(f"每人 {s['games_min']}～{s['games_max']} 場，重複搭檔 {s['repeat_partners']} 次，"
+                   f"兩隊平均戰力最多差 {s['max_team_diff']:.0f} 分")
+        if s["incompatible"]:
+            st.warning(f"有 {s['incompatible']} 場死亡之組和休閒組同場 (人數分布無法完全避開)")
+        st.dataframe(plan.rows(), hide_index=True, use_container_width=True)
+        d1, d2 = st.columns(2)
+        d1.download_button("⬇️ 下載 CSV", plan.to_csv().encode("utf-8-sig"),
+                           file_name="evening_plan.csv", mime="text/csv")
+        d2.download_button("🖨️ 下載列印版 (HTML)", plan.to_html().encode("utf-8"),
+                           file_name="evening_plan.html", mime="text/html")
+    st.stop()
+
+if page == "📊 數據分析":
+    import altair as alt   # 只有這一頁用得到
+    st.header("📊 數據分析")
+    st.caption("每打完一場就更新統計，今晚直接用記憶體裡的；日期範圍是把每晚存好的統計加總，不會重掃比賽紀錄。")
+    span = st.radio("範圍", ["今晚", "最近 7 天", "最近 4 週", "自訂日期"], horizontal=True)
+    if span == "今晚":
+        nights = [sched.stats]
+    else:
+        today = datetime.now().date()
+        if span == "自訂日期":
+            dates = st.date_input("日期範圍", value=(), key="stats_dates")
+            if not dates:
+                st.info("請選擇日期範圍")
+                st.stop()
+            first, last = dates[0], dates[-1]
+        else:
+            first, last = today - timedelta(days=6 if span == "最近 7 天" else 27), today
+        nights = current_club().nights.load(first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d"))
+    stats = nights[0] if len(nights) == 1 else analytics.merge(nights)
+    if not stats.players:
+        st.info("這段期間還沒有打完的比賽")
+        st.stop()
+
+    total_games = sum(n for combos in stats.mix.values() for n in combos.values())
+    st.write(f"{len(nights)} 個晚上，共 {total_games} 場、{len(stats.players)} 人")
+
+    st.subheader("🏃 每人場數與在場時間")
+    player_rows = analytics.player_rows(stats)
+    st.dataframe(player_rows, hide_index=True, use_container_width=True)
+
+    st.subheader("🤝 搭檔 / 對手次數")
+    kind = st.radio("顯示", ["搭檔", "對手"], horizontal=True, key="pair_kind")
+    top = [r["球員"] for r in player_rows[:HEATMAP_PLAYERS]]
+    if len(player_rows) > HEATMAP_PLAYERS:
+        st.caption(f"只顯示場數最多的 {HEATMAP_PLAYERS} 人")
+    cells = analytics.pair_cells(stats, top, 0 if kind == "搭檔" else 1)
+    st.altair_chart(alt.Chart(alt.Data(values=[{"球員": a, "對象": b, "次數": n} for a, b, n in cells]))
+                    .mark_rect()
+                    .encode(x=alt.X("球員:N", sort=top, title=None), y=alt.Y("對象:N", sort=top, title=None),
+                            color=alt.Color("次數:Q", scale=alt.Scale(scheme="orangered")),
+                            tooltip=["球員:N", "對象:N", "次數:Q"]),
+                    use_container_width=True)
+
+    st.subheader("⚖️ 各場地的分組組合")
+    st.altair_chart(alt.Chart(alt.Data(values=analytics.mix_rows(stats)))
+                    .mark_bar()
+                    .encode(x=alt.X("場地:O"), y=alt.Y("場數:Q", stack="zero"), color=alt.Color("組合:N"),
+                            tooltip=["場地:O", "組合:N", "場數:Q"]),
+                    use_container_width=True)
+
+    st.subheader("⏱️ 場地使用率 (15 分鐘一格)")
+    usage = [{"時段": label, "使用率": round(pct * 100, 1)} for label, pct in analytics.utilization(nights)]
+    st.altair_chart(alt.Chart(alt.Data(values=usage))
+                    .mark_line(point=True)
+                    .encode(x=alt.X("時段:O", sort=None),
+                            y=alt.Y("使用率:Q", title="使用率 (%)", scale=alt.Scale(domain=[0, 100])),
+                            tooltip=["時段:O", "使用率:Q"]),
+                    use_container_width=True)
+    st.stop()
+
+@st.fragment
+def roster_panel():
+    """人員名單 (獨立重整：勾選/編輯只重畫這一區)"""
+    rerun_if_stale()
+    st.write("勾選 = 可上場 / 取消 = 暫離")
+    
+    keyword = st.text_input("搜尋球員", placeholder="輸入名字篩選...", key="roster_search")
+    sorted_players = sorted(sched.players.values(), key=lambda p: -p.games)
+    if keyword:
+        sorted_players = [p for p in sorted_players if keyword in p.name]
+    
+    for data in paginate(sorted_players, "roster_page"):
+        name = data.name
+        c1, c2, c3 = st.columns([5, 1, 1])
+        with c1:
+            lv_icon = LEVEL_ICONS.get(data.level, "😓")
+            
+            # 使用 popover 製作編輯選單
+            with st.popover(f"**{name}** {lv_icon} ({data.games}場)"):
+                st.markdown(f"#### 編輯 {name}")
+                st.caption(f"戰力分數 {data.rating:.0f} (計分 {data.rated_games} 場)")
+                new_n = st.text_input("姓名", value=name, key=f"edit_name_{name}")
+                new_l = st.selectbox("分組", LEVELS, 
+                                     index=LEVELS.index(data.level) if data.level in LEVELS else 1,
+                                     key=f"edit_lv_{name}")
+                new_g = st.number_input("場次數修正", min_value=0, value=data.games, key=f"edit_gm_{name}")
+                
+                if st.button("儲存修改", key=f"save_{name}"):
+                    if edit_player(name, new_n, new_l, new_g):
+                        st.toast(f"已更新 {new_n}")
+                        # 改名會影響場地上的名字，整頁重畫
+                        st.rerun()
+
+        with c2:
+            st.checkbox("", value=data.active, key=f"act_{name}", on_change=toggle_active, args=(name,))
+        with c3:
+            if st.button("x", key=f"del_{name}"):
+                remove_player(name)
+                # 可能清空了場地，整頁重畫
+                st.rerun()
+
+def metrics_panel():
+    """效能面板 (網址加 ?debug=<DEBUG_KEY> 才會出現，給主辦人看哪裡慢)"""
+    st.divider()
+    st.subheader("🛠️ 效能監測")
+    on = st.toggle("記錄計時", value=metrics.enabled(),
+                   help="整個程式一起開關；關閉時幾乎沒有額外負擔。開啟時會定期寫出 " + METRICS_FILE)
+    if on != metrics.enabled():
+        metrics.enable(on)
+    st.caption(f"這個分頁已整頁重跑 {st.session_state.reruns} 次")
+    stats = metrics.summary()
+    if stats["series"]:
+        st.caption("時間單位為毫秒 (ms)；p50/p95/max 是最近幾百筆的")
+        st.dataframe([dict(指標=name, **values) for name, values in stats["series"].items()],
+                     hide_index=True, use_container_width=True)
+    for name, value in stats["counters"].items():
+        st.caption(f"{name}: {value}")
+    m1, m2 = st.columns(2)
+    m1.download_button("⬇️ Prometheus", metrics.to_prometheus().encode("utf-8"),
+                       file_name="metrics.prom", mime="text/plain")
+    m2.download_button("⬇️ JSON", metrics.to_json().encode("utf-8"),
+                       file_name="metrics.json", mime="application/json")
+    if st.button("清除統計", key="metrics_reset"):
+        metrics.reset()
+        st.rerun()
+
 # 側邊欄：設定
-with st.sidebar:
+@st.fragment(run_every=1)   # 用秒數 (數字)：寫成 "1s" 的話 Streamlit 會為了解析載入 pandas
+def import_progress_panel():
+    """背景辨識進度 (只有辨識中才顯示；每秒更新這一塊，場地照常可以操作)"""
+    batch = st.session_state.ocr_batch
+    if collect_import_results():
+        st.session_state.ocr_batch = None
+        st.rerun()
+    st.progress(batch.finished / batch.total,
+                text=f"辨識中 {batch.finished}/{batch.total} 張，目前找到 {len(batch.names)} 人")
+    for note in st.session_state.ocr_notes:
+        st.caption(note)
+
+with st.sidebar, metrics.timer("render.sidebar_ms"):
     st.header("⚙️ 設定 & 人員管理")
+    if st.session_state.club != DEFAULT_CLUB:
+        st.caption(f"🏷️ 球團: **{st.session_state.club}** (名單、紀錄與 OpenAI 額度都是這個球團自己的)")
     
     # 檢查 API Key 狀態
     if api_key:
@@ -398,48 +803,62 @@ with st.sidebar:
     else:
         st.error("未偵測到 API Key")
 
-    current_court_num = len(st.session_state.courts)
-    selected_court_num = st.radio("場地數量", [1, 2], index=1 if current_court_num >= 2 else 0, horizontal=True)
+    current_court_num = len(sched.courts)
+    selected_court_num = st.number_input("場地數量", min_value=1, max_value=MAX_COURTS, value=max(1, current_court_num), step=1)
     
     st.session_state.enable_balancing = st.toggle("啟用戰力平衡 (分組優化)", value=st.session_state.get('enable_balancing', True))
+    sched.enable_balancing = st.session_state.enable_balancing
+    st.session_state.prestage = st.toggle("提前預告下一組", value=st.session_state.get('prestage', True),
+                                          help="快打完的場地，結束前幾分鐘先叫下一組到場邊準備，換場不用等")
     
     if selected_court_num != current_court_num:
-        if selected_court_num > current_court_num:
-            for i in range(current_court_num + 1, selected_court_num + 1):
-                st.session_state.courts[i] = []
-                st.session_state.court_status[i] = "EDITING"
-        else:
-            for i in range(current_court_num, selected_court_num, -1):
-                if i in st.session_state.courts:
-                    del st.session_state.courts[i]
-                    if i in st.session_state.court_status:
-                        del st.session_state.court_status[i]
-        save_state()
+        added, removed = sched.set_court_count(selected_court_num)
+        with batch():
+            for i in added:
+                log_court(i)
+            for i in removed:
+                log_change("del", "courts", i)
+                log_change("del", "court_status", i)
+            log_staged()
         st.rerun()
     
     st.divider()
     
     st.subheader("人員新增")
     new_name = st.text_input("名字", placeholder="輸入名字...")
-    new_level = st.selectbox("分組", ["死亡之組", "有點累組", "休閒組"], index=1)
+    new_level = st.selectbox("分組", LEVELS, index=1)
     if st.button("新增"):
         if add_player(new_name, new_level): 
-            st.toast(f"已新增 {new_name} ({new_level})")
+            st.toast(f"已新增 {new_name} ({sched.get(new_name.strip()).level})")
+
+    # 老會員直接從名錄加入，分組與戰力沿用上次的
+    regulars = get_directory().recent(exclude=sched.ids)
+    if regulars:
+        regular_levels = {m.name: m.level for m in regulars}
+        picked = st.multiselect("從會員名錄加入", list(regular_levels),
+                                format_func=lambda n: f"{LEVEL_ICONS.get(regular_levels[n], '')} {n}",
+                                placeholder="選擇今晚到場的會員...")
+        if picked and st.button(f"加入 {len(picked)} 位會員"):
+            for name in picked:
+                add_player(name)
+            st.rerun()
 
     st.divider()
     
     # 快速建立測試資料
-    if not st.session_state.players:
+    if not sched.players:
         if st.button("加入寶可夢測試員"):
             pokemon_roster = [
                 ("超夢", "死亡之組"), ("快龍", "死亡之組"), ("烈空座", "死亡之組"), ("班基拉斯", "死亡之組"),
                 ("噴火龍", "有點累組"), ("路卡利歐", "有點累組"), ("耿鬼", "有點累組"), ("怪力", "有點累組"), ("皮卡丘", "有點累組"),
                 ("鯉魚王", "休閒組"), ("可達鴨", "休閒組"), ("呆呆獸", "休閒組"), ("胖丁", "休閒組"), ("百變怪", "休閒組")
             ]
-            import random
             selected = random.sample(pokemon_roster, 12)
-            for name, level in selected: 
-                add_player(name, level)
+            with batch():
+                for name, level in selected:
+                    # 測試資料不寫進會員名錄
+                    if sched.add_player(name, level):
+                        log_new_player(name)
             st.rerun()
 
     st.divider()
@@ -448,187 +867,233 @@ with st.sidebar:
     st.subheader("📸 匯入 Line 投票截圖")
     # Show Quota
     _allowed, _count, _ = check_daily_limit()
-    st.caption(f"使用 OpenAI AI 視覺辨識 (今日額度: {_count}/{DAILY_LIMIT})")
+    st.caption(f"先用本機 OCR 辨識，信心度不夠時才用 OpenAI (今日額度: {_count}/{DAILY_LIMIT})")
     
-    uploaded_file = st.file_uploader("上傳截圖", type=["jpg", "png", "jpeg"])
+    uploaded_files = st.file_uploader("上傳截圖 (可多選)", type=["jpg", "png", "jpeg"],
+                                      accept_multiple_files=True)
     
-    if uploaded_file is not None:
-        if st.button("🤖 AI 開始辨識"):
-            with st.spinner("AI 正在看圖說故事..."):
-                names = process_image_with_openai(uploaded_file)
-            
-            if names:
-                st.session_state.ocr_results = names
-                st.success(f"辨識成功！找到 {len(names)} 個名字")
-            else:
-                st.warning("未能辨識出名單，請確認圖片清晰度或 Key 是否正確。")
+    if uploaded_files:
+        if st.button("🤖 開始辨識", disabled=st.session_state.ocr_batch is not None):
+            start_import(uploaded_files)
 
-    # 顯示辨識結果供確認
-    if st.session_state.ocr_results:
+    if st.session_state.ocr_batch is not None:
+        import_progress_panel()
+    elif st.session_state.ocr_notes:
+        if st.session_state.ocr_results:
+            st.success(f"辨識完成！共找到 {len(st.session_state.ocr_results)} 個名字")
+        else:
+            st.warning("未能辨識出名單，請確認圖片清晰度或 Key 是否正確。")
+        for note in st.session_state.ocr_notes:
+            st.caption(note)
+        if not st.session_state.ocr_results:
+            st.session_state.ocr_notes = []   # 沒有結果可以確認，訊息只顯示這一次
+
+    # 顯示辨識結果供確認 (全部截圖辨識完才顯示)
+    if st.session_state.ocr_results and st.session_state.ocr_batch is None:
         st.caption("請勾選要加入的人員：")
         
         with st.form("ocr_confirm_form"):
-            selected_ocr_names = []
-            cols = st.columns(2)
-            for i, name in enumerate(st.session_state.ocr_results):
-                is_exist = name in st.session_state.players
-                label = f"{name} (已存在)" if is_exist else name
-                checked = st.checkbox(label, value=(not is_exist), key=f"ocr_{i}", disabled=is_exist)
-                if checked and not is_exist:
-                    selected_ocr_names.append(name)
+            selected_ocr_names = []   # [(截圖上的名字, 要用的名字)]
+            for i, raw in enumerate(st.session_state.ocr_results):
+                # 暱稱有 emoji、全形字或辨識錯字時，對到最像的已知會員，避免重複建人
+                hit = get_name_index().suggest(raw)
+                target = hit[0] if hit else raw
+                if hit and hit[1] < 1.0:
+                    target = st.selectbox(f"「{raw}」是不是…", [hit[0], raw], key=f"ocr_pick_{i}",
+                                          format_func=lambda n, raw=raw, s=hit[1]:
+                                              f"{n} (相似度 {s:.0%})" if n != raw else f"{raw} (新球員)")
+                is_exist = sched.get(target) is not None
+                if is_exist and target == raw:
+                    st.checkbox(f"{raw} (已存在)", value=False, key=f"ocr_{i}", disabled=True)
+                    continue
+                label = raw if target == raw else f"{raw} → {target}"
+                if is_exist:
+                    label += " (已存在，勾選可記住這個暱稱)"
+                if st.checkbox(label, value=(not is_exist), key=f"ocr_{i}"):
+                    selected_ocr_names.append((raw, target))
             
-            ocr_level = st.selectbox("批次設定分組", ["死亡之組", "有點累組", "休閒組"], index=1)
+            ocr_level = st.selectbox("批次設定分組", LEVELS, index=1)
             
             if st.form_submit_button("確認加入選取人員"):
                 count = 0
-                for n in selected_ocr_names:
-                    if add_player(n, ocr_level):
+                for raw, target in selected_ocr_names:
+                    if target != raw:
+                        learn_alias(raw, target)
+                    if sched.get(target) is None and add_player(target, ocr_level):
                         count += 1
                 st.toast(f"成功加入 {count} 人！")
                 st.session_state.ocr_results = [] 
+                st.session_state.ocr_notes = []
                 st.rerun()
         
         if st.button("放棄/清除結果"):
              st.session_state.ocr_results = []
+             st.session_state.ocr_notes = []
              st.rerun()
 
     st.divider()
 
-    st.write("勾選 = 可上場 / 取消 = 暫離")
-    
-    sorted_players = sorted(st.session_state.players.items(), key=lambda x: -x[1]['games'])
-    
-    for name, data in sorted_players:
-        c1, c2, c3 = st.columns([5, 1, 1])
-        with c1:
-            lv_icon = {"死亡之組": "💀", "有點累組": "😓", "休閒組": "☕"}.get(data.get('level'), "😓")
-            
-            # 使用 popover 製作編輯選單
-            with st.popover(f"**{name}** {lv_icon} ({data['games']}場)"):
-                st.markdown(f"#### 編輯 {name}")
-                new_n = st.text_input("姓名", value=name, key=f"edit_name_{name}")
-                new_l = st.selectbox("分組", ["死亡之組", "有點累組", "休閒組"], 
-                                     index=["死亡之組", "有點累組", "休閒組"].index(data.get('level', "有點累組")),
-                                     key=f"edit_lv_{name}")
-                new_g = st.number_input("場次數修正", min_value=0, value=data['games'], key=f"edit_gm_{name}")
-                
-                if st.button("儲存修改", key=f"save_{name}"):
-                    if edit_player(name, new_n, new_l, new_g):
-                        st.toast(f"已更新 {new_n}")
-                        st.rerun()
+    roster_panel()
 
-        with c2:
-            st.checkbox("", value=data['active'], key=f"act_{name}", on_change=toggle_active, args=(name,))
-        with c3:
-            if st.button("x", key=f"del_{name}"):
-                remove_player(name)
-                st.rerun()
-
-    if st.button("🗑️ 清除所有紀錄 (重置)", type="primary"):
-        if os.path.exists(DATA_FILE):
-            os.remove(DATA_FILE)
+    if st.button("🗑️ 清除今晚紀錄 (重置)", type="primary",
+                 help="清空名單、場地與對戰紀錄；會員名錄 (分組、戰力、累計場次) 會保留"):
+        get_directory().flush()
+        get_store().clear()
         st.session_state.clear()
         st.rerun()
 
-# 主畫面：場地顯示區
-st.subheader("🏟️ 場地現況")
+    _debug = st.query_params.get("debug")
+    # 面板看得到內部狀態：沒設通關碼就不給看，不是誰都能打開
+    if _debug and get_debug_key() and _debug == get_debug_key():
+        metrics_panel()
 
-active_courts = sorted(st.session_state.courts.keys())
-court_cols = st.columns(len(active_courts)) 
+@st.fragment
+@metrics.timed("render.court_panel_ms")
+def court_panel(court_id):
+    """單一場地 (獨立重整：這個場地的操作只重畫這一格)"""
+    rerun_if_stale()
+    container = st.container(border=True)
+    container.markdown(f"### 🏸 場地 {court_id}")
+    
+    current_p = sched.court_names(court_id)
+    c_status = sched.court_status.get(court_id, "EDITING")
 
-for i, court_id in enumerate(active_courts): 
-    with court_cols[i]:
-        container = st.container(border=True)
-        container.markdown(f"### 🏸 場地 {court_id}")
-        
-        current_p = st.session_state.courts[court_id]
-        c_status = st.session_state.court_status.get(court_id, "EDITING")
-
-        def fmt_p(name):
-            if name == "waiting...": return name
-            p_data = st.session_state.players.get(name)
-            if not p_data: return name
-            lv = p_data.get('level', '')
-            icon = {"死亡之組": "💀", "有點累組": "😓", "休閒組": "☕"}.get(lv, "")
-            return f"{name} {icon}"
-
-        if current_p:
-            if c_status == "PLAYING":
-                display_p = current_p + ["waiting..."] * (4 - len(current_p))
-                d_p = [fmt_p(x) for x in display_p]
-
-                c_team1, c_vs, c_team2 = container.columns([2,1,2])
-                with c_team1:
-                    st.info(f"{d_p[0]}\n\n{d_p[1]}")
-                with c_vs:
-                    st.markdown("<br><div style='text-align: center'>VS</div>", unsafe_allow_html=True)
-                with c_team2:
-                    st.error(f"{d_p[2]}\n\n{d_p[3]}")
-                
-                if container.button(f"⏱️ 結束 & 換下一組", key=f"next_{court_id}", type="primary", use_container_width=True):
-                    finish_and_next(court_id)
-                    st.rerun()
-                    
-            else:
-                st.caption("調整中 (點擊 ❌ 可移除)")
-                for p in current_p:
-                    ec1, ec2 = container.columns([4, 1])
-                    ec1.write(f"👤 {fmt_p(p)}")
-                    if ec2.button("❌", key=f"rm_{court_id}_{p}"):
-                        remove_player_from_court(court_id, p)
-                        st.rerun()
-                
-                if len(current_p) < 4:
-                    container.info(f"等待加入... ({len(current_p)}/4)")
-                else:
-                    if container.button("🚀 開始對戰 (鎖定)", key=f"start_game_{court_id}", type="primary", use_container_width=True):
-                        start_game(court_id)
-                        st.rerun()
+    if current_p:
+        if c_status == "PLAYING":
+            display_p = current_p + ["waiting..."] * (4 - len(current_p))
+            d_p = [fmt_p(x) for x in display_p]
 
-            if container.button("清除", key=f"cls_{court_id}"):
-                reset_court(court_id)
-                st.rerun()
+            c_team1, c_vs, c_team2 = container.columns([2,1,2])
+            with c_team1:
+                st.info(f"{d_p[0]}\n\n{d_p[1]}")
+            with c_vs:
+                st.markdown("<br><div style='text-align: center'>VS</div>", unsafe_allow_html=True)
+            with c_team2:
+                st.error(f"{d_p[2]}\n\n{d_p[3]}")
+            
+            # 記錄勝負會更新戰力分數；不想計分就直接按結束
+            w1, w2 = container.columns(2)
+            w1.button("🏆 藍隊勝", key=f"win1_{court_id}", use_container_width=True, on_click=finish_and_next, args=(court_id,), kwargs={"winner": 1, "shown": current_p})
+            w2.button("🏆 紅隊勝", key=f"win2_{court_id}", use_container_width=True, on_click=finish_and_next, args=(court_id,), kwargs={"winner": 2, "shown": current_p})
+            container.button(f"⏱️ 結束 & 換下一組", key=f"next_{court_id}", type="primary", use_container_width=True, on_click=finish_and_next, args=(court_id,), kwargs={"shown": current_p})
+
+            expected = sched.expected_end(court_id)
+            if expected:
+                container.caption(f"⏱️ 預計 {datetime.fromtimestamp(expected).strftime('%H:%M')} 結束")
+            staged = sched.staged.get(court_id)
+            if staged:
+                container.success(f"📣 下一組請到場邊準備: {'、'.join(fmt_p(n) for n in sched.names(staged))}")
+                
         else:
-            container.write("❌ 目前空場")
-            busy = []
-            for c, p in st.session_state.courts.items():
-                if p: busy.extend(p)
+            container.caption("調整中 (點擊 ❌ 可移除)")
+            for p in current_p:
+                ec1, ec2 = container.columns([4, 1])
+                ec1.write(f"👤 {fmt_p(p)}")
+                ec2.button("❌", key=f"rm_{court_id}_{p}", on_click=remove_player_from_court, args=(court_id, p))
             
-            preview = get_next_players(busy, 4)
-            if preview:
-                container.caption(f"預計下組: {','.join(preview)}")
-                if container.button("🚀 開始安排", key=f"start_{court_id}", type="primary", use_container_width=True):
-                    finish_and_next(court_id)
-                    st.rerun()
+            if len(current_p) < 4:
+                container.info(f"等待加入... ({len(current_p)}/4)")
             else:
-                container.warning("休息區人數不足")
+                container.button("🚀 開始對戰 (鎖定)", key=f"start_game_{court_id}", type="primary", use_container_width=True, on_click=start_game, args=(court_id,))
 
-st.divider()
-c_rest, c_hist = st.columns([1, 1])
+        container.button("清除", key=f"cls_{court_id}", on_click=reset_court, args=(court_id,))
+    else:
+        container.write("❌ 目前空場")
+        preview = sched.preview().get(court_id)
+        if preview:
+            container.caption(f"預計下組: {','.join(sched.names(preview))}")
+            container.button("🚀 開始安排", key=f"start_{court_id}", type="primary", use_container_width=True, on_click=start_court, args=(court_id,), kwargs={"shown": preview})
+        else:
+            container.warning("休息區人數不足")
 
-with c_rest:
+@st.fragment(run_every=5)
+@metrics.timed("render.waiting_panel_ms")
+def waiting_panel():
+    """休息區 (獨立重整；每 5 秒自動更新一次，反映各場地的變化)"""
+    if sync_state() or stage_next_group():
+        # 其他裝置改了東西 / 有場地快打完了，整頁重畫
+        st.rerun()
+    rerun_if_stale()
     st.subheader("💤 休息中 / 等候區")
-    on_court = []
-    for p_list in st.session_state.courts.values():
-        on_court.extend(p_list)
-    
-    waiting = [p for p, d in st.session_state.players.items() if d['active'] and p not in on_court]
-    waiting_sorted = sorted(waiting, key=lambda x: (st.session_state.players[x]['games'], random.random()))
+    waiting_sorted = sched.waiting()
+    staged = sched.staged_pids()
     
     if waiting_sorted:
-        st.write(f"目前 {len(waiting_sorted)} 人候位：")
-        for p in waiting_sorted:
-            d = st.session_state.players[p]
-            lv = d.get('level', '有點累組')
-            icon = {"死亡之組": "💀", "有點累組": "😓", "休閒組": "☕"}.get(lv, "😓")
+        now = time.time()
+        fair = sched.fairness(now)
+        st.write(f"目前 {len(waiting_sorted)} 人候位 (依排隊順序)：")
+        st.caption(f"⚖️ 每小時 {fair['gph_min']:.1f}～{fair['gph_max']:.1f} 場 (應得約 {fair['rate']:.1f} 場)，"
+                   f"最久已等 {fair['longest_wait'] / 60:.0f} 分鐘。晚到與暫離的時間不算，等越久越前面。")
+        for d in paginate(waiting_sorted, "waiting_page"):
+            p = d.name
+            icon = LEVEL_ICONS.get(d.level, "😓")
             
-            if st.button(f"➕ {p} {icon} ({d['games']}場)", key=f"btn_add_{p}"):
+            ready = " 📣" if d.id in staged else ""
+            waited = (now - d.last_end) / 60
+            if st.button(f"➕ {p} {icon} ({d.games}場 · 等{waited:.0f}分){ready}", key=f"btn_add_{p}"):
                  manual_add_player(p)
+                 # 場地名單變了，整頁重畫
                  st.rerun()
     else:
         st.write("無人休息")
 
+# 主畫面：場地顯示區
+st.subheader("🏟️ 場地現況")
+
+# 按錯可以復原 (這台裝置最近 30 步；按鈕在場地區塊外，所以不顯示是哪一步，復原後會提示)
+u1, u2, _ = st.columns([1, 1, 4])
+u1.button("↩️ 復原上一步", on_click=apply_undo, use_container_width=True,
+          help="結束、清除、移除、編輯、加入場地等動作都可以復原；其他裝置之後又改過的就不能復原")
+u2.button("↪️ 重做", on_click=apply_undo, kwargs={"redo": True}, use_container_width=True)
+
+active_courts = sorted(sched.courts.keys())
+
+if len(sched.free_courts()) >= 2:
+    if st.button(f"🚀 一次排滿 {len(sched.free_courts())} 面空場", type="primary"):
+        fill_free_courts()
+        st.rerun()
+
+with metrics.timer("render.courts_ms"):
+    for row_start in range(0, len(active_courts), COURTS_PER_ROW):
+        row = active_courts[row_start:row_start + COURTS_PER_ROW]
+        court_cols = st.columns(min(len(active_courts), COURTS_PER_ROW))
+        for i, court_id in enumerate(row):
+            with court_cols[i]:
+                court_panel(court_id)
+
+st.divider()
+c_rest, c_hist = st.columns([1, 1])
+
+with c_rest:
+    waiting_panel()
+
 with c_hist:
     st.subheader("📜 對戰紀錄")
-    for rec in st.session_state.history[:10]: 
-        st.text(rec)
\ No newline at end of file
+    for rec in sched.history[:10]:
+        st.text(str(rec))
+
+    with st.expander("🗄️ 歷史紀錄查詢 / 匯出"):
+        q_player = st.text_input("球員", key="archive_player")
+        q_dates = st.date_input("日期範圍", value=(), key="archive_dates")
+        if st.button("查詢", key="archive_query"):
+            start_date = end_date = None
+            if len(q_dates) >= 1:
+                start_date = q_dates[0].strftime("%Y-%m-%d")
+                end_date = q_dates[-1].strftime("%Y-%m-%d")
+            try:
+                df = matchlog.query_archive(current_club().archive_dir, player=q_player.strip() or None,
+                                            start_date=start_date, end_date=end_date)
+            except Exception as e:
+                st.error(f"查詢失敗: {e}")
+            else:
+                if len(df) == 0:
+                    st.info("封存檔裡沒有符合的紀錄 (最近的比賽還在上方列表中)")
+                else:
+                    st.dataframe(df, hide_index=True)
+                    st.download_button("⬇️ 下載 CSV", df.to_csv(index=False).encode("utf-8-sig"),
+                                       file_name="match_history.csv", mime="text/csv")
+
+st.session_state.page_version = sched.version   # 這一輪畫面對應的狀態版本
+_page_done = True
+metrics.observe("render.page_ms", (time.perf_counter() - _page_started) * 1000)
+metrics.maybe_export(METRICS_FILE)
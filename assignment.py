@@ -0,0 +1,151 @@
+import time
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+# 四人的三種分隊方式：[隊伍1, 隊伍1, 隊伍2, 隊伍2]
+PAIRINGS = np.array([[0, 1, 2, 3], [0, 2, 1, 3], [0, 3, 1, 2]])
+
+# 成本權重：多打一場的代價要大於常見的分差，公平性優先
+# (戰力分數相鄰分組差 200 分，兩隊差 200 分約等於 0.4 場)
+FAIR_WEIGHT = 1.0
+BALANCE_WEIGHT = 0.4 / 200
+RANK_EPS = 1e-3         # 同場次時偏好排名 (隨機序) 較前的人
+PARTNER_WEIGHT = 0.15   # 每重複一次搭檔
+OPPONENT_WEIGHT = 0.05  # 每重複一次對手
+
+MAX_QUARTETS = 100_000  # 超過就改用抽樣
+MAX_SAMPLE_CELLS = 2_000_000
+TOP_CANDIDATES = 5_000  # 每輪只在成本最低的這些組合裡挑
+MAX_ROUNDS = 300
+
+
+def pairing_diffs(ratings):
+    """ratings: (Q, 4) 每組四人的戰力 -> (Q, 3) 三種分隊的兩隊差距"""
+    r = ratings[:, PAIRINGS]
+    return np.abs(r[..., 0] + r[..., 1] - r[..., 2] - r[..., 3])
+
+
+def best_pairings(ratings):
+    """一次算完所有四人組的最佳分隊，回傳 (分隊方式 index, 差距)"""
+    diffs = pairing_diffs(ratings)
+    best = diffs.argmin(axis=1)
+    return best, diffs[np.arange(len(diffs)), best]
+
+
+def repeat_penalties(quartets, partner, opponent):
+    """(Q, 4) 四人組 -> (Q, 3) 三種分隊的重複搭檔/對手懲罰
+
+    partner / opponent 是候選池內的次數矩陣，每種分隊固定 6 次查表。
+    """
+    q = quartets[:, PAIRINGS]
+    a, b, c, d = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    partners = partner[a, b] + partner[c, d]
+    opponents = opponent[a, c] + opponent[a, d] + opponent[b, c] + opponent[b, d]
+    return PARTNER_WEIGHT * partners + OPPONENT_WEIGHT * opponents
+
+
+def candidate_quartets(m, n_courts, np_rng, seeds=()):
+    """列出候選四人組 (候選池已依排名排序，index 越小越優先)
+
+    組合數不大時全列，否則依排名加權抽樣；seeds (逐場貪婪的結果) 一定會放進去。
+    """
+    if comb(m, 4) <= MAX_QUARTETS:
+        quartets = np.fromiter(
+            (i for c in combinations(range(m), 4) for i in c), dtype=np.int32
+        ).reshape(-1, 4)
+    else:
+        # Gumbel top-k：排名越前越容易被抽到，一次抽出整批不重複的四人組
+        n_samples = max(2_000, MAX_SAMPLE_CELLS // m)
+        log_p = -np.arange(m) / (4.0 * n_courts)
+        keys = log_p + np_rng.gumbel(size=(n_samples, m))
+        quartets = np.argpartition(-keys, 4, axis=1)[:, :4].astype(np.int32)
+    if len(seeds):
+        quartets = np.vstack([np.asarray(seeds, dtype=np.int32).reshape(-1, 4), quartets])
+    return quartets
+
+
+def score_quartets(quartets, games, ratings, forbidden, partner=None, opponent=None):
+    """向量化計算每個四人組的成本與最佳分隊
+
+    forbidden: (Q,) 不相容 (死亡之組 + 休閒組) 的組合，成本為 inf
+    partner / opponent: 候選池的重複次數矩陣 (可省略)
+    """
+    fair = (games[quartets] - games.min()).sum(axis=1) + RANK_EPS * quartets.sum(axis=1)
+    pair_cost = BALANCE_WEIGHT * pairing_diffs(ratings[quartets])
+    if partner is not None:
+        pair_cost = pair_cost + repeat_penalties(quartets, partner, opponent)
+    best = pair_cost.argmin(axis=1)
+    cost = FAIR_WEIGHT * fair + pair_cost[np.arange(len(quartets)), best]
+    cost[forbidden] = np.inf
+    return cost, best
+
+
+def _pick_disjoint(order, quartets, n_courts, m):
+    used = np.zeros(m, dtype=bool)
+    chosen = []
+    for q in order:
+        members = quartets[q]
+        if not used[members].any():
+            used[members] = True
+            chosen.append(q)
+            if len(chosen) == n_courts:
+                break
+    return chosen
+
+
+def assign(games, ratings, levels, n_courts, np_rng, enable_balancing=True,
+           time_budget=0.2, seeds=(), partner=None, opponent=None):
+    """把候選池一次分配到 n_courts 個空場
+
+    games / ratings / levels: 候選池 (已排序) 每人的排隊分數 (以場為單位)、戰力、分組代碼
+    (0=死亡之組, 1=有點累組, 2=休閒組)。目標依序是：填滿越多場越好，
+    再來是總成本 (場次公平 + 分隊差距 + 重複搭檔/對手) 越小越好。
+    時間到就回傳目前最好的解。
+
+    回傳 [(四人 index 依分隊排好), ...]
+    """
+    deadline = time.perf_counter() + time_budget
+    m = len(games)
+    if m < 4 or n_courts < 1:
+        return []
+
+    games = np.asarray(games, dtype=float)
+    ratings = np.asarray(ratings, dtype=float)
+    levels = np.asarray(levels)
+
+    quartets = candidate_quartets(m, n_courts, np_rng, seeds)
+    if enable_balancing:
+        lv = levels[quartets]
+        forbidden = (lv == 0).any(axis=1) & (lv == 2).any(axis=1)
+    else:
+        forbidden = np.zeros(len(quartets), dtype=bool)
+    cost, best = score_quartets(quartets, games, ratings, forbidden, partner, opponent)
+
+    finite = np.flatnonzero(np.isfinite(cost))
+    if len(finite) > TOP_CANDIDATES:
+        finite = finite[np.argpartition(cost[finite], TOP_CANDIDATES)[:TOP_CANDIDATES]]
+    if len(finite) == 0:
+        return []
+    pool_cost = cost[finite]
+
+    # 起點：逐場貪婪的解 (種子排在最前面)
+    best_key, best_pick = None, []
+    seed_pick = [q for q in range(len(seeds)) if np.isfinite(cost[q])]
+    if seed_pick:
+        best_key, best_pick = (-len(seed_pick), float(cost[seed_pick].sum())), seed_pick
+    order = finite[np.argsort(pool_cost, kind="stable")]
+    noise_scale = max(float(np.std(pool_cost)), BALANCE_WEIGHT)
+    for _ in range(MAX_ROUNDS):
+        chosen = _pick_disjoint(order, quartets, n_courts, m)
+        key = (-len(chosen), float(cost[chosen].sum()) if chosen else 0.0)
+        if best_key is None or key < best_key:
+            best_key, best_pick = key, chosen
+        if time.perf_counter() >= deadline:
+            break
+        # 隨機擾動成本再貪婪一次，跳出「第一場拿走最好的、後面只剩殘局」的情況
+        noisy = pool_cost + np_rng.gumbel(size=len(pool_cost)) * noise_scale * 0.5
+        order = finite[np.argsort(noisy)]
+
+    return [quartets[q][PAIRINGS[best[q]]] for q in best_pick]
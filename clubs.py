@@ -0,0 +1,105 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from analytics import NightArchive
+from directory import MemberDirectory
+from nameindex import NameIndex
+from storage import StateStore
+
+DEFAULT_CLUB = "default"   # 沒指定球團時用原本的檔案位置 (舊部署不用搬檔案)
+CLUBS_DIR = "clubs"        # 其他球團: clubs/<球團>/
+MAX_HOT_CLUBS = 8          # 記憶體裡最多留幾個球團
+IDLE_SECONDS = 30 * 60     # 超過這麼久沒人用就寫回磁碟放掉
+
+_INVALID = re.compile(r"[^a-z0-9_-]")
+
+
+def club_id(raw):
+    """網址參數 -> 球團代號 (只留小寫英數、- 與 _，當資料夾名稱也安全)"""
+    club = _INVALID.sub("", str(raw or "").strip().lower())[:32]
+    return club or DEFAULT_CLUB
+
+
+def club_dir(club):
+    return "." if club == DEFAULT_CLUB else os.path.join(CLUBS_DIR, club)
+
+
+def state_path(club):
+    return os.path.join(club_dir(club), "badminton_state.json")
+
+
+class Club:
+    """一個球團的存檔、會員名錄與名字索引 (同一個球團的 session 共用)"""
+
+    def __init__(self, club):
+        self.id = club
+        self.dir = club_dir(club)
+        os.makedirs(self.dir, exist_ok=True)
+        self.state_path = state_path(club)
+        self.archive_dir = os.path.join(self.dir, "match_archive")
+        self.store = StateStore(self.state_path)
+        self.directory = MemberDirectory(os.path.join(self.dir, "members.db"))
+        self.nights = NightArchive(os.path.join(self.dir, "analytics.db"))   # 每晚的統計
+        self.last_used = time.time()
+        self._names = None
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        """會員名字 + 別名的索引 (第一次用到才從名錄載入)"""
+        if self._names is None:
+            with self._lock:
+                if self._names is None:
+                    self._names = NameIndex(self.directory.aliases())
+        return self._names
+
+    def release(self):
+        """寫回磁碟並放掉記憶體裡的狀態，之後再用到會從磁碟重讀"""
+        self.directory.flush()
+        self.store.release()
+        with self._lock:
+            self._names = None
+
+
+class ClubRegistry:
+    """最近用到的球團留在記憶體 (LRU)，超過 max_hot 個或閒置太久的就放掉
+
+    球團再多，記憶體裡也只有 max_hot 份狀態；沒人用的球團只佔磁碟。
+    """
+
+    def __init__(self, max_hot=MAX_HOT_CLUBS, idle_seconds=IDLE_SECONDS):
+        self.max_hot = max_hot
+        self.idle_seconds = idle_seconds
+        self._clubs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clubs)
+
+    def __contains__(self, club):
+        return club_id(club) in self._clubs
+
+    def get(self, club):
+        club = club_id(club)
+        now = time.time()
+        with self._lock:
+            entry = self._clubs.pop(club, None)
+            if entry is None:
+                entry = Club(club)
+            entry.last_used = now
+            self._clubs[club] = entry
+            evicted = []
+            while len(self._clubs) > self.max_hot:
+                evicted.append(self._clubs.popitem(last=False)[1])
+            # OrderedDict 由舊到新，遇到還在用的就可以停了
+            for other in list(self._clubs.values()):
+                if now - other.last_used <= self.idle_seconds:
+                    break
+                evicted.append(self._clubs.pop(other.id))
+        # 寫檔在鎖外面做，不擋住其他球團
+        for old in evicted:
+            old.release()
+        return entry
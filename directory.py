@@ -0,0 +1,169 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+DB_FILE = "members.db"
+FLUSH_BATCH = 20       # 累積這麼多筆修改就寫回資料庫
+FLUSH_SECONDS = 60     # 或距離上次寫回超過這麼久
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    name           TEXT PRIMARY KEY,
+    level          TEXT NOT NULL,
+    rating         REAL,
+    rated_games    INTEGER NOT NULL DEFAULT 0,
+    lifetime_games INTEGER NOT NULL DEFAULT 0,
+    sessions       INTEGER NOT NULL DEFAULT 0,
+    aliases        TEXT NOT NULL DEFAULT '[]',
+    created        REAL NOT NULL,
+    last_seen      REAL
+);
+CREATE INDEX IF NOT EXISTS members_last_seen ON members (last_seen);
+"""
+
+
+class Member:
+    """會員名錄裡的一筆資料"""
+    __slots__ = ("name", "level", "rating", "rated_games", "lifetime_games", "sessions",
+                 "aliases", "last_seen")
+
+    def __init__(self, name, level, rating=None, rated_games=0, lifetime_games=0, sessions=0,
+                 aliases=(), last_seen=None):
+        self.name = name
+        self.level = level
+        self.rating = rating
+        self.rated_games = rated_games
+        self.lifetime_games = lifetime_games
+        self.sessions = sessions
+        self.aliases = list(aliases)
+        self.last_seen = last_seen
+
+    @classmethod
+    def from_row(cls, row):
+        name, level, rating, rated_games, lifetime_games, sessions, aliases, last_seen = row
+        return cls(name, level, rating, rated_games, lifetime_games, sessions, json.loads(aliases), last_seen)
+
+
+_COLUMNS = "name, level, rating, rated_games, lifetime_games, sessions, aliases, last_seen"
+
+
+class MemberDirectory:
+    """所有會員的長期資料 (SQLite)
+
+    每晚的名單只把到場的人載入記憶體 (Scheduler)；場次、分組、戰力的變動先
+    stage() 在記憶體，累積一批或隔一段時間才在同一個交易裡寫回。
+    每次操作開一個短連線，Streamlit 每個 session 在不同執行緒跑也沒問題。
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._pending = {}       # name -> {欄位: 值, "games": 增加的場次}
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    # --- 讀取 ---
+
+    def get(self, name):
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM members WHERE name = ?", (name,)).fetchone()
+        return Member.from_row(row) if row else None
+
+    def aliases(self):
+        """{會員名: [別名]}，給名字索引用 (只讀兩個欄位)"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT name, aliases FROM members").fetchall()
+        return {name: json.loads(aliases) for name, aliases in rows}
+
+    def recent(self, limit=200, exclude=()):
+        """最近來過的會員 (快速加入用)"""
+        exclude = set(exclude)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM members ORDER BY last_seen IS NULL, last_seen DESC LIMIT ?",
+                (limit + len(exclude),)).fetchall()
+        return [m for m in map(Member.from_row, rows) if m.name not in exclude][:limit]
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+
+    # --- 寫入 ---
+
+    def ensure(self, name, level, rating=None, rated_games=0, aliases=()):
+        """還不是會員就建檔 (不算出席)，匯入舊存檔用"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO members (name, level, rating, rated_games, aliases, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (name, level, rating, rated_games, json.dumps(list(aliases), ensure_ascii=False), time.time()))
+
+    def check_in(self, name, level, rating=None, rated_games=0):
+        """今晚到場：新會員建檔，舊會員出席次數 +1，回傳 Member (含長期資料)"""
+        self.flush()
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO members (name, level, rating, rated_games, created, last_seen, sessions)"
+                " VALUES (?, ?, ?, ?, ?, ?, 1)"
+                " ON CONFLICT(name) DO UPDATE SET last_seen = excluded.last_seen,"
+                " sessions = sessions + (date(last_seen, 'unixepoch', 'localtime')"
+                "                        IS NOT date(excluded.last_seen, 'unixepoch', 'localtime'))",
+                (name, level, rating, rated_games, now, now))
+        return self.get(name)
+
+    def stage(self, name, games=0, **fields):
+        """先記在記憶體，累積夠多或夠久才寫回；fields: level / rating / rated_games"""
+        with self._lock:
+            entry = self._pending.setdefault(name, {"games": 0})
+            entry["games"] += games
+            entry.update(fields)
+            due = len(self._pending) >= FLUSH_BATCH or time.time() - self._last_flush >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把累積的修改在同一個交易裡寫回"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+        if not pending:
+            return
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            for name, entry in pending.items():
+                sets = ["lifetime_games = lifetime_games + ?", "last_seen = ?"]
+                args = [entry["games"], now]
+                for col in ("level", "rating", "rated_games"):
+                    if col in entry:
+                        sets.append(f"{col} = ?")
+                        args.append(entry[col])
+                conn.execute(f"UPDATE members SET {', '.join(sets)} WHERE name = ?", args + [name])
+
+    def set_aliases(self, name, aliases):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE members SET aliases = ? WHERE name = ?",
+                         (json.dumps(list(aliases), ensure_ascii=False), name))
+
+    def rename(self, old_name, new_name, aliases):
+        """改名 (新名字已是會員時合併場次)，aliases 為改名後的別名列表"""
+        self.flush()
+        with closing(self._connect()) as conn, conn:
+            if conn.execute("SELECT 1 FROM members WHERE name = ?", (new_name,)).fetchone():
+                conn.execute(
+                    "UPDATE members SET"
+                    " lifetime_games = lifetime_games + (SELECT lifetime_games FROM members WHERE name = ?),"
+                    " sessions = sessions + (SELECT sessions FROM members WHERE name = ?)"
+                    " WHERE name = ?", (old_name, old_name, new_name))
+                conn.execute("DELETE FROM members WHERE name = ?", (old_name,))
+            else:
+                conn.execute("UPDATE members SET name = ? WHERE name = ?", (new_name, old_name))
+            conn.execute("UPDATE members SET aliases = ? WHERE name = ?",
+                         (json.dumps(list(aliases), ensure_ascii=False), new_name))
@@ -0,0 +1,63 @@
+DEFAULT_SECONDS = 12 * 60.0   # 還沒有紀錄時假設一場 12 分鐘
+MIN_SECONDS = 3 * 60.0        # 太短 (按錯) 或太長 (忘了按結束) 的場次不列入
+MAX_SECONDS = 45 * 60.0
+PRIOR_WEIGHT = 3.0            # 樣本少時往上一層 (分組 / 預設值) 靠攏的程度
+MIN_ALPHA = 0.2               # 移動平均：前幾場取平均，之後新場次佔 20%
+
+
+def _update(stats, key, seconds):
+    n, mean = stats.get(key, (0, 0.0))
+    n += 1
+    alpha = max(1.0 / n, MIN_ALPHA)
+    stats[key] = [n, mean + alpha * (seconds - mean)]
+
+
+def _shrink(stats, key, prior):
+    n, mean = stats.get(key, (0, 0.0))
+    return (n * mean + PRIOR_WEIGHT * prior) / (n + PRIOR_WEIGHT)
+
+
+class DurationModel:
+    """從比賽開始/結束時間學每個分組、每個人打一場要多久
+
+    估計值 = 四人各自的平均時間 (樣本少時往所屬分組的平均靠攏，分組樣本少時
+    再往預設值靠攏) 再取平均。只存每個 key 的 (場數, 移動平均)，更新是 O(1)。
+    """
+
+    def __init__(self, levels=None, players=None):
+        self.levels = dict(levels or {})     # 分組 -> [場數, 平均秒數]
+        self.players = dict(players or {})   # 名字 -> [場數, 平均秒數]
+
+    def observe(self, names, levels, seconds):
+        """記錄一場 (四人的名字與分組)，回傳是否採用"""
+        if seconds is None or not MIN_SECONDS <= seconds <= MAX_SECONDS:
+            return False
+        for level in set(levels):
+            _update(self.levels, level, seconds)
+        for name in names:
+            _update(self.players, name, seconds)
+        return True
+
+    def level_estimate(self, level):
+        return _shrink(self.levels, level, DEFAULT_SECONDS)
+
+    def estimate(self, names, levels):
+        """這組人預計打幾秒"""
+        if not names:
+            return DEFAULT_SECONDS
+        total = 0.0
+        for name, level in zip(names, levels):
+            total += _shrink(self.players, name, self.level_estimate(level))
+        return total / len(names)
+
+    def rename(self, old_name, new_name):
+        if old_name in self.players:
+            self.players[new_name] = self.players.pop(old_name)
+
+    def to_dict(self):
+        return {"levels": self.levels, "players": self.players}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(data.get("levels"), data.get("players"))
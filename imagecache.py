@@ -0,0 +1,88 @@
+import hashlib
+import io
+import json
+import os
+
+from storage import atomic_write_json
+
+CACHE_DIR = "ocr_cache"
+MAX_ENTRIES = 200
+
+# OpenAI 高解析模式會先縮到 2048 以內、短邊 768，再切塊計費；
+# 先在這裡縮到一樣大，字一樣清楚但上傳量小很多
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+JPEG_QUALITY = 80
+
+
+def image_key(image_bytes):
+    """以圖片內容當 key：同一張截圖重傳也會命中"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def shrink_image(image_bytes):
+    """縮小並重新壓縮成灰階 JPEG，回傳 (bytes, mime)；原圖比較小就用原圖"""
+    from PIL import Image, ImageOps
+
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    w, h = img.size
+    scale = min(1.0, MAX_LONG_SIDE / max(w, h), MAX_SHORT_SIDE / min(w, h))
+    if scale < 1.0:
+        img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.LANCZOS)
+    out = io.BytesIO()
+    img.convert("L").save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    data = out.getvalue()
+    if len(data) >= len(image_bytes):
+        mime = "image/png" if image_bytes[:4] == b"\x89PNG" else "image/jpeg"
+        return image_bytes, mime
+    return data, "image/jpeg"
+
+
+class ResultCache:
+    """辨識結果的磁碟快取 (一張圖一個 JSON 檔)
+
+    讀到時更新檔案時間，超過 max_entries 時刪掉最久沒用到的 (LRU)。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        atomic_write_json(self._path(key), value)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
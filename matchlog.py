@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+ARCHIVE_DIR = "match_archive"
+RECENT_SIZE = 30     # 記憶體 (與存檔) 只留最近這幾場
+ARCHIVE_BATCH = 20   # 累積超過 RECENT_SIZE 這麼多場才一次搬進封存檔
+
+ARCHIVE_COLUMNS = ["id", "court", "team1_a", "team1_b", "team2_a", "team2_b",
+                   "start", "end", "winner", "score"]
+
+_LEGACY_RE = re.compile(r"場地 (\d+): (.+?)\+(.+?) vs (.+?)\+(.+?)(?: \(🏆 隊伍 (\d)\))?$")
+_LEGACY_PARTIAL_RE = re.compile(r"場地 (\d+): (.+)$")
+
+
+class MatchRecord:
+    """一場比賽的結構化紀錄 (時間為 epoch 秒)"""
+    __slots__ = ("id", "court", "team1", "team2", "start", "end", "winner", "score")
+
+    def __init__(self, court, team1, team2, start=None, end=None, winner=None, score=None, id=None):
+        self.id = id or uuid.uuid4().hex[:12]
+        self.court = court
+        self.team1 = tuple(team1)
+        self.team2 = tuple(team2)
+        self.start = start
+        self.end = end
+        self.winner = winner
+        self.score = score
+
+    def players(self):
+        return self.team1 + self.team2
+
+    def __str__(self):
+        if not self.team2:
+            return f"場地 {self.court}: {'+'.join(self.team1)}"
+        text = f"場地 {self.court}: {'+'.join(self.team1)} vs {'+'.join(self.team2)}"
+        if self.winner in (1, 2):
+            text += f" (🏆 隊伍 {self.winner})"
+        return text
+
+    def to_dict(self):
+        return {"id": self.id, "court": self.court, "team1": list(self.team1), "team2": list(self.team2),
+                "start": self.start, "end": self.end, "winner": self.winner, "score": self.score}
+
+    @classmethod
+    def from_dict(cls, data):
+        """讀取存檔；舊版存的是顯示用字串，盡量解析回來"""
+        if isinstance(data, str):
+            m = _LEGACY_RE.match(data)
+            if m:
+                court, a, b, c, d, winner = m.groups()
+                return cls(int(court), (a, b), (c, d), winner=int(winner) if winner else None)
+            m = _LEGACY_PARTIAL_RE.match(data)   # 不足四人的場地
+            if m:
+                return cls(int(m.group(1)), m.group(2).split("+"), ())
+            return None
+        return cls(data["court"], data["team1"], data["team2"], data.get("start"), data.get("end"),
+                   data.get("winner"), data.get("score"), data.get("id"))
+
+    def to_row(self):
+        t1 = list(self.team1) + [None] * (2 - len(self.team1))
+        t2 = list(self.team2) + [None] * (2 - len(self.team2))
+        return {"id": self.id, "court": self.court, "team1_a": t1[0], "team1_b": t1[1],
+                "team2_a": t2[0], "team2_b": t2[1], "start": self.start, "end": self.end,
+                "winner": self.winner, "score": self.score}
+
+
+class MatchLog:
+    """最近比賽的環狀緩衝區 (新的在前)
+
+    加入是 O(1)；超過 RECENT_SIZE + ARCHIVE_BATCH 場時，take_overflow() 會一次
+    取出最舊的那批，交給呼叫端寫進封存檔。
+    """
+
+    def __init__(self, records=()):
+        self._records = deque(r for r in records if r is not None)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._records[i] for i in range(*index.indices(len(self._records)))]
+        return self._records[index]
+
+    def add(self, record):
+        self._records.appendleft(record)
+
+    def take_overflow(self):
+        if len(self._records) <= RECENT_SIZE + ARCHIVE_BATCH:
+            return []
+        old = []
+        while len(self._records) > RECENT_SIZE:
+            old.append(self._records.pop())
+        old.reverse()
+        return old
+
+    def put_back(self, old):
+        """封存失敗時把 take_overflow() 取出的紀錄放回最舊的一端"""
+        self._records.extend(old)   # old 是新的在前，依序接在最舊的一端後面
+
+    def to_list(self):
+        return [r.to_dict() for r in self._records]
+
+
+def _partition(ts):
+    return datetime.fromtimestamp(ts if ts is not None else time.time()).strftime("%Y-%m-%d")
+
+
+def write_archive(records, archive_dir=ARCHIVE_DIR):
+    """把一批比賽依日期寫成 Parquet (每個日期一個資料夾，每批一個檔案)"""
+    import pandas as pd
+
+    by_date = {}
+    for r in records:
+        by_date.setdefault(_partition(r.end), []).append(r.to_row())
+    for date, rows in by_date.items():
+        part_dir = os.path.join(archive_dir, f"date={date}")
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}.parquet")
+        tmp_path = path + ".tmp"
+        pd.DataFrame(rows, columns=ARCHIVE_COLUMNS).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+def query_archive(archive_dir=ARCHIVE_DIR, player=None, start_date=None, end_date=None):
+    """查詢封存檔，只讀日期範圍內的資料夾；球員條件交給 Parquet 過濾
+
+    start_date / end_date 為 "YYYY-MM-DD" (含)。回傳 pandas DataFrame。
+    """
+    import pandas as pd
+
+    empty = pd.DataFrame(columns=ARCHIVE_COLUMNS + ["date"])
+    if not os.path.isdir(archive_dir):
+        return empty
+
+    filters = None
+    if player:
+        filters = [[(col, "==", player)] for col in ("team1_a", "team1_b", "team2_a", "team2_b")]
+
+    frames = []
+    for entry in sorted(os.listdir(archive_dir)):
+        if not entry.startswith("date="):
+            continue
+        date = entry[len("date="):]
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        part_dir = os.path.join(archive_dir, entry)
+        for name in sorted(os.listdir(part_dir)):
+            if not name.endswith(".parquet"):
+                continue
+            df = pd.read_parquet(os.path.join(part_dir, name), filters=filters)
+            if len(df):
+                frames.append(df.assign(date=date))
+    if not frames:
+        return empty
+    # 寫入封存後、更新存檔前當機的話同一場可能寫兩次，用 id 去重
+    return pd.concat(frames, ignore_index=True).drop_duplicates("id")
@@ -0,0 +1,189 @@
+"""輕量的效能計時與計數 (整個程式共用一份)
+
+預設關閉：關閉時 timed() 包起來的函數每次只多一次判斷，量不到任何差別。
+開啟方式：環境變數 BADMINTON_METRICS=1，或在 App 的效能面板 (?debug=<DEBUG_KEY>) 打開。
+
+    @metrics.timed("scheduler.next_group_ms")
+    def next_group(...): ...
+
+    with metrics.timer("render.courts_ms"):
+        ...
+
+    metrics.observe("storage.append_bytes", len(line))
+    metrics.count("app.reruns")
+
+每個指標保留最近 WINDOW 筆算 p50/p95 (滾動視窗)，另外累計總次數與總和。
+可以匯出成 JSON 或 Prometheus 文字格式 (給 node_exporter 的 textfile collector 讀)。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+WINDOW = 500              # 每個指標保留最近幾筆
+EXPORT_SECONDS = 15       # maybe_export() 最快多久寫一次檔
+PROMETHEUS_PREFIX = "badminton_"
+
+_enabled = os.environ.get("BADMINTON_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_samples = {}     # 名稱 -> deque(最近的值)
+_totals = {}      # 名稱 -> [次數, 總和]
+_counters = {}    # 名稱 -> 累計值
+_last_export = 0.0
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = bool(on)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+def observe(name, value):
+    """記一筆數值 (時間用毫秒、大小用 bytes，單位寫在名稱結尾)"""
+    if not _enabled:
+        return
+    with _lock:
+        window = _samples.get(name)
+        if window is None:
+            window = _samples[name] = deque(maxlen=WINDOW)
+            _totals[name] = [0, 0.0]
+        window.append(value)
+        total = _totals[name]
+        total[0] += 1
+        total[1] += value
+
+
+def count(name, n=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def timer(name):
+    """計時一段程式 (毫秒)；發生例外 (包含 Streamlit 的 rerun/stop) 也照樣記"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def timed(name):
+    """函數計時的 decorator (毫秒)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summary():
+    """{"series": {名稱: {count, mean, p50, p95, max}}, "counters": {名稱: 值}}
+
+    count / mean 是從開始累計的；p50 / p95 / max 是最近 WINDOW 筆的。
+    """
+    with _lock:
+        windows = {name: sorted(values) for name, values in _samples.items()}
+        totals = {name: list(total) for name, total in _totals.items()}
+        counters = dict(_counters)
+    series = {}
+    for name in sorted(windows):
+        values = windows[name]
+        n, total = totals[name]
+        series[name] = {
+            "count": n,
+            "mean": round(total / n, 3),
+            "p50": round(_percentile(values, 0.50), 3),
+            "p95": round(_percentile(values, 0.95), 3),
+            "max": round(values[-1], 3),
+        }
+    return {"series": series, "counters": dict(sorted(counters.items()))}
+
+
+def to_json():
+    return json.dumps(summary(), ensure_ascii=False, indent=2)
+
+
+def _prom_name(name):
+    return PROMETHEUS_PREFIX + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def to_prometheus():
+    """Prometheus 文字格式：每個數列是一個 summary (分位數 + _sum + _count)"""
+    with _lock:
+        windows = {name: sorted(values) for name, values in _samples.items()}
+        totals = {name: list(total) for name, total in _totals.items()}
+        counters = dict(_counters)
+    lines = []
+    for name in sorted(windows):
+        prom = _prom_name(name)
+        values = windows[name]
+        lines.append(f"# TYPE {prom} summary")
+        for q in (0.5, 0.95):
+            lines.append(f'{prom}{{quantile="{q}"}} {_percentile(values, q):.6g}')
+        lines.append(f"{prom}_sum {totals[name][1]:.6g}")
+        lines.append(f"{prom}_count {totals[name][0]}")
+    for name in sorted(counters):
+        prom = _prom_name(name) + "_total"
+        lines.append(f"# TYPE {prom} counter")
+        lines.append(f"{prom} {counters[name]}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    """寫出 Prometheus 文字檔 (.prom) 或 JSON (.json)，先寫暫存檔再 rename"""
+    content = to_json() if path.endswith(".json") else to_prometheus()
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=dir_name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def maybe_export(path):
+    """開啟時每 EXPORT_SECONDS 秒最多寫一次檔 (每次重跑都可以呼叫)"""
+    global _last_export
+    if not _enabled or not path:
+        return False
+    now = time.time()
+    with _lock:
+        if now - _last_export < EXPORT_SECONDS:
+            return False
+        _last_export = now
+    export(path)
+    return True
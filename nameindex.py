@@ -0,0 +1,132 @@
+import heapq
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+MIN_SCORE = 0.6     # 相似度低於這個就不建議
+TOP_CANDIDATES = 8  # n-gram 重疊最多的前幾名才做精確比對
+
+
+def normalize(name):
+    """比對用的名字：全形轉半形、忽略大小寫、去掉 emoji / 符號 / 空白"""
+    text = unicodedata.normalize("NFKC", name).casefold()
+    kept = []
+    for ch in text:
+        cat = unicodedata.category(ch)
+        # S* = 符號 (含 emoji 與膚色修飾)、P* = 標點、Z* = 空白、C* = 控制字元 (含 ZWJ)
+        if cat[0] in "SPZC" or 0xFE00 <= ord(ch) <= 0xFE0F:
+            continue
+        kept.append(ch)
+    key = "".join(kept)
+    return key or text.strip()
+
+
+def ngrams(key):
+    """加上頭尾標記的 bigram (兩個字的中文名也有 3 個 gram)"""
+    padded = f"^{key}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class NameIndex:
+    """已知會員的名字索引 (會員名 -> 別名列表)
+
+    查詢順序：原字串 -> 正規化後完全相同 (含別名) -> bigram 倒排索引找出
+    重疊最多的幾位，再用編輯相似度排序。只看倒排索引命中的人，
+    會員數上千也只要比對少數幾位。
+    """
+
+    def __init__(self, members=None):
+        self.members = {}                    # 會員名 -> [別名]
+        self._keys = {}                      # 正規化 key -> 會員名
+        self._postings = defaultdict(set)    # bigram -> {key}
+        for name, aliases in (members or {}).items():
+            self.add(name, aliases)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def _index_key(self, text, name):
+        key = normalize(text)
+        if key in self._keys:
+            return
+        self._keys[key] = name
+        for g in ngrams(key):
+            self._postings[g].add(key)
+
+    def _unindex_key(self, text, name):
+        key = normalize(text)
+        if self._keys.get(key) != name:
+            return
+        del self._keys[key]
+        for g in ngrams(key):
+            keys = self._postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[g]
+
+    def add(self, name, aliases=()):
+        """加入會員 (已存在就只補別名)，回傳是否有變動"""
+        changed = name not in self.members
+        if changed:
+            self.members[name] = []
+            self._index_key(name, name)
+        for alias in aliases:
+            changed = self.add_alias(alias, name) or changed
+        return changed
+
+    def add_alias(self, alias, name):
+        if name not in self.members:
+            self.add(name)
+        if alias == name or alias in self.members[name]:
+            return False
+        self.members[name].append(alias)
+        self._index_key(alias, name)
+        return True
+
+    def remove(self, name):
+        aliases = self.members.pop(name, None)
+        if aliases is None:
+            return
+        for text in [name] + aliases:
+            self._unindex_key(text, name)
+
+    def rename(self, old_name, new_name):
+        """改名後舊名字變成別名，之後截圖上還是舊暱稱也認得出來"""
+        aliases = self.members.get(old_name, [])
+        self.remove(old_name)
+        self.add(new_name, aliases + [old_name])
+
+    def suggest(self, query, min_score=MIN_SCORE):
+        """找出最像的已知會員，回傳 (會員名, 相似度 0~1) 或 None"""
+        if query in self.members:
+            return query, 1.0
+        key = normalize(query)
+        if key in self._keys:
+            return self._keys[key], 1.0
+
+        overlap = defaultdict(int)
+        for g in ngrams(key):
+            for k in self._postings.get(g, ()):
+                overlap[k] += 1
+        if not overlap:
+            return None
+        candidates = heapq.nlargest(TOP_CANDIDATES, overlap, key=overlap.get)
+        best_key, best_score = None, 0.0
+        for k in candidates:
+            score = SequenceMatcher(None, key, k).ratio()
+            if score > best_score:
+                best_key, best_score = k, score
+        if best_score < min_score:
+            return None
+        return self._keys[best_key], best_score
+
+    def to_dict(self):
+        return {name: list(aliases) for name, aliases in self.members.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
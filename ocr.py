@@ -0,0 +1,167 @@
+import logging
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+# 本機辨識的平均信心度低於這個值就改用 OpenAI
+MIN_CONFIDENCE = 0.6
+STATUS_BAR_RATIO = 0.06   # 截圖最上方的狀態列 (時間、電量) 直接裁掉
+MIN_WIDTH = 1000          # 太小的圖先放大，細字比較認得出來
+MAX_DESKEW = 15           # 超過這個角度大概不是歪掉而是偵測錯，不轉
+
+# LINE 投票畫面上不是名字的字 (原本是在 prompt 裡請 GPT 忽略)
+_NOISE_RE = [
+    re.compile(r"^\d{1,2}[:：]\d{2}"),                 # 時間
+    re.compile(r"\d+\s*%$"),                           # 電量
+    re.compile(r"^(不?打|不參加|參加|投票|選項|已投票|結束|截止)\s*[\(（]?\s*\d*\s*[\)）]?$"),
+    re.compile(r"^\d+\s*人$"),                          # 人數統計
+    re.compile(r"^(LINE|LTE|4G|5G|Wi-?Fi)$", re.IGNORECASE),
+    re.compile(r"^[\W\d_]+$"),                          # 只有數字或符號
+]
+_NUMBERING_RE = re.compile(r"^\s*\d+\s*[\.、)）]\s*")
+_CJK_SPACE_RE = re.compile(r"(?<=[㐀-鿿])\s+(?=[㐀-鿿])")
+
+_lock = threading.Lock()
+_engine = None   # 整個程序共用一份 (模型載入要好幾秒)，所有 session 都用同一個；載入失敗也記住
+_log = logging.getLogger(__name__)
+
+
+class OCRUnavailable(Exception):
+    """本機沒有安裝任何 OCR 引擎"""
+
+
+def clean_line(text):
+    """去掉編號與多餘空白，中文字之間的空白 (OCR 常常切開) 也拿掉"""
+    text = unicodedata.normalize("NFKC", text).strip()
+    text = _NUMBERING_RE.sub("", text)
+    text = _CJK_SPACE_RE.sub("", text)
+    return " ".join(text.split())
+
+
+def is_noise(text):
+    if not text:
+        return True
+    return any(p.search(text) for p in _NOISE_RE)
+
+
+def filter_names(lines):
+    """lines: [(文字, 信心度)] -> [(名字, 信心度)]，去掉雜訊與重複"""
+    seen = set()
+    names = []
+    for text, conf in lines:
+        text = clean_line(text)
+        if is_noise(text) or text in seen:
+            continue
+        seen.add(text)
+        names.append((text, conf))
+    return names
+
+
+def preprocess(image_bytes):
+    """解碼截圖並做 OCR 前處理：裁掉狀態列、放大、轉正、二值化 (黑字白底)"""
+    import cv2
+
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("無法解讀圖片")
+
+    img = img[int(img.shape[0] * STATUS_BAR_RATIO):]
+    if img.shape[1] < MIN_WIDTH:
+        scale = MIN_WIDTH / img.shape[1]
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+    _, binary = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() < 127:   # 深色模式：反轉成白底
+        binary = 255 - binary
+
+    # 用文字像素的最小外接矩形估計傾斜角度 (拍螢幕的照片常常歪一點)
+    coords = np.column_stack(np.where(binary < 128)[::-1]).astype(np.float32)
+    if len(coords) > 100:
+        angle = cv2.minAreaRect(coords)[-1]
+        if angle > 45:
+            angle -= 90
+        if 0.5 < abs(angle) < MAX_DESKEW:
+            h, w = binary.shape
+            m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+            binary = cv2.warpAffine(binary, m, (w, h), flags=cv2.INTER_CUBIC,
+                                    borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    return binary
+
+
+def _load_engine():
+    """優先用 easyocr，不能用再用 tesseract；回傳 (名稱, 物件)，兩個都不能用時回傳 (None, 原因)"""
+    reasons = []
+    try:
+        import easyocr
+        return "easyocr", easyocr.Reader(["ch_tra", "en"], gpu=False, verbose=False)
+    except ImportError:
+        reasons.append("沒有安裝 easyocr")
+    except Exception as e:
+        # 裝了但建不起來 (例如沒有網路、模型下載失敗)：改用 tesseract
+        _log.warning("easyocr 載入失敗，改用 tesseract: %s", e)
+        reasons.append(f"easyocr 載入失敗 ({e})")
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return "tesseract", pytesseract
+    except Exception as e:
+        reasons.append(f"tesseract 無法使用 ({e})")
+    _log.warning("沒有可用的本機 OCR，改用 OpenAI: %s", "；".join(reasons))
+    return None, "；".join(reasons)
+
+
+def get_engine():
+    """第一次呼叫時才載入模型，之後整個程序共用
+
+    都載入失敗時也記住結果 (丟出 OCRUnavailable)，不會每次上傳都重新下載模型。
+    """
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = _load_engine()
+    kind, engine = _engine
+    if kind is None:
+        raise OCRUnavailable(engine)
+    return _engine
+
+
+def _read_easyocr(reader, img):
+    results = reader.readtext(img, paragraph=False)
+    # 依位置由上而下、由左而右排
+    results.sort(key=lambda r: (min(p[1] for p in r[0]), min(p[0] for p in r[0])))
+    return [(text, float(conf)) for _, text, conf in results]
+
+
+def _read_tesseract(pytesseract, img):
+    data = pytesseract.image_to_data(img, lang="chi_tra+eng", config="--psm 6",
+                                     output_type=pytesseract.Output.DICT)
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if not word.strip() or conf < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append((word, conf / 100.0))
+    return [(" ".join(w for w, _ in words), sum(c for _, c in words) / len(words))
+            for _, words in sorted(lines.items())]
+
+
+def read_roster(image_bytes):
+    """本機辨識名單截圖，回傳 (名字列表, 平均信心度 0~1)
+
+    沒有安裝 OCR 引擎時丟出 OCRUnavailable。
+    """
+    kind, engine = get_engine()
+    img = preprocess(image_bytes)
+    if kind == "easyocr":
+        with _lock:   # easyocr 的 Reader 不保證 thread-safe，同時上傳時排隊 (推論本身會用多核心)
+            lines = _read_easyocr(engine, img)
+    else:
+        lines = _read_tesseract(engine, img)   # 每次都是獨立的 tesseract 子程序，可以平行
+    names = filter_names(lines)
+    if not names:
+        return [], 0.0
+    return [n for n, _ in names], sum(c for _, c in names) / len(names)
@@ -0,0 +1,158 @@
+import numpy as np
+
+# id 在這個範圍內用 NumPy 矩陣，超過就改用 dict 稀疏儲存
+DENSE_LIMIT = 400
+
+
+def pair_key(a, b):
+    """存檔用的 key (小 id 在前)"""
+    return f"{min(a, b)},{max(a, b)}"
+
+
+class PairMatrix:
+    """搭檔/對手次數矩陣 (以球員 id 為索引)
+
+    每打完一場只更新 6 個格子 (2 組搭檔 + 4 組對手)，查詢任何一組四人的
+    重複程度也只要固定 6 次查表，和歷史紀錄長度無關。
+    """
+
+    def __init__(self, capacity=64):
+        self.dense = True
+        self.partner = np.zeros((capacity, capacity), dtype=np.int32)
+        self.opponent = np.zeros((capacity, capacity), dtype=np.int32)
+        self._sparse = {}   # (小 id, 大 id) -> [搭檔次數, 對手次數]
+
+    def _ensure(self, pid):
+        if not self.dense:
+            return
+        if pid >= DENSE_LIMIT:
+            self._to_sparse()
+            return
+        size = len(self.partner)
+        if pid < size:
+            return
+        new_size = min(max(size * 2, pid + 1), DENSE_LIMIT)
+        for attr in ("partner", "opponent"):
+            old = getattr(self, attr)
+            grown = np.zeros((new_size, new_size), dtype=np.int32)
+            grown[:size, :size] = old
+            setattr(self, attr, grown)
+
+    def _to_sparse(self):
+        for a, b in zip(*np.nonzero(np.triu(self.partner + self.opponent, 1))):
+            self._sparse[(int(a), int(b))] = [int(self.partner[a, b]), int(self.opponent[a, b])]
+        self.dense = False
+        self.partner = self.opponent = None
+
+    def _add(self, a, b, kind):
+        if a == b:
+            return
+        if self.dense:
+            m = self.partner if kind == 0 else self.opponent
+            m[a, b] += 1
+            m[b, a] += 1
+        else:
+            key = (a, b) if a < b else (b, a)
+            self._sparse.setdefault(key, [0, 0])[kind] += 1
+
+    def _set(self, a, b, p, o):
+        if self.dense:
+            self.partner[a, b] = self.partner[b, a] = p
+            self.opponent[a, b] = self.opponent[b, a] = o
+        else:
+            self._sparse[(min(a, b), max(a, b))] = [p, o]
+
+    def counts(self, a, b):
+        """回傳 (搭檔次數, 對手次數)"""
+        if self.dense:
+            if max(a, b) >= len(self.partner):
+                return 0, 0
+            return int(self.partner[a, b]), int(self.opponent[a, b])
+        key = (a, b) if a < b else (b, a)
+        p, o = self._sparse.get(key, (0, 0))
+        return p, o
+
+    def record(self, pids):
+        """記錄一場比賽，pids 為 [隊伍1, 隊伍1, 隊伍2, 隊伍2]，回傳有變動的 (a, b)"""
+        for pid in pids:
+            self._ensure(pid)
+        a, b, c, d = pids
+        self._add(a, b, 0)
+        self._add(c, d, 0)
+        for x in (a, b):
+            for y in (c, d):
+                self._add(x, y, 1)
+        return [(a, b), (c, d), (a, c), (a, d), (b, c), (b, d)]
+
+    def drop(self, pid):
+        """清掉某人的整列/整欄 (球員移除時)，回傳被刪掉的存檔 key"""
+        if self.dense:
+            if pid >= len(self.partner):
+                return []
+            others = np.flatnonzero(self.partner[pid] + self.opponent[pid])
+            for m in (self.partner, self.opponent):
+                m[pid, :] = 0
+                m[:, pid] = 0
+            return [pair_key(pid, int(other)) for other in others]
+        keys = [key for key in self._sparse if pid in key]
+        for key in keys:
+            del self._sparse[key]
+        return [pair_key(*key) for key in keys]
+
+    def max_id(self):
+        """有紀錄的最大 id (沒有紀錄時 -1)"""
+        if self.dense:
+            used = np.flatnonzero((self.partner + self.opponent).any(axis=0))
+            return int(used[-1]) if len(used) else -1
+        return max((b for _, b in self._sparse), default=-1)
+
+    def met(self, pids):
+        """這群人彼此之間已經同場 (搭檔 + 對手) 的總次數"""
+        total = 0
+        for i in range(len(pids)):
+            for j in range(i + 1, len(pids)):
+                p, o = self.counts(pids[i], pids[j])
+                total += p + o
+        return total
+
+    def submatrix(self, pids):
+        """取出候選池之間的 (搭檔, 對手) 子矩陣，給批次評分用"""
+        n = len(pids)
+        if self.dense:
+            idx = np.asarray(pids, dtype=np.intp)
+            size = len(self.partner)
+            inside = idx < size
+            partner = np.zeros((n, n), dtype=np.int32)
+            opponent = np.zeros((n, n), dtype=np.int32)
+            ix = np.flatnonzero(inside)
+            sub = np.ix_(idx[ix], idx[ix])
+            partner[np.ix_(ix, ix)] = self.partner[sub]
+            opponent[np.ix_(ix, ix)] = self.opponent[sub]
+            return partner, opponent
+
+        partner = np.zeros((n, n), dtype=np.int32)
+        opponent = np.zeros((n, n), dtype=np.int32)
+        for i in range(n):
+            for j in range(i + 1, n):
+                p, o = self.counts(pids[i], pids[j])
+                if p or o:
+                    partner[i, j] = partner[j, i] = p
+                    opponent[i, j] = opponent[j, i] = o
+        return partner, opponent
+
+    def to_dict(self):
+        if self.dense:
+            pairs = {}
+            for a, b in zip(*np.nonzero(np.triu(self.partner + self.opponent, 1))):
+                pairs[f"{a},{b}"] = [int(self.partner[a, b]), int(self.opponent[a, b])]
+            return pairs
+        return {f"{a},{b}": list(v) for (a, b), v in self._sparse.items()}
+
+    @classmethod
+    def from_dict(cls, pairs):
+        m = cls()
+        for key, (p, o) in pairs.items():
+            a, b = (int(x) for x in key.split(","))
+            m._ensure(max(a, b))
+            m._set(a, b, p, o)
+        return m
@@ -0,0 +1,344 @@
+"""整晚固定輪次的排程 (聯賽夜、固定時段租場)
+
+    python planner.py --players 40 --courts 6 --rounds 20 --csv plan.csv
+
+和現場的即時輪替不同，一次排好每一輪每面場地的四人與分隊，可以印出來貼在場邊。
+成本 = 場次平均 + 兩隊戰力差 + 重複搭檔/對手 + 連續休息，不相容的組合
+(死亡之組 + 休閒組) 給很大的懲罰。用模擬退火做區域搜尋，每一步只重算
+被動到的一兩面場地，40 人 × 6 面場 × 20 輪幾秒內就能排完。
+"""
+import argparse
+import csv
+import html
+import io
+import math
+import random
+import time
+
+import assignment
+import ratings
+from scheduler import DEFAULT_LEVEL, LEVELS
+
+FAIR_WEIGHT = 1.0           # 場次平方和 (平均固定，等於變異數)
+BALANCE_WEIGHT = assignment.BALANCE_WEIGHT
+PARTNER_WEIGHT = 1.0        # 每多一次重複搭檔 (整晚排程比較在意，權重比即時輪替高)
+OPPONENT_WEIGHT = 0.2       # 每多一次重複對手
+SIT_STREAK_WEIGHT = 0.5     # 連續兩輪都休息
+INCOMPATIBLE_WEIGHT = 100.0 # 死亡之組與休閒組同場
+
+ITERATIONS = 150_000
+TIME_BUDGET = 10.0          # 秒，時間到就停
+START_TEMP = 2.0
+END_TEMP = 0.01
+
+_DEATH, _CASUAL = 1 << 0, 1 << 2   # 分組 bit (LEVELS 的順序)
+
+
+class Plan:
+    """排好的整晚排程 (名字為單位，可以匯出)"""
+
+    def __init__(self, names, rounds, sitting, cost, stats):
+        self.names = names
+        self.rounds = rounds      # [[(隊伍1, 隊伍2), ...每面場], ...每輪]
+        self.sitting = sitting    # [[休息的人], ...每輪]
+        self.cost = cost
+        self.stats = stats
+
+    def games(self):
+        counts = dict.fromkeys(self.names, 0)
+        for courts in self.rounds:
+            for team1, team2 in courts:
+                for name in team1 + team2:
+                    counts[name] += 1
+        return counts
+
+    def rows(self):
+        """一場一列：輪次、場地、隊伍 1、隊伍 2、本輪休息"""
+        rows = []
+        for r, courts in enumerate(self.rounds, 1):
+            resting = "、".join(self.sitting[r - 1])
+            for c, (team1, team2) in enumerate(courts, 1):
+                rows.append({"輪次": r, "場地": c, "隊伍 1": " + ".join(team1),
+                             "隊伍 2": " + ".join(team2), "休息": resting if c == 1 else ""})
+        return rows
+
+    def to_csv(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=["輪次", "場地", "隊伍 1", "隊伍 2", "休息"])
+        writer.writeheader()
+        writer.writerows(self.rows())
+        return out.getvalue()
+
+    def to_html(self, title="整晚排程"):
+        """可以直接列印的表格：一輪一列，每面場一欄"""
+        n_courts = max((len(c) for c in self.rounds), default=0)
+        esc = html.escape
+        head = "".join(f"<th>場地 {c}</th>" for c in range(1, n_courts + 1))
+        body = []
+        for r, courts in enumerate(self.rounds, 1):
+            cells = "".join(f"<td>{esc(' + '.join(t1))}<br><i>vs</i><br>{esc(' + '.join(t2))}</td>"
+                            for t1, t2 in courts)
+            body.append(f"<tr><th>{r}</th>{cells}<td class='rest'>{esc('、'.join(self.sitting[r - 1]))}</td></tr>")
+        return ("<!doctype html><html lang='zh-Hant'><head><meta charset='utf-8'>"
+                f"<title>{esc(title)}</title><style>"
+                "body{font-family:sans-serif}table{border-collapse:collapse;width:100%}"
+                "th,td{border:1px solid #999;padding:4px 6px;text-align:center;font-size:11pt}"
+                "td.rest{font-size:9pt;color:#555}@media print{tr{page-break-inside:avoid}}"
+                f"</style></head><body><h2>{esc(title)}</h2><table>"
+                f"<tr><th>輪</th>{head}<th>休息</th></tr>{''.join(body)}</table></body></html>")
+
+
+class _Search:
+    """模擬退火的狀態：slots[r] 是第 r 輪場上的人 (每 4 格一面場，[隊伍1, 隊伍1, 隊伍2, 隊伍2])"""
+
+    def __init__(self, n_players, n_courts, n_rounds, strength, masks, enable_balancing, rng):
+        self.n = n_players
+        self.courts = n_courts
+        self.rounds = n_rounds
+        self.strength = strength
+        self.masks = masks
+        self.balancing = enable_balancing
+        self.rng = rng
+        self.partner = [[0] * n_players for _ in range(n_players)]
+        self.opponent = [[0] * n_players for _ in range(n_players)]
+        self.games = [0] * n_players
+        self.slots = []
+        self.sitting = []
+        self.is_sitting = []   # [r][p]
+        self.cost = 0.0
+
+    # --- 初始解：每輪挑場次最少的人，同分組的排在一起 ---
+
+    def seed(self):
+        order = list(range(self.n))
+        for _ in range(self.rounds):
+            self.rng.shuffle(order)
+            order.sort(key=lambda p: self.games[p])
+            playing = order[:4 * self.courts]
+            playing.sort(key=lambda p: -self.strength[p])
+            slots = []
+            for c in range(self.courts):
+                a, b, c_, d = playing[4 * c:4 * c + 4]
+                slots += [a, d, b, c_]   # 最強 + 最弱 vs 中間兩位
+            self.slots.append(slots)
+            playing = set(slots)
+            self.sitting.append([p for p in range(self.n) if p not in playing])
+            self.is_sitting.append([p not in playing for p in range(self.n)])
+            for p in slots:
+                self.games[p] += 1
+        self.cost = sum(FAIR_WEIGHT * g * g for g in self.games)
+        for r in range(self.rounds):
+            self.cost += self._sit_cost_all(r)
+            for c in range(self.courts):
+                self.cost += self._add_court(r, c)
+
+    # --- 成本 (都是可以局部增減的) ---
+
+    def _court_cost(self, a, b, c, d):
+        cost = 0.0
+        if self.balancing:
+            s = self.strength
+            cost += BALANCE_WEIGHT * abs(s[a] + s[b] - s[c] - s[d])
+            mask = self.masks[a] | self.masks[b] | self.masks[c] | self.masks[d]
+            if mask & _DEATH and mask & _CASUAL:
+                cost += INCOMPATIBLE_WEIGHT
+        return cost
+
+    def _bump(self, matrix, x, y, step, weight):
+        """次數 +1/-1，回傳重複懲罰的變化 (第一次不算重複)"""
+        row_x, row_y = matrix[x], matrix[y]
+        before = row_x[y]
+        row_x[y] = row_y[x] = before + step
+        if step > 0:
+            return weight if before >= 1 else 0.0
+        return -weight if before >= 2 else 0.0
+
+    def _pairs(self, r, c, step):
+        a, b, c_, d = self.slots[r][4 * c:4 * c + 4]
+        delta = (self._bump(self.partner, a, b, step, PARTNER_WEIGHT)
+                 + self._bump(self.partner, c_, d, step, PARTNER_WEIGHT))
+        for x in (a, b):
+            for y in (c_, d):
+                delta += self._bump(self.opponent, x, y, step, OPPONENT_WEIGHT)
+        return delta, self._court_cost(a, b, c_, d)
+
+    def _add_court(self, r, c):
+        delta, court = self._pairs(r, c, 1)
+        return delta + court
+
+    def _remove_court(self, r, c):
+        delta, court = self._pairs(r, c, -1)
+        return delta - court
+
+    def _sit_cost(self, r, p):
+        """第 r 輪的休息狀態，和前後輪造成的連續休息懲罰"""
+        if not self.is_sitting[r][p]:
+            return 0.0
+        streak = 0
+        if r > 0 and self.is_sitting[r - 1][p]:
+            streak += 1
+        if r + 1 < self.rounds and self.is_sitting[r + 1][p]:
+            streak += 1
+        return SIT_STREAK_WEIGHT * streak
+
+    def _sit_cost_all(self, r):
+        # 只算和上一輪的連續，避免每一對被算兩次
+        if r == 0:
+            return 0.0
+        prev, cur = self.is_sitting[r - 1], self.is_sitting[r]
+        return SIT_STREAK_WEIGHT * sum(1 for p in range(self.n) if prev[p] and cur[p])
+
+    # --- 兩種移動 ---
+
+    def swap_slots(self, r, i, j):
+        """同一輪兩個位置互換 (換場地或換隊伍)，回傳成本變化"""
+        ci, cj = i // 4, j // 4
+        delta = self._remove_court(r, ci)
+        if cj != ci:
+            delta += self._remove_court(r, cj)
+        slots = self.slots[r]
+        slots[i], slots[j] = slots[j], slots[i]
+        delta += self._add_court(r, ci)
+        if cj != ci:
+            delta += self._add_court(r, cj)
+        return delta
+
+    def swap_sitter(self, r, i, k):
+        """第 r 輪場上位置 i 的人和休息的第 k 位互換，回傳成本變化"""
+        slots, sitting, flags = self.slots[r], self.sitting[r], self.is_sitting[r]
+        p, q = slots[i], sitting[k]
+        c = i // 4
+        g = self.games
+        delta = self._remove_court(r, c)
+        # 場次平方和：p 少一場、q 多一場
+        delta += FAIR_WEIGHT * ((g[p] - 1) ** 2 - g[p] ** 2 + (g[q] + 1) ** 2 - g[q] ** 2)
+        delta -= self._sit_cost(r, q)
+        slots[i], sitting[k] = q, p
+        flags[p], flags[q] = True, False
+        g[p] -= 1
+        g[q] += 1
+        delta += self._sit_cost(r, p)
+        delta += self._add_court(r, c)
+        return delta
+
+    def anneal(self, iterations, time_budget):
+        rng = self.rng
+        n_slots = 4 * self.courts
+        best_cost = self.cost
+        best = ([list(s) for s in self.slots], [list(s) for s in self.sitting])
+        deadline = time.perf_counter() + time_budget
+        ratio = END_TEMP / START_TEMP
+        for it in range(iterations):
+            if it % 2048 == 0 and time.perf_counter() > deadline:
+                break
+            temp = START_TEMP * ratio ** (it / iterations)
+            r = rng.randrange(self.rounds)
+            if self.sitting[r] and rng.random() < 0.5:
+                i, k = rng.randrange(n_slots), rng.randrange(len(self.sitting[r]))
+                delta = self.swap_sitter(r, i, k)
+                if delta > 0 and rng.random() >= math.exp(-delta / temp):
+                    self.swap_sitter(r, i, k)   # 換回來
+                    continue
+            else:
+                i, j = rng.randrange(n_slots), rng.randrange(n_slots)
+                if i // 2 == j // 2:
+                    continue   # 同一隊的兩人互換沒有差別
+                delta = self.swap_slots(r, i, j)
+                if delta > 0 and rng.random() >= math.exp(-delta / temp):
+                    self.swap_slots(r, i, j)
+                    continue
+            self.cost += delta
+            if self.cost < best_cost - 1e-9:
+                best_cost = self.cost
+                best = ([list(s) for s in self.slots], [list(s) for s in self.sitting])
+        return best, best_cost
+
+
+def _stats(search, slots_by_round, names, levels):
+    games = [0] * len(names)
+    partner = {}
+    max_diff = 0.0
+    incompatible = 0
+    for slots in slots_by_round:
+        for c in range(0, len(slots), 4):
+            a, b, c_, d = slots[c:c + 4]
+            for p in (a, b, c_, d):
+                games[p] += 1
+            for x, y in ((a, b), (c_, d)):
+                key = (min(x, y), max(x, y))
+                partner[key] = partner.get(key, 0) + 1
+            s = search.strength
+            max_diff = max(max_diff, abs(s[a] + s[b] - s[c_] - s[d]) / 2)
+            lv = {levels[p] for p in (a, b, c_, d)}
+            if "死亡之組" in lv and "休閒組" in lv:
+                incompatible += 1
+    return {
+        "games_min": min(games),
+        "games_max": max(games),
+        "repeat_partners": sum(n - 1 for n in partner.values() if n > 1),
+        "max_team_diff": round(max_diff, 1),
+        "incompatible": incompatible,
+    }
+
+
+def plan_evening(players, n_courts, n_rounds, enable_balancing=True, seed=None,
+                 iterations=ITERATIONS, time_budget=TIME_BUDGET):
+    """排出整晚的固定輪次
+
+    players: [(名字, 分組, 戰力或 None)]，戰力是 None 時用分組的起始分。
+    場地比人數能打的多時，每輪只用得到的場地數 (人數 // 4)。
+    """
+    players = list(players)
+    n_courts = min(n_courts, len(players) // 4)
+    if n_courts < 1 or n_rounds < 1:
+        raise ValueError("至少要 4 位球員、1 面場地、1 輪")
+    names = [p[0] for p in players]
+    levels = [p[1] or DEFAULT_LEVEL for p in players]
+    strength = [p[2] if p[2] is not None else ratings.initial_rating(lv)
+                for p, lv in zip(players, levels)]
+    masks = [1 << LEVELS.index(lv) if lv in LEVELS else 1 << 1 for lv in levels]
+
+    search = _Search(len(players), n_courts, n_rounds, strength, masks, enable_balancing,
+                     random.Random(seed))
+    search.seed()
+    (slots_by_round, sitting), cost = search.anneal(iterations, time_budget)
+
+    rounds = []
+    for slots in slots_by_round:
+        rounds.append([(tuple(names[p] for p in slots[c:c + 2]), tuple(names[p] for p in slots[c + 2:c + 4]))
+                       for c in range(0, len(slots), 4)])
+    sitting_names = [sorted(names[p] for p in s) for s in sitting]
+    return Plan(names, rounds, sitting_names, cost, _stats(search, slots_by_round, names, levels))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="整晚固定輪次排程 (用隨機球員測試速度與品質)")
+    parser.add_argument("--players", type=int, default=40)
+    parser.add_argument("--courts", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="把排程存成 CSV")
+    parser.add_argument("--html", help="把排程存成可列印的 HTML")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    players = []
+    for i in range(args.players):
+        level = rng.choice(LEVELS)
+        players.append((f"P{i:03d}", level, ratings.initial_rating(level) + rng.gauss(0, 100)))
+    t0 = time.perf_counter()
+    plan = plan_evening(players, args.courts, args.rounds, seed=args.seed)
+    print(f"{args.players} 人 / {args.courts} 面場 / {args.rounds} 輪: {time.perf_counter() - t0:.2f} 秒")
+    print(f"  場次 {plan.stats['games_min']}~{plan.stats['games_max']}  "
+          f"重複搭檔 {plan.stats['repeat_partners']} 次  最大分差 {plan.stats['max_team_diff']}  "
+          f"不相容 {plan.stats['incompatible']} 場")
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8-sig", newline="") as f:
+            f.write(plan.to_csv())
+    if args.html:
+        with open(args.html, "w", encoding="utf-8") as f:
+            f.write(plan.to_html())
+
+
+if __name__ == "__main__":
+    main()
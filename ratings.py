@@ -0,0 +1,33 @@
+import numpy as np
+
+# 沒打過計分賽的人，用原本的分組當起始戰力 (相鄰分組差 200 分)
+LEVEL_RATINGS = {"死亡之組": 1700.0, "有點累組": 1500.0, "休閒組": 1300.0}
+DEFAULT_RATING = 1500.0
+K_FACTOR = 32.0
+
+
+def initial_rating(level):
+    return LEVEL_RATINGS.get(level, DEFAULT_RATING)
+
+
+def expected_score(team_rating, opp_rating):
+    """Elo 期望勝率 (可以是 NumPy 陣列)"""
+    return 1.0 / (1.0 + 10.0 ** ((np.asarray(opp_rating) - np.asarray(team_rating)) / 400.0))
+
+
+def elo_update(ratings, team1_won, rated_games=None):
+    """依比賽結果更新四人的戰力
+
+    ratings: [隊伍1, 隊伍1, 隊伍2, 隊伍2] 的戰力。隊伍戰力取兩人平均，
+    兩人得到相同的變動量。rated_games 給定時，前幾場的 K 值加倍，
+    讓新朋友的分數快點收斂到真實程度。回傳新的四個戰力 (NumPy 陣列)。
+    """
+    r = np.asarray(ratings, dtype=float)
+    t1, t2 = r[:2].mean(), r[2:].mean()
+    exp1 = expected_score(t1, t2)
+    delta = (1.0 if team1_won else 0.0) - exp1
+
+    k = np.full(4, K_FACTOR)
+    if rated_games is not None:
+        k = np.where(np.asarray(rated_games) < 5, 2 * K_FACTOR, K_FACTOR)
+    return r + k * np.array([delta, delta, -delta, -delta])
@@ -0,0 +1,167 @@
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import imagecache
+import metrics
+import ocr
+
+MAX_WORKERS = 4   # 一次最多同時辨識幾張 (整個程式共用)
+
+OPENAI_PROMPT = ("請辨識這張 Line 投票截圖中的人員名單。請忽略時間、電量、'打'、'不打'等標題文字。"
+                 "只回傳名字列表，一行一個名字。不要包含編號或任何 Markdown 符號。")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="roster-import")
+    return _executor
+
+
+class QuotaBudget:
+    """一批匯入可以用掉的 OpenAI 次數 (多個執行緒一起扣)"""
+
+    def __init__(self, remaining):
+        self.remaining = remaining
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def give_back(self):
+        with self._lock:
+            self.remaining += 1
+
+
+@metrics.timed("openai.vision_ms")
+def call_openai_vision(client, image_bytes):
+    """使用 OpenAI GPT-4o 辨識圖片中的人員名單"""
+    # 先縮小再轉 Base64，上傳量和延遲都小很多
+    image_bytes, mime = imagecache.shrink_image(image_bytes)
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+
+    response = client.chat.completions.create(
+        model="gpt-4o",  # 使用具備視覺能力的模型
+        messages=[
+            {"role": "system", "content": "你是一個協助整理名單的助手。"},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": OPENAI_PROMPT},
+                    {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{base64_image}"}},
+                ],
+            },
+        ],
+        max_tokens=500,
+    )
+    content = response.choices[0].message.content or ""
+    return [line.strip() for line in content.split('\n') if line.strip()]
+
+
+def recognize_image(image_bytes, cache, client, budget):
+    """辨識一張截圖 (在背景執行緒跑，不碰 Streamlit)
+
+    同一張圖辨識過就直接用快取；否則先用本機 OCR，信心度不夠 (或沒裝 OCR)
+    才用 OpenAI。回傳 dict: names, source, openai_calls, errors。
+    """
+    result = {"names": [], "source": "", "openai_calls": 0, "errors": []}
+    key = imagecache.image_key(image_bytes)
+    cached = cache.get(key)
+    if cached:
+        metrics.count("ocr.cache_hits")
+        result.update(names=cached["names"], source=f"{cached['source']}，快取")
+        return result
+
+    local_names = []
+    try:
+        with metrics.timer("ocr.local_ms"):
+            local_names, confidence = ocr.read_roster(image_bytes)
+        if local_names and confidence >= ocr.MIN_CONFIDENCE:
+            result.update(names=local_names, source=f"本機 OCR (信心度 {confidence:.0%})")
+            cache.put(key, {"names": local_names, "source": result["source"]})
+            return result
+    except ocr.OCRUnavailable:
+        pass
+    except Exception as e:
+        result["errors"].append(f"本機辨識失敗: {e}")
+
+    if client is None or not budget.take():
+        if local_names:
+            # 信心度低的本機結果也比沒有好，交給使用者勾選；
+            # 不存快取，之後有額度時重傳還能改用 OpenAI
+            result.update(names=local_names, source="本機 OCR (信心度偏低，請仔細確認)")
+        elif client is None:
+            result["errors"].append("本機 OCR 無法使用，也沒有設定 OPENAI_API_KEY")
+        else:
+            result["errors"].append("今日 OpenAI 使用額度已用完，請明天再試")
+        return result
+
+    try:
+        names = call_openai_vision(client, image_bytes)
+    except Exception as e:
+        budget.give_back()
+        result["errors"].append(f"OpenAI API 呼叫失敗: {e}")
+        result.update(names=local_names, source="本機 OCR (信心度偏低，請仔細確認)" if local_names else "")
+        return result
+    result.update(names=names, source="OpenAI", openai_calls=1)
+    if names:
+        cache.put(key, {"names": names, "source": "OpenAI"})
+    return result
+
+
+class ImportBatch:
+    """一次上傳的多張截圖，丟到背景執行緒同時辨識
+
+    呼叫端定期 poll()，完成的結果會依序合併進 names (去掉重複)，
+    畫面不用等全部辨識完才能操作。
+    """
+
+    def __init__(self, files, cache, client, openai_quota):
+        """files: [(檔名, bytes)]"""
+        self.budget = QuotaBudget(openai_quota)
+        self.jobs = [(name, executor().submit(recognize_image, data, cache, client, self.budget))
+                     for name, data in files]
+        self.names = []
+        self._seen = set()
+        self._harvested = set()
+
+    @property
+    def total(self):
+        return len(self.jobs)
+
+    @property
+    def finished(self):
+        return len(self._harvested)
+
+    @property
+    def done(self):
+        return self.finished == self.total
+
+    def poll(self):
+        """收下新完成的結果，回傳 [(檔名, 結果 dict)]"""
+        new = []
+        for i, (name, future) in enumerate(self.jobs):
+            if i in self._harvested or not future.done():
+                continue
+            self._harvested.add(i)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"names": [], "source": "", "openai_calls": 0, "errors": [str(e)]}
+            for n in result["names"]:
+                n = ocr.clean_line(n)
+                if n and n not in self._seen:
+                    self._seen.add(n)
+                    self.names.append(n)
+            new.append((name, result))
+        return new
@@ -0,0 +1,813 @@
+import heapq
+import random
+import time
+
+import numpy as np
+
+import assignment
+import metrics
+import ratings
+from analytics import SessionStats, night_of
+from durations import DurationModel
+from matchlog import MatchLog, MatchRecord
+from pairing import PairMatrix, pair_key
+
+LEVELS = ["死亡之組", "有點累組", "休閒組"]
+DEFAULT_LEVEL = "有點累組"
+LEVEL_ICONS = {"死亡之組": "💀", "有點累組": "😓", "休閒組": "☕"}
+REPEAT_SLACK = 4  # 挑人時每個分組多看幾位，用來避開重複的搭檔/對手
+STAGE_LEAD = 180  # 預計結束前幾秒才預告下一組 (太早挑，剛下場的人就排不進去)
+WAIT_CREDIT = 2.0      # 排隊時每等一小時，相當於少打幾場
+PRIORITY_SLACK = 0.5   # 排隊分數差不到這麼多 (場) 視為一樣，可以互換來避開重複搭檔
+DEFAULT_RATE = 3.0     # 還沒算出來之前，假設每人每小時可以打幾場
+RATE_TOLERANCE = 0.15  # 應得場數的速率變動超過 15% 才重排整個休息區
+
+
+class Player:
+    """單一球員紀錄 (用 __slots__ 省掉每個物件的 dict)
+
+    時間都是 epoch 秒：arrived 今晚到場、last_end 上一場結束 (還沒打過或剛從
+    暫離回來時是那個時間點)、active_time 之前幾段可上場的累計秒數、
+    active_since 這一段從何時開始可上場 (暫離中為 None)。
+    """
+    __slots__ = ("id", "name", "level", "games", "active", "rating", "rated_games",
+                 "arrived", "last_end", "active_time", "active_since")
+
+    def __init__(self, pid, name, level=DEFAULT_LEVEL, games=0, active=True, rating=None, rated_games=0,
+                 arrived=None, last_end=None, active_time=0.0, active_since=None):
+        self.id = pid
+        self.name = name
+        self.level = level
+        self.games = games
+        self.active = active
+        # 還沒有計分紀錄時，用分組當起始戰力
+        self.rating = ratings.initial_rating(level) if rating is None else rating
+        self.rated_games = rated_games
+        self.arrived = arrived
+        self.last_end = arrived if last_end is None else last_end
+        self.active_time = active_time
+        self.active_since = active_since if active else None
+
+    def active_seconds(self, now):
+        """今晚可上場 (含在場上) 的累計秒數"""
+        since = self.active_since
+        return self.active_time + (now - since if since is not None else 0.0)
+
+    def to_dict(self):
+        return {'id': self.id, 'games': self.games, 'active': self.active, 'level': self.level,
+                'rating': round(self.rating, 1), 'rated_games': self.rated_games,
+                'arrived': self.arrived, 'last_end': self.last_end,
+                'active_time': round(self.active_time, 1), 'active_since': self.active_since}
+
+
+class CandidateIndex:
+    """休息區索引：依分組分桶，每桶一個以 (排隊分數, 同分順序, id) 排序的 heap
+
+    只收「可上場且不在場上」的球員。更新時直接推入新 entry，舊 entry 留在
+    heap 裡等取出時才丟掉 (lazy deletion)，所以每次更新都是 O(log n)。
+    """
+
+    def __init__(self):
+        self._heaps = {lv: [] for lv in LEVELS}
+        self._entry = {}   # id -> 目前有效的 entry
+        self._bucket = {}  # id -> 所在分組
+
+    def __len__(self):
+        return len(self._entry)
+
+    def __contains__(self, pid):
+        return pid in self._entry
+
+    def key(self, pid):
+        return self._entry[pid][0]
+
+    def push(self, pid, key, level, tie=0):
+        """加入或更新球員 (tie 是同分時的順序，由呼叫端決定)"""
+        bucket = level if level in self._heaps else DEFAULT_LEVEL
+        old = self._entry.get(pid)
+        if old is not None and old[:2] == (key, tie) and self._bucket[pid] == bucket:
+            return
+        entry = (key, tie, pid)
+        self._entry[pid] = entry
+        self._bucket[pid] = bucket
+        heap = self._heaps[bucket]
+        heapq.heappush(heap, entry)
+        if len(heap) > 2 * len(self._entry) + 16:
+            self._compact(bucket)
+
+    def discard(self, pid):
+        self._entry.pop(pid, None)
+        self._bucket.pop(pid, None)
+
+    def _compact(self, bucket):
+        heap = [e for e in self._heaps[bucket] if self._entry.get(e[2]) == e]
+        heapq.heapify(heap)
+        self._heaps[bucket] = heap
+
+    def top(self, bucket, k, skip=()):
+        """取出該分組排名最前的 k 個有效 entry (略過 skip)，O((k + |skip|) log n)"""
+        heap = self._heaps[bucket]
+        keep, out = [], []
+        while heap and len(out) < k:
+            entry = heapq.heappop(heap)
+            if self._entry.get(entry[2]) != entry:
+                continue  # 過期的 entry 直接丟掉
+            keep.append(entry)
+            if entry[2] not in skip:
+                out.append(entry)
+        for entry in keep:
+            heapq.heappush(heap, entry)
+        return out
+
+    def ordered(self):
+        """全部候位者依排名排序 (給休息區顯示用)"""
+        return [e[2] for e in sorted(self._entry.values())]
+
+
+class Scheduler:
+    """不依賴 Streamlit 的排程核心
+
+    球員以整數 id 識別，場地上存的也是 id；名字只在進出 (UI / 存檔) 時轉換。
+    所有方法只改自己的狀態並回傳結果，訊息顯示與存檔交給呼叫端。
+    """
+
+    def __init__(self, enable_balancing=True, rng=None, clock=None):
+        self.players = {}       # id -> Player
+        self.ids = {}           # name -> id
+        self.courts = {1: [], 2: []}
+        self.court_status = {1: "EDITING", 2: "EDITING"}
+        self.court_started = {} # 場地 -> 開打時間 (epoch 秒)
+        self.history = MatchLog()
+        self.durations = DurationModel()
+        self.staged = {}        # 場地 -> 預告的下一組 (id)，場地一空就直接上
+        self.clock = clock or time.time
+        self.stats = SessionStats(started=self.clock())   # 今晚的統計 (每打完一場更新)
+        self.closed_nights = []   # 換日時收起來的前幾晚統計 (呼叫端存好後清掉)
+        self.enable_balancing = enable_balancing
+        self.rng = rng or random.Random()
+        self.seed = self.rng.getrandbits(32)   # 存進存檔：分隊/預覽的亂數由它和狀態內容決定
+        self.index = CandidateIndex()
+        self.pairs = PairMatrix()
+        self._court_of = {}     # id -> 所在場地
+        self.next_id = 0        # 下一個新球員的 id (只增不減，移除的人的 id 不會再發出去)
+        self.version = 0        # 影響排程的修改都會 +1 (預覽快取用)
+        self._preview = None
+        self._epoch = self.clock()   # 排隊分數的時間原點 (只在這個程式裡比較，不存檔)
+        self.rate = DEFAULT_RATE     # 每人每小時應得幾場 (依場地數、人數、比賽時間估)
+        self._rate_version = None
+
+    # --- 存檔轉換 ---
+
+    @classmethod
+    def from_dict(cls, data, enable_balancing=True, rng=None, clock=None):
+        """從存檔格式 (名字為 key) 建立"""
+        sched = cls(enable_balancing=enable_balancing, rng=rng, clock=clock)
+        sched.reload(data)
+        return sched
+
+    def reload(self, data):
+        """整份換成存檔的內容 (別台裝置修改後同步用)，設定與亂數產生器不變"""
+        version = self.version
+        self.players = {}
+        self.ids = {}
+        self.courts = {}
+        self.court_status = {}
+        self.court_started = {}
+        self.index = CandidateIndex()
+        self._court_of = {}
+        self.seed = data.get("seed", 0)
+        self.next_id = data.get("next_id", 0)
+        now = self.clock()
+        for name, p in data.get("players", {}).items():
+            # 舊存檔沒有時間欄位：當作現在才到
+            active = p.get('active', True)
+            self._insert(name, p.get('level', DEFAULT_LEVEL), p.get('games', 0),
+                         active, pid=p.get('id'),
+                         rating=p.get('rating'), rated_games=p.get('rated_games', 0),
+                         arrived=p.get('arrived', now), last_end=p.get('last_end'),
+                         active_time=p.get('active_time', 0.0),
+                         active_since=p.get('active_since', now) if active else None)
+        for c_id, names in data.get("courts", {}).items():
+            # 兩台裝置同時把同一人排上不同場地時，只留在第一個場地
+            pids = [self.ids[n] for n in names if n in self.ids]
+            self._set_court(int(c_id), [pid for pid in pids if pid not in self._court_of])
+        for c_id, status in data.get("court_status", {}).items():
+            self.court_status[int(c_id)] = status
+        for c_id in self.courts:
+            self.court_status.setdefault(c_id, "EDITING")
+        if not self.courts:
+            self.courts = {1: [], 2: []}
+            self.court_status = {1: "EDITING", 2: "EDITING"}
+        for c_id, started in data.get("court_started", {}).items():
+            self.court_started[int(c_id)] = started
+        self.history = MatchLog(MatchRecord.from_dict(x) for x in data.get("history", []))
+        self.pairs = PairMatrix.from_dict(data.get("pairs", {}))
+        # 舊存檔沒有 next_id：至少跳過搭檔紀錄裡出現過的 id
+        self.next_id = max(self.next_id, self.pairs.max_id() + 1)
+        self.durations = DurationModel.from_dict(data.get("durations"))
+        if "stats" in data:
+            self.stats = SessionStats.from_dict(data["stats"])
+        else:
+            # 舊存檔：從還留著的比賽紀錄重建
+            self.stats = SessionStats.rebuild(
+                self.history, lambda n: self.get(n).level if self.get(n) else DEFAULT_LEVEL)
+        self.staged = {}
+        for c_id, names in data.get("staged", {}).items():
+            if int(c_id) in self.courts and all(n in self.ids for n in names):
+                self.staged[int(c_id)] = [self.ids[n] for n in names]
+        self.version = max(self.version, version) + 1
+        self._preview = None
+
+    def to_dict(self):
+        return {
+            "players": {p.name: p.to_dict() for p in self.players.values()},
+            "next_id": self.next_id,
+            "seed": self.seed,
+            "courts": {c_id: self.names(p_list) for c_id, p_list in self.courts.items()},
+            "court_status": dict(self.court_status),
+            "court_started": dict(self.court_started),
+            "history": self.history.to_list(),
+            "pairs": self.pairs.to_dict(),
+            "durations": self.durations.to_dict(),
+            "stats": self.stats.to_dict(),
+            "staged": {c_id: self.names(pids) for c_id, pids in self.staged.items()},
+        }
+
+    # --- 查詢 ---
+
+    def get(self, name):
+        pid = self.ids.get(name)
+        return self.players[pid] if pid is not None else None
+
+    def names(self, pids):
+        return [self.players[pid].name for pid in pids]
+
+    def court_names(self, court_id):
+        return self.names(self.courts.get(court_id, []))
+
+    def on_court(self):
+        return set(self._court_of)
+
+    def waiting(self):
+        """休息區 (可上場但不在場上) 的球員，依排隊順序"""
+        self._refresh_rate()
+        return [self.players[pid] for pid in self.index.ordered()]
+
+    def games_per_hour(self, p, now=None):
+        """可上場時間內平均每小時打幾場 (剛到不滿 15 分鐘的用 15 分鐘算)"""
+        now = self.clock() if now is None else now
+        return p.games / max(p.active_seconds(now), 900.0) * 3600.0
+
+    def fairness(self, now=None):
+        """休息區的公平度摘要: 每小時場數範圍、最久等了幾秒、應得速率"""
+        now = self.clock() if now is None else now
+        # 剛到不久的人場次還沒意義，可上場滿 30 分鐘才列入
+        rates = [self.games_per_hour(p, now) for p in self.players.values()
+                 if p.active and p.active_seconds(now) >= 1800]
+        waiting = [self.players[pid] for pid in self.index.ordered()]
+        return {
+            "rate": self.rate,
+            "gph_min": min(rates) if rates else 0.0,
+            "gph_max": max(rates) if rates else 0.0,
+            "longest_wait": max((now - p.last_end for p in waiting), default=0.0),
+        }
+
+    def pair_updates(self, pids):
+        """這四人之間 6 組搭檔/對手的目前次數 {存檔 key: [搭檔, 對手]}"""
+        out = {}
+        for i in range(len(pids)):
+            for j in range(i + 1, len(pids)):
+                out[pair_key(pids[i], pids[j])] = list(self.pairs.counts(pids[i], pids[j]))
+        return out
+
+    def level_of(self, pid):
+        return self.players[pid].level or DEFAULT_LEVEL
+
+    def _rng(self, *parts):
+        """由狀態內容決定的亂數 (parts 都是整數)：同樣的狀態重算幾次、在哪台裝置上算都一樣"""
+        return random.Random(hash((self.seed,) + parts))
+
+    # --- 人員管理 ---
+
+    def _insert(self, name, level, games=0, active=True, pid=None, rating=None, rated_games=0,
+                arrived=None, last_end=None, active_time=0.0, active_since=None):
+        if pid is None or pid in self.players:
+            pid = self.next_id
+        self.next_id = max(self.next_id, pid + 1)
+        if arrived is None:
+            arrived = self.clock()
+            active_since = arrived
+        p = Player(pid, name, level, games, active, rating, rated_games,
+                   arrived, last_end, active_time, active_since)
+        self.players[pid] = p
+        self.ids[name] = pid
+        self._reindex(pid)
+        return p
+
+    def _reindex(self, pid):
+        """球員的場次/分組/出席/場地有變時，同步休息區索引"""
+        self.version += 1
+        p = self.players.get(pid)
+        if p is not None and p.active and pid not in self._court_of:
+            self.index.push(pid, self.priority(p), self.level_of(pid), self._tiebreak(p))
+        else:
+            self.index.discard(pid)
+
+    def _tiebreak(self, p):
+        """排隊分數相同時的順序：由存檔的 seed、id 與場次算出來
+
+        每打一場換一次 (不會老是同一個人先上)，但同樣的狀態在每台裝置、每次
+        同步重建索引後都一樣，休息區順序和預覽不會因為別台裝置有動作就洗牌。
+        """
+        return hash((self.seed, p.id, p.games))
+
+    def priority(self, p):
+        """排隊分數 (越小越先上)，單位是「場」
+
+        = 已打場數 - 可上場時間應得的場數 - 等待補償。後兩項都是「現在時刻」
+        減掉某個時間點，現在時刻對所有人一樣，所以可以改用只在事件 (下場、
+        暫離、回來) 發生時才變的時間點來算，休息區索引不必隨時間重排。
+        晚到或暫離回來的人只算可上場的時間：不會一來就插到最前面，也不會一直排不到。
+        """
+        since = p.active_since if p.active_since is not None else self.clock()
+        start = since - p.active_time - self._epoch   # 把可上場時間接成一段的起點
+        waited_from = p.last_end - self._epoch
+        return p.games + (self.rate * start + WAIT_CREDIT * waited_from) / 3600.0
+
+    def _target_rate(self):
+        """每人每小時應得幾場 = 每小時的上場名額 / 可上場人數 (人少時最多場場都上)"""
+        seconds = [self.durations.level_estimate(lv) for lv in LEVELS]   # 各分組一場幾秒
+        per_court = 3600.0 / (sum(seconds) / len(seconds))
+        active = sum(1 for p in self.players.values() if p.active)
+        return per_court * min(1.0, 4 * len(self.courts) / max(active, 4))
+
+    def _refresh_rate(self):
+        """人數或場地變動讓應得速率差超過 RATE_TOLERANCE 時，重算整個休息區的分數"""
+        if self._rate_version == self.version:
+            return
+        self._rate_version = self.version
+        rate = self._target_rate()
+        if abs(rate - self.rate) <= RATE_TOLERANCE * self.rate:
+            return
+        self.rate = rate
+        for pid in list(self.index._entry):
+            p = self.players[pid]
+            self.index.push(pid, self.priority(p), self.level_of(pid), self._tiebreak(p))
+        self.version += 1
+        self._rate_version = self.version
+
+    def _set_court(self, court_id, pids):
+        """所有場地名單的修改都經過這裡，才能維持 _court_of、索引與版本"""
+        old = self.courts.get(court_id, [])
+        if court_id in self.courts and len(old) == len(pids) and set(old) == set(pids):
+            # 只是換順序 (例如開打時分隊)，誰有空沒變，預覽不用重算
+            self.courts[court_id] = list(pids)
+            return
+        self.version += 1
+        for pid in old:
+            if self._court_of.get(pid) == court_id:
+                del self._court_of[pid]
+        self.courts[court_id] = list(pids)
+        for pid in pids:
+            self._court_of[pid] = court_id
+        for pid in set(old) | set(pids):
+            self._reindex(pid)
+
+    def add_player(self, name, level=DEFAULT_LEVEL, rating=None, rated_games=0):
+        """新增球員，成功回傳 Player，名字空白或重複回傳 None
+
+        rating / rated_games 給定時沿用 (例如會員名錄裡上次的戰力)。
+        """
+        name = name.strip()
+        if not name or name in self.ids:
+            return None
+        return self._insert(name, level, rating=rating, rated_games=rated_games)
+
+    def remove_player(self, name):
+        """移除球員，回傳 (因此被清空的場地 id, 刪掉的搭檔/對手存檔 key)
+
+        他的 id 不會再給新球員，搭檔/對手紀錄也一起清掉。
+        """
+        pid = self.ids.pop(name, None)
+        if pid is None:
+            return [], []
+        cleared = []
+        c_id = self._court_of.get(pid)
+        if c_id is not None:
+            self._set_court(c_id, [])
+            cleared.append(c_id)
+        del self.players[pid]
+        self.index.discard(pid)
+        dropped = self.pairs.drop(pid)
+        self.version += 1
+        return cleared, dropped
+
+    def edit_player(self, old_name, new_name, new_level, new_games):
+        """編輯球員 (可改名)，新名字已存在時回傳 False"""
+        pid = self.ids.get(old_name)
+        if pid is None:
+            return False
+        if new_name != old_name and new_name in self.ids:
+            return False
+        p = self.players[pid]
+        if p.rated_games == 0 and new_level != p.level:
+            p.rating = ratings.initial_rating(new_level)
+        p.level = new_level
+        p.games = new_games
+        self._reindex(pid)
+        if new_name != old_name:
+            # 場地上存的是 id，改名只要更新名字對照
+            del self.ids[old_name]
+            self.ids[new_name] = pid
+            p.name = new_name
+            self.durations.rename(old_name, new_name)
+            self.stats.rename(old_name, new_name)
+        return True
+
+    def toggle_active(self, name):
+        """暫離 / 回來；暫離的時間不算在可上場時間裡"""
+        p = self.get(name)
+        if p is None:
+            return None
+        now = self.clock()
+        p.active = not p.active
+        if p.active:
+            p.active_since = now
+            p.last_end = max(p.last_end, now)   # 回來後才開始算等待
+        else:
+            p.active_time = p.active_seconds(now)
+            p.active_since = None
+        self._reindex(p.id)
+        return p.active
+
+    # --- 排程 ---
+
+    def is_compatible(self, pids):
+        if not self.enable_balancing:
+            return True
+        levels = {self.level_of(pid) for pid in pids}
+        return not ("死亡之組" in levels and "休閒組" in levels)
+
+    def ratings_of(self, pids):
+        return np.array([self.players[pid].rating for pid in pids], dtype=float)
+
+    @metrics.timed("scheduler.balance_teams_ms")
+    def balance_teams(self, pids):
+        """回傳 [隊伍1, 隊伍1, 隊伍2, 隊伍2] 排列，讓兩隊戰力差最小
+
+        同分時的隨機選擇由這四人和他們的場次決定，重算不會換成另一種分法。
+        """
+        members = sorted(pids)
+        rng = self._rng(*members, *(self.players[pid].games for pid in members))
+        if not self.enable_balancing:
+            p = list(pids)
+            rng.shuffle(p)
+            return p
+
+        # 分隊成本 = 兩隊戰力差 + 重複搭檔/對手懲罰
+        quartet = np.arange(4)[None, :]
+        partner, opponent = self.pairs.submatrix(list(pids))
+        costs = (assignment.BALANCE_WEIGHT * assignment.pairing_diffs(self.ratings_of(pids)[None, :])
+                 + assignment.repeat_penalties(quartet, partner, opponent))[0]
+        # 成本相同 (例如都還是分組起始分) 時隨機挑一種，避免每次都同樣的分法
+        ties = [i for i in range(3) if costs[i] - costs.min() < 1e-9]
+        order = assignment.PAIRINGS[rng.choice(ties)]
+        team1 = [pids[order[0]], pids[order[1]]]
+        team2 = [pids[order[2]], pids[order[3]]]
+        rng.shuffle(team1)
+        rng.shuffle(team2)
+        return team1 + team2 if rng.random() > 0.5 else team2 + team1
+
+    def record_result(self, pids, team1_won):
+        """依比賽結果更新戰力 (pids 為 [隊伍1, 隊伍1, 隊伍2, 隊伍2])"""
+        players = [self.players[pid] for pid in pids]
+        new = ratings.elo_update([p.rating for p in players], team1_won,
+                                 rated_games=[p.rated_games for p in players])
+        for p, r in zip(players, new):
+            p.rating = float(r)
+            p.rated_games += 1
+
+    @metrics.timed("scheduler.next_group_ms")
+    def next_group(self, exclude=(), count=4):
+        """挑出下一組 (排隊分數最小優先，同分隨機)，不足時回傳 None
+
+        候選人來自休息區索引 (已排除場上與暫離的人)。貪婪法只會用到每個分組
+        排名最前的 count 人，所以只從每桶取 count 人合併排序，成本 O(k log n)。
+        """
+        self._refresh_rate()
+        exclude = set(exclude)
+        ranked = []
+        for level in LEVELS:
+            # 多拿幾個同場次的人，給下面換掉重複對手用
+            ranked.extend(self.index.top(level, count + REPEAT_SLACK, skip=exclude))
+        if len(ranked) < count:
+            return None
+        ranked = [e[2] for e in sorted(ranked)]
+
+        for seed in ranked:
+            valid_group = [seed]
+            for other in ranked:
+                if other == seed:
+                    continue
+                if self.is_compatible(valid_group + [other]):
+                    valid_group.append(other)
+                if len(valid_group) == count:
+                    return self.balance_teams(self._reduce_repeats(valid_group, ranked))
+        return None
+
+    def _reduce_repeats(self, group, ranked):
+        """把組內成員換成「排隊分數差不多、但和其他人較少同場」的候選人
+
+        只在分數差不到 PRIORITY_SLACK 的人之間交換，不影響公平性；種子 (排名第一) 不動。
+        """
+        key = self.index.key
+        group = list(group)
+        for i in range(1, len(group)):
+            current = group[i]
+            best, best_met = current, self.pairs.met(group)
+            if best_met == 0:
+                break
+            for cand in ranked:
+                if cand in group or abs(key(cand) - key(current)) > PRIORITY_SLACK:
+                    continue
+                trial = group[:i] + [cand] + group[i + 1:]
+                if not self.is_compatible(trial):
+                    continue
+                met = self.pairs.met(trial)
+                if met < best_met:
+                    best, best_met = cand, met
+            group[i] = best
+        return group
+
+    @metrics.timed("scheduler.finish_and_next_ms")
+    def finish_and_next(self, court_id, winner=None):
+        """結算場地並排入下一組
+
+        winner: 1 / 2 表示隊伍 1 / 隊伍 2 獲勝 (會更新戰力)，None 表示不計分。
+        回傳 (MatchRecord 或 None, 下一組或 None)。下一組不足 4 人時場地維持空場。
+        """
+        record = None
+        current = self.courts.get(court_id, [])
+        started = self.court_started.pop(court_id, None)
+        staged = self.staged.pop(court_id, None)
+        if current:
+            names = self.names(current)
+            if len(names) == 4:
+                self.pairs.record(current)
+                if winner in (1, 2):
+                    self.record_result(current, team1_won=(winner == 1))
+                record = MatchRecord(court_id, names[:2], names[2:], start=started, end=self.clock(),
+                                     winner=winner if winner in (1, 2) else None)
+                if started is not None:
+                    self.durations.observe(names, [self.level_of(pid) for pid in current],
+                                           record.end - started)
+                if night_of(record.end) != self.stats.night():
+                    # 沒按「清除今晚紀錄」就打到下一晚：前一晚收起來，今晚重新算
+                    if self.stats.players:
+                        self.closed_nights.append(self.stats)
+                    # 前一晚開打、過了換日時間才按結束的那場：今晚從結束時算起
+                    today = started if started is not None and night_of(started) == night_of(record.end) else record.end
+                    self.stats = SessionStats(started=today)
+                self.stats.observe(record, [self.level_of(pid) for pid in current])
+            else:
+                record = MatchRecord(court_id, names, (), start=started, end=self.clock())
+            self.history.add(record)
+            for pid in current:
+                p = self.players[pid]
+                p.games += 1
+                p.last_end = record.end
+
+        # 下場的人回到休息區索引 (場次已 +1)，其他場地的人本來就不在索引裡
+        self._set_court(court_id, [])
+
+        # 先不動別的場地預告的人；湊不滿才拿來用 (真的空下來的場地優先)
+        next_group = self.next_group(exclude=self.staged_pids()) or self.next_group()
+        if staged and self._stage_ready(staged) and (
+                not next_group or self._worst_priority(staged) <= self._worst_priority(next_group) + PRIORITY_SLACK):
+            # 預告過的那組已經在場邊等；只有現在挑會讓明顯更該上場的人先上時才換掉
+            next_group = staged
+        elif next_group:
+            self._drop_stages_with(next_group)
+        if next_group:
+            self._set_court(court_id, next_group)
+            self.court_status[court_id] = "EDITING"
+        return record, next_group
+
+    def free_courts(self):
+        return [c_id for c_id in sorted(self.courts) if not self.courts[c_id]]
+
+    def _plan(self, court_ids, time_budget=0.2, exclude=()):
+        """規劃多個空場的下一組 (不修改狀態)，回傳 {場地: 四人}
+
+        只有一個空場時就是 next_group。多個空場時把它們一起最佳化：候選池取
+        每個分組前 4 * 場數 + 4 人，逐場貪婪的結果當作起點，再用
+        assignment.assign 在時間預算內找場次更平均、分隊更接近的組合。
+        """
+        self._refresh_rate()
+        exclude = set(exclude)
+        if len(court_ids) <= 1:
+            plan = {}
+            for c_id in court_ids:
+                group = self.next_group(exclude=exclude)
+                if group:
+                    plan[c_id] = group
+            return plan
+
+        k = 4 * len(court_ids) + 4
+        pool = []
+        for level in LEVELS:
+            pool.extend(self.index.top(level, k, skip=exclude))
+        pool = [e[2] for e in sorted(pool)]
+        pos = {pid: i for i, pid in enumerate(pool)}
+
+        # 逐場貪婪的結果當種子，確保不會比原本的做法差
+        seeds, taken = [], set()
+        for _ in court_ids:
+            group = self.next_group(exclude=taken | exclude)
+            if not group:
+                break
+            taken.update(group)
+            seeds.append([pos[pid] for pid in group])
+
+        level_code = {lv: i for i, lv in enumerate(LEVELS)}
+        partner, opponent = self.pairs.submatrix(pool)
+        groups = assignment.assign(
+            games=[self.index.key(pid) for pid in pool],
+            ratings=self.ratings_of(pool),
+            levels=[level_code.get(self.level_of(pid), 1) for pid in pool],
+            n_courts=len(court_ids),
+            np_rng=np.random.default_rng(self._rng(*court_ids, *pool).getrandbits(32)),
+            enable_balancing=self.enable_balancing,
+            time_budget=time_budget,
+            seeds=seeds,
+            partner=partner,
+            opponent=opponent,
+        )
+        return {c_id: [pool[i] for i in idx] for c_id, idx in zip(court_ids, groups)}
+
+    @metrics.timed("scheduler.preview_ms")
+    def preview(self):
+        """所有空場的「預計下組」，依狀態版本快取
+
+        只有名單、出席、場次、場地佔用或平衡開關改變時才重算，所以畫面重整
+        不會讓預覽跳來跳去，按下開始時排進去的也就是畫面上看到的那組。
+        重算用的亂數也由狀態內容決定 (_rng)，狀態沒變就算重算也是同樣的組合。
+        """
+        self._refresh_rate()
+        key = (self.version, self.enable_balancing)
+        if self._preview is None or self._preview[0] != key:
+            free = self.free_courts()
+            # 預告給其他場地的人先不排；這樣湊不滿空場時才動用他們
+            plan = self._plan(free, exclude=self.staged_pids())
+            if len(plan) < len(free) and self.staged:
+                plan = self._plan(free)
+            self._preview = (key, plan)
+        return self._preview[1]
+
+    def start_court(self, court_id):
+        """把預覽中這個場地的那組排上場，回傳四人 (沒有可排的回傳 None)"""
+        plan = self.preview()
+        group = plan.get(court_id)
+        if not group:
+            return None
+        self._set_court(court_id, group)
+        self.court_status[court_id] = "EDITING"
+        self._drop_stages_with(group)
+        # 其他空場的預覽和這組互不重疊，留著繼續用
+        rest = {c_id: g for c_id, g in plan.items() if c_id != court_id}
+        self._preview = ((self.version, self.enable_balancing), rest)
+        return group
+
+    @metrics.timed("scheduler.fill_courts_ms")
+    def fill_courts(self, court_ids=None, time_budget=0.2):
+        """一次排滿多個空場 (預設所有空場，直接採用預覽)，回傳 {場地: 四人}"""
+        if court_ids is None:
+            plan = self.preview()
+        else:
+            plan = self._plan(list(court_ids), time_budget)
+        for c_id, group in plan.items():
+            self._set_court(c_id, group)
+            self.court_status[c_id] = "EDITING"
+            self._drop_stages_with(group)
+        return plan
+
+    def start_game(self, court_id):
+        p_list = self.courts[court_id]
+        if len(p_list) != 4:
+            return False
+        self._set_court(court_id, self.balance_teams(p_list))
+        self.court_status[court_id] = "PLAYING"
+        self.court_started[court_id] = self.clock()
+        return True
+
+    def reset_court(self, court_id):
+        self._set_court(court_id, [])
+        self.court_status[court_id] = "EDITING"
+        self.court_started.pop(court_id, None)
+        self.staged.pop(court_id, None)
+
+    def remove_from_court(self, court_id, name):
+        pid = self.ids.get(name)
+        if pid in self.courts[court_id]:
+            self._set_court(court_id, [x for x in self.courts[court_id] if x != pid])
+            return True
+        return False
+
+    def manual_add(self, name):
+        """把球員放進第一個未滿的場地，回傳場地 id (全滿回傳 None)"""
+        pid = self.ids.get(name)
+        if pid is None or pid in self._court_of:
+            return None
+        for c_id in sorted(self.courts):
+            if len(self.courts[c_id]) < 4:
+                self._set_court(c_id, self.courts[c_id] + [pid])
+                self._drop_stages_with([pid])
+                return c_id
+        return None
+
+    # --- 比賽時間預估與提前預告 ---
+
+    def expected_end(self, court_id):
+        """進行中的場地預計幾點打完 (epoch 秒)，沒在比賽回傳 None"""
+        started = self.court_started.get(court_id)
+        pids = self.courts.get(court_id, [])
+        if started is None or not pids:
+            return None
+        return started + self.durations.estimate(self.names(pids), [self.level_of(pid) for pid in pids])
+
+    def _worst_priority(self, pids):
+        return max(self.index.key(pid) for pid in pids)
+
+    def staged_pids(self):
+        return {pid for group in self.staged.values() for pid in group}
+
+    def _stage_ready(self, group):
+        """預告的人都還在、可上場、也沒被排到別的場地"""
+        return all(pid in self.players and self.players[pid].active and pid not in self._court_of
+                   for pid in group)
+
+    def _drop_stages_with(self, pids):
+        """有人被排到別處時，取消含有他們的預告"""
+        pids = set(pids)
+        for c_id in [c for c, group in self.staged.items() if pids.intersection(group)]:
+            del self.staged[c_id]
+            self.version += 1
+
+    def prune_stages(self):
+        """取消已經不成立的預告 (有人暫離、被移除或已上場)，回傳是否有變動"""
+        stale = [c_id for c_id, group in self.staged.items()
+                 if c_id not in self.courts or not self._stage_ready(group)]
+        for c_id in stale:
+            del self.staged[c_id]
+        if stale:
+            self.version += 1
+        return bool(stale)
+
+    @metrics.timed("scheduler.stage_next_ms")
+    def stage_next(self, lead=STAGE_LEAD):
+        """替「預計最快打完」的場地先挑好下一組，回傳 (場地, 四人) 或 None
+
+        一次只預告一組 (已有預告就不再挑)，而且要等到預計結束前 lead 秒內才挑。
+        空場預覽要用的人不會被挑走，所以預告不會讓眼前的空場少人。
+        場地一結束，這組直接上場，省掉結束後才叫人、集合的時間。
+        """
+        self.prune_stages()
+        if self.staged:
+            return None
+        playing = [(self.expected_end(c_id), c_id) for c_id in self.courts
+                   if self.court_status.get(c_id) == "PLAYING" and c_id in self.court_started]
+        playing = [x for x in playing if x[0] is not None]
+        if not playing:
+            return None
+        expected, court_id = min(playing)
+        if expected - self.clock() > lead:
+            return None
+        reserved = set()
+        for group in self.preview().values():
+            reserved.update(group)
+        group = self.next_group(exclude=reserved)
+        if not group:
+            return None
+        self.staged[court_id] = group
+        self.version += 1
+        return court_id, group
+
+    def set_court_count(self, n):
+        """調整場地數量，回傳 (新增的場地, 移除的場地)"""
+        added, removed = [], []
+        for c_id in range(1, n + 1):
+            if c_id not in self.courts:
+                self.courts[c_id] = []
+                self.court_status[c_id] = "EDITING"
+                added.append(c_id)
+        for c_id in sorted(self.courts):
+            if c_id > n:
+                self._set_court(c_id, [])
+                del self.courts[c_id]
+                self.court_status.pop(c_id, None)
+                self.court_started.pop(c_id, None)
+                self.staged.pop(c_id, None)
+                removed.append(c_id)
+        if added or removed:
+            self.version += 1   # 空場變了，預覽要重算
+        return added, removed
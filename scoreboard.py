@@ -0,0 +1,201 @@
+"""場館看板：唯讀的 HTTP JSON 端點 + 電視用的簡單網頁
+
+    python scoreboard.py --port 8502
+    python scoreboard.py --port 8503 --club riverside   # 其他球團各開一個
+
+GET /api/board 回傳場地、候位與最近比賽。狀態沒變時用 ETag 回 304，
+?wait=秒數 會等到有變動才回 (long polling)。所有觀眾共用同一份在記憶體裡
+編碼好的 JSON，只有存檔版本變了才重建一次，觀眾再多也幾乎不花資源。
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from clubs import club_id, state_path
+from scheduler import LEVEL_ICONS, Scheduler
+from storage import StateStore
+
+DATA_FILE = "badminton_state.json"
+POLL_SECONDS = 1.0      # 多久檢查一次存檔 (只有兩次 stat)
+MAX_WAIT = 30           # long polling 最多等幾秒
+RECENT_MATCHES = 10
+
+
+def build_board(data):
+    """從存檔 dict 整理出看板要的資料 (開打時間給 epoch 秒，經過幾分鐘由網頁自己算)"""
+    sched = Scheduler.from_dict(data)
+    courts = []
+    for c_id in sorted(sched.courts):
+        names = sched.court_names(c_id)
+        courts.append({
+            "id": c_id,
+            "status": sched.court_status.get(c_id, "EDITING"),
+            "players": [{"name": n, "icon": LEVEL_ICONS.get(sched.get(n).level, "")} for n in names],
+            "started": sched.court_started.get(c_id),
+            "expected": sched.expected_end(c_id),
+            "next": [{"name": n, "icon": LEVEL_ICONS.get(sched.get(n).level, "")}
+                     for n in sched.names(sched.staged.get(c_id, []))],
+        })
+    waiting = sched.waiting()   # 排隊順序
+    return {
+        "courts": courts,
+        "waiting": [{"name": p.name, "icon": LEVEL_ICONS.get(p.level, ""), "games": p.games,
+                     "since": p.last_end} for p in waiting],
+        "recent": [str(r) for r in sched.history[:RECENT_MATCHES]],
+    }
+
+
+class Board:
+    """在記憶體裡的看板快照，背景執行緒偵測到存檔變動才重建"""
+
+    def __init__(self, path=DATA_FILE):
+        self.store = StateStore(path)
+        self.cond = threading.Condition()
+        self.body = b""
+        self.etag = ""
+        self._set(self.store.load() or {})
+
+    def _set(self, data):
+        payload = build_board(data)
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        with self.cond:
+            if etag != self.etag:
+                self.body, self.etag = body, etag
+                self.cond.notify_all()
+
+    def poll_forever(self):
+        while True:
+            time.sleep(POLL_SECONDS)
+            try:
+                data = self.store.sync()
+                if data is not None:
+                    self._set(data)
+            except Exception as e:   # 存檔正在被寫或暫時讀不到，下一輪再試
+                print(f"看板更新失敗: {e}")
+
+    def wait_change(self, etag, timeout):
+        """等到 ETag 不再是 etag (或逾時)，回傳 (body, etag)"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.etag != etag, timeout=timeout)
+            return self.body, self.etag
+
+
+PAGE = """<!doctype html>
+<html lang="zh-Hant"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>🏸 場地看板</title>
+<style>
+body{font-family:sans-serif;background:#111;color:#eee;margin:1em}
+#courts{display:grid;grid-template-columns:repeat(auto-fill,minmax(16em,1fr));gap:1em}
+.court{background:#222;border-radius:.5em;padding:.8em}
+.court h2{margin:0 0 .4em}.PLAYING{border-left:.4em solid #4caf50}.EDITING{border-left:.4em solid #888}
+.team{font-size:1.3em}.vs{color:#888}.meta{color:#aaa;font-size:.9em}.next{color:#ffd54f;margin-top:.4em}
+</style></head><body>
+<h1>🏸 場地現況</h1><div id="courts"></div>
+<h2>💤 候位</h2><div id="waiting"></div>
+<h2>📜 最近比賽</h2><div id="recent"></div>
+<script>
+let etag = "", last = null;
+function esc(s){return s.replace(/[&<>"]/g,c=>({"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;"}[c]));}
+function p(x){return esc(x.icon + " " + x.name);}
+function render(b){
+  last = b;
+  document.getElementById("courts").innerHTML = b.courts.map(c => {
+    const ps = c.players;
+    const body = ps.length === 4
+      ? `<div class="team">${p(ps[0])} + ${p(ps[1])}</div><div class="vs">vs</div><div class="team">${p(ps[2])} + ${p(ps[3])}</div>`
+      : (ps.length ? `<div class="team">${ps.map(p).join("、")}</div>` : `<div class="meta">空場</div>`);
+    let t = c.started ? `<div class="meta">已開打 ${Math.max(0, Math.floor((Date.now()/1000 - c.started)/60))} 分鐘` : "";
+    if(c.expected){ t += `，預計 ${new Date(c.expected*1000).toTimeString().slice(0,5)} 結束`; }
+    if(t){ t += "</div>"; }
+    const next = c.next.length ? `<div class="next">📣 下一組準備: ${c.next.map(p).join("、")}</div>` : "";
+    return `<div class="court ${c.status}"><h2>場地 ${c.id}</h2>${body}${t}${next}</div>`;
+  }).join("");
+  document.getElementById("waiting").innerHTML = b.waiting.map(w => {
+    const waited = w.since ? `，等 ${Math.max(0, Math.floor((Date.now()/1000 - w.since)/60))} 分` : "";
+    return `${p(w)} (${w.games} 場${waited})`;
+  }).join("、") || "無人休息";
+  document.getElementById("recent").innerHTML = b.recent.map(r => `<div>${esc(r)}</div>`).join("");
+}
+async function loop(){
+  for(;;){
+    try{
+      const r = await fetch("/api/board?wait=25", {headers: etag ? {"If-None-Match": etag} : {}});
+      if(r.status === 200){ etag = r.headers.get("ETag"); render(await r.json()); }
+      else if(r.status !== 304){ await new Promise(s => setTimeout(s, 3000)); }
+    }catch(e){ await new Promise(s => setTimeout(s, 3000)); }
+  }
+}
+loop();
+setInterval(() => last && render(last), 30000);
+</script></body></html>
+""".encode("utf-8")
+
+
+def make_handler(board):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/":
+                self._send(200, PAGE, "text/html; charset=utf-8")
+            elif url.path == "/api/board":
+                client_etag = self.headers.get("If-None-Match", "")
+                wait = parse_qs(url.query).get("wait", ["0"])[0]
+                try:
+                    wait = min(float(wait), MAX_WAIT)
+                except ValueError:
+                    wait = 0
+                body, etag = board.body, board.etag
+                if wait > 0 and client_etag == etag:
+                    body, etag = board.wait_change(client_etag, wait)
+                if client_etag == etag:
+                    self._send(304, b"", etag=etag)
+                else:
+                    self._send(200, body, "application/json; charset=utf-8", etag=etag)
+            else:
+                self._send(404, b"not found", "text/plain")
+
+        def _send(self, status, body, content_type=None, etag=None):
+            self.send_response(status)
+            if content_type:
+                self.send_header("Content-Type", content_type)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass   # 觀眾每 25 秒一個請求，不要洗版
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="羽球場地看板 (唯讀)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--state", default=DATA_FILE, help="App 的存檔路徑")
+    parser.add_argument("--club", help="球團代號 (和 App 網址的 ?club= 相同)，會覆蓋 --state")
+    args = parser.parse_args(argv)
+
+    board = Board(state_path(club_id(args.club)) if args.club else args.state)
+    threading.Thread(target=board.poll_forever, daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(board))
+    server.daemon_threads = True
+    print(f"看板: http://{args.host}:{args.port}/  (JSON: /api/board)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""無頭 (不開 Streamlit) 模擬整晚的輪替，量測排程速度與公平性
+
+    python simulate.py                     # 跑所有預設情境
+    python simulate.py --scenario open_gym --players 200 --courts 14
+    python simulate.py --save-baseline     # 更新 benchmarks/baseline.json
+    python simulate.py --check             # 和基準比較，退步時 exit code 1
+"""
+import argparse
+import dataclasses
+import heapq
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+
+from scheduler import Scheduler, LEVELS, STAGE_LEAD
+from ratings import initial_rating
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+# 量測這些 Scheduler 方法的每次呼叫耗時
+TIMED_METHODS = ["next_group", "balance_teams", "finish_and_next", "preview"]
+
+# 和基準比較時容許的退步幅度
+SPEED_FACTOR = 3.0          # 延遲可以慢到基準的幾倍 (不同機器差異大)
+SPEED_SLACK_US = 200.0      # 延遲的絕對容許值，避免很小的數字誤判
+FAIRNESS_TOLERANCE = {
+    "games_std": 0.25,
+    "games_per_hour_std": 0.25,
+    "repeat_partner_rate": 0.05,
+    "court_idle_fraction": 0.05,
+}
+WAIT_FACTOR = 1.25
+
+
+@dataclass
+class SimConfig:
+    players: int = 40
+    courts: int = 6
+    level_mix: tuple = (0.3, 0.4, 0.3)      # 死亡之組 / 有點累組 / 休閒組 比例
+    session_minutes: float = 180.0
+    initial_fraction: float = 0.7           # 開場就到的比例，其他人陸續抵達
+    arrival_rate: float = 0.5               # 晚到的人每分鐘抵達幾位 (Poisson)
+    departure_rate: float = 0.15            # 每人每小時提早離開的機率
+    break_rate: float = 0.0                 # 每人每小時暫離幾次 (Poisson)
+    break_minutes: float = 15.0             # 暫離平均多久 (指數分佈)
+    match_minutes: tuple = (15.0, 12.0, 10.0)  # 各分組平均比賽時間
+    match_sigma: float = 0.25               # 比賽時間 lognormal 的離散程度
+    gather_minutes: float = 1.0             # 排好後集合上場要花的時間
+    prestage: bool = False                  # 提前預告下一組 (Scheduler.stage_next)
+    staged_gather_minutes: float = 0.25     # 預告過的那組已在場邊，換場只要這麼久
+    enable_balancing: bool = True
+    seed: int = 0
+
+
+SCENARIOS = {
+    "small": SimConfig(players=12, courts=2, session_minutes=120.0, departure_rate=0.0),
+    "club": SimConfig(players=40, courts=6),
+    "club_prestage": SimConfig(players=40, courts=6, prestage=True),
+    "club_breaks": SimConfig(players=40, courts=6, break_rate=0.5),
+    "open_gym": SimConfig(players=150, courts=12, arrival_rate=2.0),
+}
+
+
+@dataclass
+class _SimPlayer:
+    name: str
+    level: str
+    skill: float
+    arrive: float
+    depart: float
+    ready_since: float = 0.0
+    leaving: bool = False
+    resting: bool = False       # 打完這場要暫離
+    away: float = 0.0           # 暫離的總分鐘數
+    away_since: float = None
+    waits: list = field(default_factory=list)
+
+
+def _instrument(sched, timings):
+    """把計時包裝直接掛在實例上，內部的 self.xxx() 呼叫也會被量到"""
+    for name in TIMED_METHODS:
+        method = getattr(sched, name)
+        samples = timings.setdefault(name, [])
+
+        def timed(*args, _method=method, _samples=samples, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                _samples.append(time.perf_counter() - t0)
+
+        setattr(sched, name, timed)
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"calls": 0}
+    us = sorted(s * 1e6 for s in samples)
+
+    def pct(p):
+        return round(us[min(len(us) - 1, int(math.ceil(p / 100 * len(us))) - 1)], 1)
+
+    return {"calls": len(us), "p50_us": pct(50), "p95_us": pct(95), "p99_us": pct(99), "max_us": round(us[-1], 1)}
+
+
+def simulate(config):
+    """跑完一整晚，回傳報表 dict"""
+    rng = random.Random(config.seed)
+    now = 0.0   # 模擬時間 (分鐘)，比賽紀錄的開始/結束時間用它
+    sched = Scheduler(enable_balancing=config.enable_balancing, rng=random.Random(config.seed + 1),
+                      clock=lambda: now * 60.0)
+    sched.set_court_count(config.courts)
+    timings = {}
+    _instrument(sched, timings)
+    end = config.session_minutes
+
+    # --- 產生球員與抵達/離開時間 ---
+    people = {}
+    late_clock = 0.0
+    for i in range(config.players):
+        level = rng.choices(LEVELS, weights=config.level_mix)[0]
+        if rng.random() < config.initial_fraction:
+            arrive = 0.0
+        else:
+            late_clock += rng.expovariate(config.arrival_rate)
+            arrive = late_clock
+        depart = end
+        if config.departure_rate > 0:
+            depart = min(end, arrive + rng.expovariate(config.departure_rate / 60.0))
+        name = f"P{i:03d}"
+        people[name] = _SimPlayer(name, level, initial_rating(level) + rng.gauss(0, 100), arrive, depart)
+
+    events = []   # (時間, 序號, 種類, 資料)
+    seq = 0
+
+    def push(t, kind, data):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (t, seq, kind, data))
+
+    for p in people.values():
+        if p.arrive < end:
+            push(p.arrive, "arrive", p.name)
+            if p.depart < end:
+                push(p.depart, "depart", p.name)
+            if config.break_rate > 0:
+                push(p.arrive + rng.expovariate(config.break_rate / 60.0), "break", p.name)
+
+    mean_minutes = dict(zip(LEVELS, config.match_minutes))
+    play_minutes = 0.0
+    matches = 0
+    partner_pairs = 0
+    repeat_partners = 0
+
+    def start_match(court_id, now, gather=config.gather_minutes):
+        nonlocal play_minutes, matches, partner_pairs, repeat_partners
+        sched.start_game(court_id)
+        group = sched.courts[court_id]
+        for pair in ((group[0], group[1]), (group[2], group[3])):
+            partner_pairs += 1
+            if sched.pairs.counts(*pair)[0] > 0:
+                repeat_partners += 1
+        for pid in group:
+            p = people[sched.players[pid].name]
+            p.waits.append(now - p.ready_since)
+        mean = statistics.fmean(mean_minutes[sched.level_of(pid)] for pid in group)
+        duration = mean * math.exp(rng.gauss(0, config.match_sigma) - config.match_sigma ** 2 / 2)
+        start = now + gather
+        finish = start + duration
+        play_minutes += max(0.0, min(finish, end) - min(start, end))
+        matches += 1
+        push(finish, "finish", court_id)
+        if config.prestage:
+            # 預計結束前 STAGE_LEAD 秒叫下一組準備 (預估值來自之前的比賽時間)
+            push(max(now, sched.expected_end(court_id) / 60.0 - STAGE_LEAD / 60.0), "stage", court_id)
+
+    def take_break(name, now):
+        sched.toggle_active(name)
+        people[name].away_since = now
+        push(now + rng.expovariate(1.0 / config.break_minutes), "return", name)
+
+    def fill(now):
+        for court_id in sched.free_courts():
+            if sched.start_court(court_id):
+                start_match(court_id, now)
+
+    while events:
+        now, _, kind, data = heapq.heappop(events)
+        if now >= end:
+            break
+
+        if kind == "arrive":
+            sched.add_player(data, people[data].level)
+            people[data].ready_since = now
+        elif kind == "depart":
+            pid = sched.ids[data]
+            if pid in sched.on_court():
+                people[data].leaving = True   # 打完這場再走
+            elif sched.players[pid].active:
+                sched.toggle_active(data)
+            elif people[data].away_since is not None:
+                people[data].away += now - people[data].away_since   # 暫離中直接走了
+                people[data].away_since = None
+        elif kind == "break":
+            p = people[data]
+            pid = sched.ids[data]
+            if now < p.depart and not p.leaving and sched.players[pid].active:
+                if pid in sched.on_court():
+                    p.resting = True   # 打完這場再休息
+                else:
+                    take_break(data, now)
+        elif kind == "return":
+            p = people[data]
+            if now < p.depart and not sched.players[sched.ids[data]].active:
+                sched.toggle_active(data)
+                p.away += now - p.away_since
+                p.away_since = None
+                p.ready_since = now
+                push(now + rng.expovariate(config.break_rate / 60.0), "break", data)
+        elif kind == "finish":
+            court_id = data
+            group = list(sched.courts[court_id])
+            names = sched.names(group)
+            for name in names:
+                people[name].ready_since = now
+                if people[name].leaving and sched.players[sched.ids[name]].active:
+                    sched.toggle_active(name)
+                elif people[name].resting:
+                    people[name].resting = False
+                    take_break(name, now)
+            team1 = statistics.fmean(people[n].skill for n in names[:2])
+            team2 = statistics.fmean(people[n].skill for n in names[2:])
+            winner = 1 if rng.random() < 1 / (1 + 10 ** ((team2 - team1) / 400)) else 2
+            staged = sched.staged.get(court_id)
+            _, next_group = sched.finish_and_next(court_id, winner=winner)
+            sched.history.take_overflow()   # 跟 App 一樣只留最近幾場 (模擬不寫封存檔)
+            if next_group:
+                quick = staged is not None and next_group == staged
+                start_match(court_id, now, config.staged_gather_minutes if quick else config.gather_minutes)
+        fill(now)
+        if config.prestage:
+            sched.stage_next()
+
+    # --- 統計 ---
+    for p in people.values():
+        if p.away_since is not None:
+            p.away += end - p.away_since
+            p.away_since = None
+    # 整晚都在 (沒有晚到、早走或暫離) 的人，場次應該幾乎一樣
+    full_night = [p for p in people.values() if p.arrive == 0.0 and p.depart >= end and p.away == 0.0]
+    games = [sched.get(p.name).games for p in full_night]
+    per_hour = []
+    for p in people.values():
+        present = min(p.depart, end) - p.arrive - p.away
+        if present >= 30 and sched.get(p.name) is not None:
+            per_hour.append(sched.get(p.name).games / (present / 60.0))
+    waits = sorted(w for p in people.values() for w in p.waits)
+
+    def wait_pct(q):
+        return round(waits[min(len(waits) - 1, int(q * len(waits)))], 2) if waits else 0.0
+
+    return {
+        "config": dataclasses.asdict(config),
+        "latency": {name: _percentiles(samples) for name, samples in timings.items()},
+        "fairness": {
+            "matches": matches,
+            "games_std": round(statistics.pstdev(games), 3) if games else 0.0,
+            "games_spread": (max(games) - min(games)) if games else 0,
+            "games_per_hour_std": round(statistics.pstdev(per_hour), 3) if per_hour else 0.0,
+            "wait_p50_min": wait_pct(0.5),
+            "wait_p95_min": wait_pct(0.95),
+            "wait_max_min": round(waits[-1], 2) if waits else 0.0,
+            "repeat_partner_rate": round(repeat_partners / partner_pairs, 3) if partner_pairs else 0.0,
+            "court_idle_fraction": round(1 - play_minutes / (config.courts * end), 3),
+        },
+    }
+
+
+def compare(report, baseline):
+    """和基準比較，回傳退步項目的說明列表"""
+    problems = []
+    for name, base in baseline.get("latency", {}).items():
+        cur = report["latency"].get(name, {})
+        if "p95_us" in base and "p95_us" in cur:
+            limit = base["p95_us"] * SPEED_FACTOR + SPEED_SLACK_US
+            if cur["p95_us"] > limit:
+                problems.append(f"{name} p95 {cur['p95_us']}us > {limit:.0f}us")
+    base_f, cur_f = baseline.get("fairness", {}), report["fairness"]
+    for key, tol in FAIRNESS_TOLERANCE.items():
+        if key in base_f and cur_f[key] > base_f[key] + tol:
+            problems.append(f"{key} {cur_f[key]} > {base_f[key]} + {tol}")
+    if "wait_p95_min" in base_f and cur_f["wait_p95_min"] > base_f["wait_p95_min"] * WAIT_FACTOR + 0.5:
+        problems.append(f"wait_p95_min {cur_f['wait_p95_min']} > {base_f['wait_p95_min']} x {WAIT_FACTOR}")
+    return problems
+
+
+def _print_report(name, report):
+    f = report["fairness"]
+    print(f"== {name}: {report['config']['players']} 人 / {report['config']['courts']} 面場 ==")
+    for method, stats in report["latency"].items():
+        if stats["calls"]:
+            print(f"  {method:16s} calls={stats['calls']:5d}  p50={stats['p50_us']:8.1f}us  "
+                  f"p95={stats['p95_us']:8.1f}us  p99={stats['p99_us']:8.1f}us")
+    print(f"  matches={f['matches']}  games std={f['games_std']} spread={f['games_spread']}  "
+          f"games/hr std={f['games_per_hour_std']}")
+    print(f"  wait p50={f['wait_p50_min']}m p95={f['wait_p95_min']}m max={f['wait_max_min']}m  "
+          f"repeat partners={f['repeat_partner_rate']:.1%}  court idle={f['court_idle_fraction']:.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="羽球排程模擬與效能基準")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["all"], default="all")
+    for f in dataclasses.fields(SimConfig):
+        if f.type in (int, float, "int", "float"):
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(f.default), default=None)
+    parser.add_argument("--no-balancing", action="store_true")
+    parser.add_argument("--prestage", action="store_true", default=None, help="提前預告下一組")
+    parser.add_argument("--json", action="store_true", help="輸出 JSON 報表")
+    parser.add_argument("--save-baseline", action="store_true", help=f"把結果存成基準 ({BASELINE_FILE})")
+    parser.add_argument("--check", action="store_true", help="和基準比較，有退步時回傳 1")
+    args = parser.parse_args(argv)
+
+    names = sorted(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    overrides = {f.name: getattr(args, f.name) for f in dataclasses.fields(SimConfig)
+                 if getattr(args, f.name, None) is not None}
+    if args.no_balancing:
+        overrides["enable_balancing"] = False
+
+    reports = {}
+    for name in names:
+        config = dataclasses.replace(SCENARIOS[name], **overrides)
+        reports[name] = simulate(config)
+        if not args.json:
+            _print_report(name, reports[name])
+
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(reports)
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"已更新基準: {BASELINE_FILE}")
+
+    if args.check:
+        if not os.path.exists(BASELINE_FILE):
+            print("找不到基準檔，請先執行 --save-baseline")
+            return 1
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        failed = False
+        for name, report in reports.items():
+            if name not in baseline:
+                continue
+            if overrides:
+                print(f"[{name}] 有自訂參數，略過基準比較")
+                continue
+            problems = compare(report, baseline[name])
+            for p in problems:
+                print(f"[{name}] 退步: {p}")
+            failed = failed or bool(problems)
+        if not failed:
+            print("和基準相比沒有退步")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
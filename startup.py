@@ -0,0 +1,125 @@
+"""量測 App 冷啟動與重跑的時間，並檢查沒有在啟動時載入肥大的套件
+
+    python startup.py                   # 量一次並列出結果
+    python startup.py --save-baseline   # 更新 benchmarks/startup.json
+    python startup.py --check           # 和基準比較，變慢或載入了不該載入的套件時 exit code 1
+
+每次量測都在新的 Python 行程、空的暫存資料夾裡跑 (不會碰到真正的存檔)。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "startup.json")
+
+# 只有特定功能 (OCR、AI 辨識、匯出) 用得到，啟動時不該被載入
+HEAVY_MODULES = ["openai", "pandas", "pyarrow", "cv2", "easyocr", "torch", "pytesseract", "PIL"]
+
+TIME_FACTOR = 2.0       # 可以慢到基準的幾倍 (不同機器差異大)
+TIME_SLACK_MS = 300.0   # 絕對容許值，避免很小的數字誤判
+RUNS = 3                # 量幾次取中位數
+
+# 在子行程裡跑：先量 import，再用 AppTest 跑第一次 (冷啟動) 與第二次 (重跑)
+_CHILD = r"""
+import json, os, sys, time
+root = sys.argv[1]
+sys.path.insert(0, root)
+t0 = time.perf_counter()
+import scheduler, storage, clubs, directory, nameindex, imagecache, matchlog, roster_import
+t1 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t2 = time.perf_counter()
+at = AppTest.from_file(os.path.join(root, "app.py"), default_timeout=60)
+at.run()
+t3 = time.perf_counter()
+at.run()
+t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "first_run_ms": (t3 - t2) * 1000,
+    "rerun_ms": (t4 - t3) * 1000,
+    "errors": [str(e.value) for e in at.exception],
+    "loaded": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+
+def measure_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        # App 啟動時會讀 secrets，給一個假的 key (量測不會真的呼叫 API)
+        os.makedirs(os.path.join(tmp, ".streamlit"))
+        with open(os.path.join(tmp, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+            f.write('OPENAI_API_KEY = "benchmark"\n')
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD, ROOT, json.dumps(HEAVY_MODULES)],
+            cwd=tmp, capture_output=True, text=True, timeout=300)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip() or "量測行程失敗")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs=RUNS):
+    samples = [measure_once() for _ in range(runs)]
+    report = {key: round(statistics.median(s[key] for s in samples), 1)
+              for key in ("import_ms", "first_run_ms", "rerun_ms")}
+    report["errors"] = sorted({e for s in samples for e in s["errors"]})
+    report["loaded"] = sorted({m for s in samples for m in s["loaded"]})
+    return report
+
+
+def compare(report, baseline):
+    """回傳問題列表 (變慢、載入肥大套件、App 出錯)"""
+    problems = [f"啟動時載入了 {m}" for m in report["loaded"]]
+    problems += [f"App 發生錯誤: {e}" for e in report["errors"]]
+    for key in ("import_ms", "first_run_ms", "rerun_ms"):
+        if key in baseline:
+            limit = baseline[key] * TIME_FACTOR + TIME_SLACK_MS
+            if report[key] > limit:
+                problems.append(f"{key} {report[key]}ms > {limit:.0f}ms")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="App 冷啟動與重跑時間的基準")
+    parser.add_argument("--runs", type=int, default=RUNS, help="量幾次取中位數")
+    parser.add_argument("--json", action="store_true", help="輸出 JSON 報表")
+    parser.add_argument("--save-baseline", action="store_true", help=f"把結果存成基準 ({BASELINE_FILE})")
+    parser.add_argument("--check", action="store_true", help="和基準比較，有退步時回傳 1")
+    args = parser.parse_args(argv)
+
+    report = measure(args.runs)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"import={report['import_ms']}ms  第一次執行={report['first_run_ms']}ms  "
+              f"重跑={report['rerun_ms']}ms")
+        print(f"載入的肥大套件: {', '.join(report['loaded']) or '無'}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({k: report[k] for k in ("import_ms", "first_run_ms", "rerun_ms")}, f, indent=2)
+        print(f"已更新基準: {BASELINE_FILE}")
+
+    if args.check:
+        if not os.path.exists(BASELINE_FILE):
+            print("找不到基準檔，請先執行 --save-baseline")
+            return 1
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline)
+        for p in problems:
+            print(f"退步: {p}")
+        if not problems:
+            print("和基準相比沒有退步")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+# 日誌超過這個大小 (bytes) 就壓縮成快照
+COMPACT_BYTES = 256 * 1024
+
+# Streamlit 的 session 是同一個程序裡的不同執行緒；每個存檔一把鎖，不同球團互不影響
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        return _path_locks.setdefault(key, threading.RLock())
+
+
+def atomic_write_json(path, data):
+    """先寫暫存檔再 rename，避免寫到一半當機留下壞掉的 JSON，回傳寫了幾 bytes"""
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=dir_name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+        os.replace(tmp_path, path)
+        return size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+MISSING = object()   # 路徑上沒有值
+
+
+def get_path(state, path):
+    """取出 path 上的值，不存在時回傳 MISSING"""
+    node = state
+    for key in path:
+        if not isinstance(node, dict) or key not in node:
+            return MISSING
+        node = node[key]
+    return node
+
+
+def apply_event(state, event):
+    """把一筆日誌事件套用到 dict 狀態上，回傳新的狀態 (path 的每一層都是字串 key)
+
+    不改動原本的 dict / list：只複製路徑上的那幾層，其他分支和舊版本共用。
+    舊版本的任何部分都不會再被改到，復原紀錄直接留著舊值的參考就好。
+    """
+    op = event["op"]
+    path = event["path"]
+
+    def update(node, depth):
+        node = dict(node) if isinstance(node, dict) else {}
+        key = path[depth]
+        if depth < len(path) - 1:
+            node[key] = update(node.get(key), depth + 1)
+        elif op == "set":
+            node[key] = event["value"]
+        elif op == "del":
+            node.pop(key, None)
+        elif op == "insert":
+            items = list(node.get(key, []))
+            items.insert(event.get("index", 0), event["value"])
+            node[key] = items
+        elif op == "remove":
+            # 刪掉列表裡第一個等於 value 的元素 (復原 insert 用)
+            items = list(node.get(key, []))
+            if event["value"] in items:
+                items.remove(event["value"])
+            node[key] = items
+        else:
+            raise ValueError(f"未知的日誌操作: {op}")
+        return node
+
+    return update(state, 0)
+
+
+def apply_line(state, entry):
+    """套用日誌的一行：單筆事件，或一個動作整批的 {"events": [...]}"""
+    for event in entry.get("events", (entry,)):
+        state = apply_event(state, event)
+    return state
+
+
+class Cursor:
+    """讀取位置：多個 session 共用同一個 StateStore 時，各自記得看過哪一版"""
+    __slots__ = ("seq",)
+
+    def __init__(self):
+        self.seq = None
+
+
+class StateStore:
+    """快照 + append-only 日誌的存檔 (多台裝置可以同時寫)
+
+    每次修改只追加一行小小的事件到 `<path>.log`，日誌太大時才把整份狀態
+    壓縮寫回快照 `<path>`。讀取時 = 快照 + 重播日誌。
+    每筆事件都有全域遞增的 seq (就是狀態的版本號)，快照記下最後包含的 seq。
+
+    store.state 是和磁碟同步的 dict。寫入時先拿檔案鎖，把別台裝置新寫的
+    事件讀進來，再接著寫自己的 (同一個路徑以最後寫入的為準)。
+    sync() 只看檔案大小/時間，有變動才讀日誌新增的那幾行。
+
+    同一個 StateStore 可以給多個 session 共用 (記憶體裡只有一份)，
+    每個 session 帶自己的 Cursor；不帶的話用 store 自己的。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + ".log"
+        self.lock_path = path + ".lock"
+        self.seq = 0
+        self.state = None
+        self._log_bytes = 0
+        self._log_ino = None
+        self._snap_sig = None
+        self._lock = _thread_lock(path)
+        self._cursor = Cursor()
+
+    def exists(self):
+        return os.path.exists(self.path) or os.path.exists(self.log_path)
+
+    @contextmanager
+    def locked(self):
+        """同一台主機上所有 session / 程序互斥 (沒有 fcntl 的平台只鎖程序內)"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _snapshot_sig(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _reload(self):
+        state = {}
+        self._snap_sig = self._snapshot_sig()
+        if self._snap_sig is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        self.seq = state.pop("_seq", 0)
+        self.state = state
+        self._log_bytes = 0
+        self._log_ino = None
+        self._read_log()
+
+    def _read_log(self):
+        """讀日誌在 _log_bytes 之後的完整行，回傳套用了幾筆"""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            ino = os.fstat(f.fileno()).st_ino
+            if self._log_ino is not None and ino != self._log_ino:
+                # 日誌被別人壓縮後重建了，位移已經沒有意義
+                return -1
+            self._log_ino = ino
+            f.seek(self._log_bytes)
+            data = f.read()
+        end = data.rfind(b"\n") + 1   # 最後一行還沒寫完的話先不讀
+        applied = 0
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # 當機留下的半行 (之後的寫入會先補換行，所以只壞這一行)
+                continue
+            if event.get("seq", 0) <= self.seq:
+                continue
+            self.state = apply_line(self.state, event)
+            self.seq = event["seq"]
+            applied += 1
+        self._log_bytes += end
+        return applied
+
+    def _pull(self):
+        """把磁碟上比自己新的修改讀進 state"""
+        if self.state is None or self._snapshot_sig() != self._snap_sig:
+            self._reload()
+        elif self._read_log() < 0:
+            self._reload()
+
+    def load(self, cursor=None):
+        """回傳目前狀態的 dict 複本 (沒有存檔時回傳 None)
+
+        已經在記憶體裡 (別的 session 讀過) 就只補讀新的修改，不重讀整份。
+        """
+        cursor = cursor or self._cursor
+        with self.locked():
+            self._pull()
+            cursor.seq = self.seq
+            if not self.exists():
+                return None
+            return copy.deepcopy(self.state)
+
+    def sync(self, cursor=None):
+        """檢查有沒有 cursor 還沒看過的修改 (平常只有兩次 stat)，回傳新狀態的複本或 None"""
+        cursor = cursor or self._cursor
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            size = 0
+        with self.locked():
+            if self.state is None or self._snapshot_sig() != self._snap_sig or size != self._log_bytes:
+                self._pull()
+            if cursor.seq == self.seq:
+                return None
+            cursor.seq = self.seq
+            return copy.deepcopy(self.state)
+
+    def append(self, op, path, value=None, cursor=None, record=None, **extra):
+        """追加一筆事件，回傳是否該壓縮了 (見 append_many)"""
+        return self.append_many([(op, path, value, extra)], cursor=cursor, record=record)
+
+    def append_many(self, changes, cursor=None, record=None):
+        """把一個動作的所有修改 [(op, path, value, extra)] 寫成日誌的一行，回傳是否該壓縮了
+
+        整批只拿一次鎖、寫一次、fsync 一次；當機時這一行要嘛完整、要嘛整行被丟掉，
+        不會留下做到一半的動作。整批共用一個 seq。
+        在鎖裡先讀進別人的新事件再寫，seq 不會重複；有讀到別人的修改時，
+        cursor 不前進，下一次 sync() 會回傳合併後的狀態。
+        record 是列表時，每筆依序附上 (事件, 寫入前 path 上的值) 給復原用。
+        """
+        cursor = cursor or self._cursor
+        events = []
+        for op, path, value, extra in changes:
+            event = {"op": op, "path": [str(k) for k in path]}
+            if op != "del":
+                event["value"] = value
+            event.update(extra or {})
+            events.append(event)
+        if not events:
+            return False
+
+        with metrics.timer("storage.append_ms"), self.locked():
+            self._pull()
+            up_to_date = cursor.seq == self.seq
+            self.seq += 1
+            entry = dict(seq=self.seq, **events[0]) if len(events) == 1 else {"seq": self.seq, "events": events}
+            line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+            with open(self.log_path, "ab") as f:
+                if f.tell() > self._log_bytes:
+                    # 前一次寫到一半當機，先補換行，不要黏在壞掉的那行後面
+                    line = b"\n" + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                self._log_ino = os.fstat(f.fileno()).st_ino
+                self._log_bytes = f.tell()   # 含壞掉那半行，和檔案大小一致
+            metrics.observe("storage.append_bytes", len(line))
+            metrics.observe("storage.append_events", len(events))
+            for event in events:
+                if record is not None:
+                    record.append((event, get_path(self.state, event["path"])))
+                self.state = apply_event(self.state, event)
+            if up_to_date:
+                cursor.seq = self.seq   # 只有自己的修改，呼叫端的狀態本來就是新的
+        return self.needs_compaction()
+
+    def needs_compaction(self):
+        return self._log_bytes >= COMPACT_BYTES
+
+    def snapshot(self, data=None, cursor=None):
+        """寫入完整快照並清空日誌 (快照先落地，日誌才刪，中間當機也不會掉資料)
+
+        data 為 None 時寫目前的 state (含別台裝置的修改)；給 data 則整份取代，
+        版本號 +1，其他 session 下次 sync() 會拿到新的內容。
+        """
+        with metrics.timer("storage.snapshot_ms"), self.locked():
+            if data is None:
+                self._pull()
+            else:
+                self._pull()
+                self.state = copy.deepcopy(data)
+                self.seq += 1
+                (cursor or self._cursor).seq = self.seq
+            metrics.observe("storage.snapshot_bytes",
+                            atomic_write_json(self.path, dict(self.state, _seq=self.seq)))
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self._snap_sig = self._snapshot_sig()
+            self._log_bytes = 0
+            self._log_ino = None
+
+    def release(self):
+        """閒置時放掉記憶體 (日誌有東西就先壓縮成快照，下次讀比較快)"""
+        with self.locked():
+            if self.state is not None and self._log_bytes:
+                self._pull()
+                atomic_write_json(self.path, dict(self.state, _seq=self.seq))
+                if os.path.exists(self.log_path):
+                    os.remove(self.log_path)
+            self.state = None
+            self._snap_sig = None
+            self._log_bytes = 0
+            self._log_ino = None
+
+    def clear(self):
+        with self.locked():
+            for p in (self.path, self.log_path):
+                if os.path.exists(p):
+                    os.remove(p)
+            self.seq = 0
+            self.state = None
+            self._snap_sig = None
+            self._log_bytes = 0
+            self._log_ino = None
@@ -0,0 +1,95 @@
+import random
+from datetime import datetime
+
+import analytics
+from analytics import NightArchive, SessionStats, night_of
+from matchlog import MatchRecord
+from scheduler import Scheduler
+from storage import apply_event
+
+NAMES = ["甲", "乙", "丙", "丁", "戊", "己"]
+
+
+def evening(start, n=12, seed=0):
+    rng = random.Random(seed)
+    records, t = [], start
+    for _ in range(n):
+        four = rng.sample(NAMES, 4)
+        records.append(MatchRecord(rng.choice([1, 2]), four[:2], four[2:], start=t, end=t + 700,
+                                   winner=rng.choice([1, 2, None])))
+        t += 720
+    return records
+
+
+def level_of(name):
+    return "有點累組"
+
+
+def test_incremental_matches_rebuild_and_journal():
+    start = datetime(2026, 3, 6, 19, 0).timestamp()
+    records = evening(start)
+    stats = SessionStats(started=start)
+    state = stats.to_dict()
+    for r in records:
+        stats.observe(r, [level_of(n) for n in r.players()])
+        # 只寫改到的欄位，重播後要和整份一樣
+        for path, value in stats.take_changes():
+            state = apply_event(state, {"op": "set", "path": list(path), "value": value})
+    assert state == stats.to_dict()
+    assert SessionStats.rebuild(records, level_of).to_dict() == stats.to_dict()
+    assert sum(row[0] for row in stats.players.values()) == 4 * len(records)
+
+
+def test_night_cutoff():
+    assert night_of(datetime(2026, 3, 7, 1, 30).timestamp()) == "2026-03-06"
+    assert night_of(datetime(2026, 3, 7, 6, 30).timestamp()) == "2026-03-07"
+
+
+def test_archive_save_load_and_discard(tmp_path):
+    archive = NightArchive(str(tmp_path / "analytics.db"))
+    nights = []
+    for day in (6, 13, 20):
+        start = datetime(2026, 3, day, 19, 0).timestamp()
+        stats = SessionStats.rebuild(evening(start, seed=day), level_of)
+        archive.save(stats)
+        nights.append(stats)
+    archive.save(nights[1])   # 同一晚再存一次是更新，不會多一列
+    archive.save(SessionStats(started=0.0))   # 沒有比賽的晚上不存
+    loaded = archive.load("2026-03-06", "2026-03-13")
+    assert [n.to_dict() for n in loaded] == [n.to_dict() for n in nights[:2]]
+    assert len(archive.load()) == 3
+    merged = analytics.merge(archive.load())
+    assert merged.players["甲"][0] == sum(n.players.get("甲", [0])[0] for n in nights)
+    archive.discard(nights[0].started)
+    assert [n.started for n in archive.load()] == [n.started for n in nights[1:]]
+
+
+def test_scheduler_starts_a_new_night_after_the_cutoff():
+    class Clock:
+        now = datetime(2026, 3, 6, 21, 0).timestamp()
+
+        def __call__(self):
+            return self.now
+
+    clock = Clock()
+    sched = Scheduler(rng=random.Random(0), clock=clock)
+    for name in NAMES:
+        sched.add_player(name)
+    sched.set_court_count(1)
+    sched.fill_courts()
+    sched.start_game(1)
+    clock.now += 700
+    sched.finish_and_next(1)
+    sched.start_game(1)
+    first = sched.stats
+    clock.now = datetime(2026, 3, 13, 20, 0).timestamp()   # 沒清除就到了下週
+    sched.finish_and_next(1)
+    assert sched.closed_nights == [first]
+    assert sched.stats.night() == "2026-03-13"
+    assert sum(row[0] for row in sched.stats.players.values()) == 4
+    # 跨過換日時間的那場之後，同一晚的比賽不會再換一次
+    sched.start_game(1)
+    clock.now += 700
+    sched.finish_and_next(1)
+    assert sched.closed_nights == [first]
+    assert sum(row[0] for row in sched.stats.players.values()) == 8
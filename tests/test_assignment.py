@@ -0,0 +1,87 @@
+from itertools import combinations
+
+import numpy as np
+
+import assignment
+from assignment import PAIRINGS
+
+
+def scalar_score(q, games, ratings, partner, opponent):
+    """一組一組算的版本：回傳 (成本, 最佳分隊 index)"""
+    fair = sum(games[i] - min(games) for i in q) + assignment.RANK_EPS * sum(q)
+    costs = []
+    for order in PAIRINGS:
+        a, b, c, d = (q[i] for i in order)
+        diff = abs(ratings[a] + ratings[b] - ratings[c] - ratings[d])
+        repeats = (assignment.PARTNER_WEIGHT * (partner[a][b] + partner[c][d])
+                   + assignment.OPPONENT_WEIGHT * sum(opponent[x][y] for x in (a, b) for y in (c, d)))
+        costs.append(assignment.BALANCE_WEIGHT * diff + repeats)
+    best = min(range(3), key=lambda i: costs[i])
+    return assignment.FAIR_WEIGHT * fair + costs[best], best
+
+
+def random_pool(rng, m):
+    games = rng.integers(0, 4, size=m).astype(float)
+    ratings = rng.normal(1500, 200, size=m)
+    partner = np.triu(rng.integers(0, 3, size=(m, m)), 1)
+    opponent = np.triu(rng.integers(0, 3, size=(m, m)), 1)
+    return games, ratings, partner + partner.T, opponent + opponent.T
+
+
+def test_vectorized_scores_match_scalar():
+    rng = np.random.default_rng(0)
+    m = 10
+    games, ratings, partner, opponent = random_pool(rng, m)
+    quartets = np.array(list(combinations(range(m), 4)))
+    forbidden = np.zeros(len(quartets), dtype=bool)
+    forbidden[::7] = True
+    cost, best = assignment.score_quartets(quartets, games, ratings, forbidden, partner, opponent)
+    for i, q in enumerate(quartets):
+        if forbidden[i]:
+            assert np.isinf(cost[i])
+            continue
+        expected_cost, expected_best = scalar_score(list(q), games, ratings, partner, opponent)
+        assert np.isclose(cost[i], expected_cost)
+        assert best[i] == expected_best
+
+
+def test_best_pairings_matches_brute_force():
+    rng = np.random.default_rng(1)
+    r = rng.normal(1500, 200, size=(50, 4))
+    best, diff = assignment.best_pairings(r)
+    for row, b, d in zip(r, best, diff):
+        diffs = [abs(row[o[0]] + row[o[1]] - row[o[2]] - row[o[3]]) for o in PAIRINGS]
+        assert np.isclose(d, min(diffs))
+        assert np.isclose(diffs[b], min(diffs))
+
+
+def test_assign_fills_courts_with_disjoint_compatible_groups():
+    rng = np.random.default_rng(2)
+    m = 18
+    games, ratings, _, _ = random_pool(rng, m)
+    levels = rng.integers(0, 3, size=m)
+    groups = assignment.assign(games, ratings, levels, 3, np.random.default_rng(0), time_budget=0.05)
+    assert len(groups) == 3
+    used = [i for g in groups for i in g]
+    assert len(used) == len(set(used)) == 12
+    for g in groups:
+        lv = set(levels[list(g)])
+        assert not (0 in lv and 2 in lv)
+
+
+def test_assign_never_worse_than_seeds():
+    rng = np.random.default_rng(3)
+    m = 16
+    games, ratings, _, _ = random_pool(rng, m)
+    levels = np.ones(m, dtype=int)
+    seeds = [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+    groups = assignment.assign(games, ratings, levels, 3, np.random.default_rng(0),
+                               time_budget=0.05, seeds=seeds)
+
+    def total(gs):
+        q = np.array([sorted(g) for g in gs])
+        cost, _ = assignment.score_quartets(q, games, ratings, np.zeros(len(q), dtype=bool))
+        return cost.sum()
+
+    assert len(groups) == 3
+    assert total(groups) <= total(seeds) + 1e-9
@@ -0,0 +1,61 @@
+import random
+
+from scheduler import LEVELS, CandidateIndex, Scheduler
+
+
+def make_sched(seed, n_players=40):
+    rng = random.Random(seed)
+    sched = Scheduler(rng=random.Random(seed), clock=lambda: 1000.0)
+    for i in range(n_players):
+        sched.add_player(f"p{i}", rng.choice(LEVELS))
+    for name in rng.sample(sorted(sched.ids), n_players // 2):
+        p = sched.get(name)
+        sched.edit_player(name, name, p.level, rng.randrange(4))
+    for name in rng.sample(sorted(sched.ids), n_players // 8):
+        sched.toggle_active(name)
+    return sched
+
+
+def greedy_scan(sched, exclude=(), count=4):
+    """原本的做法：整個休息區排序後，從第一名開始往後湊相容的四人"""
+    ranked = [pid for pid in sched.index.ordered() if pid not in exclude]
+    for seed in ranked:
+        group = [seed]
+        for other in ranked:
+            if other != seed and sched.is_compatible(group + [other]):
+                group.append(other)
+            if len(group) == count:
+                return group
+    return None
+
+
+def test_next_group_matches_full_scan():
+    for seed in range(30):
+        sched = make_sched(seed)
+        exclude = set(random.Random(seed).sample(sorted(sched.index.ordered()), 5))
+        expected = greedy_scan(sched, exclude)
+        group = sched.next_group(exclude=exclude)
+        assert set(group) == set(expected), seed
+
+
+def test_index_only_holds_waiting_players():
+    sched = make_sched(0)
+    sched.fill_courts()
+    waiting = {pid for pid, p in sched.players.items() if p.active and pid not in sched.on_court()}
+    assert set(sched.index.ordered()) == waiting
+    assert len(sched.index) == len(waiting)
+
+
+def test_stale_entries_are_skipped():
+    index = CandidateIndex()
+    for pid in range(10):
+        index.push(pid, 0.0, LEVELS[0], tie=pid)
+    for _ in range(5):   # 反覆更新，舊 entry 留在 heap 裡
+        for pid in range(10):
+            index.push(pid, index.key(pid) + 1.0, LEVELS[0], tie=pid)
+    index.push(3, -1.0, LEVELS[0], tie=3)
+    index.discard(0)
+    top = [e[2] for e in index.top(LEVELS[0], 4)]
+    assert top == [3, 1, 2, 4]
+    assert [e[2] for e in index.top(LEVELS[0], 2, skip={3})] == [1, 2]
+    assert index.ordered() == [3, 1, 2, 4, 5, 6, 7, 8, 9]
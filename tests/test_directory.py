@@ -0,0 +1,71 @@
+import time
+
+import directory
+from directory import MemberDirectory
+
+
+def make_directory(tmp_path):
+    return MemberDirectory(str(tmp_path / "members.db"))
+
+
+def test_check_in_counts_sessions_per_day(tmp_path, monkeypatch):
+    d = make_directory(tmp_path)
+    now = time.time()
+    monkeypatch.setattr(directory.time, "time", lambda: now)
+    m = d.check_in("小明", "死亡之組", rating=1700)
+    assert (m.level, m.rating, m.sessions) == ("死亡之組", 1700, 1)
+    # 同一晚重複報到不算兩次，分組沿用名錄裡的
+    assert d.check_in("小明", "休閒組").sessions == 1
+    assert d.get("小明").level == "死亡之組"
+    monkeypatch.setattr(directory.time, "time", lambda: now + 86400)
+    assert d.check_in("小明", "休閒組").sessions == 2
+
+
+def test_stage_is_written_on_flush(tmp_path):
+    d = make_directory(tmp_path)
+    d.check_in("小明", "有點累組")
+    d.stage("小明", games=1, rating=1510.0, rated_games=1)
+    d.stage("小明", games=1, rating=1525.0, rated_games=2)
+    assert d.get("小明").lifetime_games == 0
+    d.flush()
+    m = d.get("小明")
+    assert (m.lifetime_games, m.rating, m.rated_games) == (2, 1525.0, 2)
+    # 另一個連線 (例如重開程式) 讀到的是同一份
+    assert MemberDirectory(d.path).get("小明").lifetime_games == 2
+
+
+def test_stage_flushes_after_a_batch(tmp_path):
+    d = make_directory(tmp_path)
+    names = [f"p{i}" for i in range(directory.FLUSH_BATCH)]
+    for name in names:
+        d.check_in(name, "有點累組")
+    for name in names:
+        d.stage(name, games=1)
+    assert all(d.get(name).lifetime_games == 1 for name in names)
+
+
+def test_rename_merges_into_existing_member(tmp_path):
+    d = make_directory(tmp_path)
+    d.check_in("小明", "有點累組")
+    d.stage("小明", games=3)
+    d.check_in("王小明", "有點累組")
+    d.stage("王小明", games=2)
+    d.rename("小明", "王小明", ["小明"])
+    assert d.get("小明") is None
+    m = d.get("王小明")
+    assert (m.lifetime_games, m.sessions, m.aliases) == (5, 2, ["小明"])
+    assert d.aliases() == {"王小明": ["小明"]}
+
+
+def test_ensure_and_recent(tmp_path):
+    d = make_directory(tmp_path)
+    d.ensure("舊會員", "休閒組", aliases=["老王"])
+    d.ensure("舊會員", "死亡之組")   # 已經有了就不動
+    assert d.get("舊會員").level == "休閒組"
+    assert d.get("舊會員").sessions == 0
+    d.check_in("甲", "有點累組")
+    time.sleep(0.01)
+    d.check_in("乙", "有點累組")
+    assert [m.name for m in d.recent()] == ["乙", "甲", "舊會員"]
+    assert [m.name for m in d.recent(limit=1, exclude={"乙"})] == ["甲"]
+    assert len(d) == 3
@@ -0,0 +1,87 @@
+import random
+
+from durations import DEFAULT_SECONDS, DurationModel
+from scheduler import STAGE_LEAD, Scheduler
+
+LEVELS4 = ["有點累組"] * 4
+
+
+def test_estimate_learns_from_matches():
+    model = DurationModel()
+    names = ["甲", "乙", "丙", "丁"]
+    assert model.estimate(names, LEVELS4) == DEFAULT_SECONDS
+    assert model.observe(names, LEVELS4, 20 * 60.0)
+    once = model.estimate(names, LEVELS4)
+    # 一場就往實際時間靠，但樣本少時不會整個跳過去
+    assert DEFAULT_SECONDS < once < 20 * 60.0
+    for _ in range(30):
+        model.observe(names, LEVELS4, 20 * 60.0)
+    assert abs(model.estimate(names, LEVELS4) - 20 * 60.0) < 60.0
+    # 沒打過的人先用分組的平均
+    assert model.estimate(["新人"], ["有點累組"]) > DEFAULT_SECONDS
+    assert model.estimate(["新人"], ["休閒組"]) == DEFAULT_SECONDS
+
+
+def test_outliers_are_ignored():
+    model = DurationModel()
+    assert not model.observe(["甲"], ["有點累組"], 30.0)        # 按錯
+    assert not model.observe(["甲"], ["有點累組"], 3 * 3600.0)  # 忘了按結束
+    assert not model.observe(["甲"], ["有點累組"], None)
+    assert model.to_dict() == {"levels": {}, "players": {}}
+
+
+def test_round_trip_and_rename():
+    model = DurationModel()
+    model.observe(["甲", "乙"], ["死亡之組", "死亡之組"], 600.0)
+    again = DurationModel.from_dict(model.to_dict())
+    assert again.estimate(["甲"], ["死亡之組"]) == model.estimate(["甲"], ["死亡之組"])
+    again.rename("甲", "小甲")
+    assert again.estimate(["小甲"], ["死亡之組"]) == model.estimate(["甲"], ["死亡之組"])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100000.0
+
+    def __call__(self):
+        return self.now
+
+
+def playing_sched(n_players=14):
+    clock = Clock()
+    sched = Scheduler(rng=random.Random(0), clock=clock)
+    for i in range(n_players):
+        sched.add_player(f"p{i}")
+    sched.fill_courts()
+    for c_id in sched.courts:
+        sched.start_game(c_id)
+    return sched, clock
+
+
+def test_stage_only_near_expected_end():
+    sched, clock = playing_sched()
+    assert sched.stage_next() is None
+    clock.now += DEFAULT_SECONDS - STAGE_LEAD + 1
+    court_id, group = sched.stage_next()
+    assert court_id in sched.courts
+    assert not set(group) & sched.on_court()
+    assert sched.staged == {court_id: group}
+    assert sched.stage_next() is None   # 一次只預告一組
+
+
+def test_staged_group_goes_on_when_court_finishes():
+    sched, clock = playing_sched()
+    clock.now += DEFAULT_SECONDS
+    court_id, group = sched.stage_next()
+    _, next_group = sched.finish_and_next(court_id)
+    assert set(next_group) == set(group)
+    assert court_id not in sched.staged
+
+
+def test_stage_dropped_when_player_leaves():
+    sched, clock = playing_sched()
+    clock.now += DEFAULT_SECONDS
+    court_id, group = sched.stage_next()
+    sched.toggle_active(sched.players[group[0]].name)
+    assert sched.prune_stages()
+    assert sched.staged == {}
@@ -0,0 +1,80 @@
+import random
+
+from scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def one_court(seed, n_players=9):
+    clock = Clock()
+    sched = Scheduler(rng=random.Random(seed), clock=clock)
+    for i in range(n_players):
+        sched.add_player(f"e{i}")
+    sched.set_court_count(1)
+    sched.fill_courts()
+    sched.start_game(1)
+    return sched, clock
+
+
+def play(sched, clock, minutes=12):
+    clock.now += minutes * 60
+    sched.finish_and_next(1)
+    sched.start_game(1)
+
+
+def test_late_arrivals_and_breaks_get_fair_rates():
+    for seed in range(5):
+        sched, clock = one_court(seed)
+        for step in range(15):
+            if step == 2:
+                sched.toggle_active("e0")   # 暫離一小時
+            if step == 4:
+                for i in range(4):
+                    sched.add_player(f"l{i}")   # 一小時後才到
+            if step == 7:
+                sched.toggle_active("e0")
+            play(sched, clock)
+        rates = [sched.games_per_hour(p) for p in sched.players.values()]
+        # 一場的差距 (兩小時 0.5 場/時) 以內：晚到、暫離的人沒有被補過頭也沒有被冷落
+        assert max(rates) - min(rates) <= 0.6, seed
+
+
+def test_late_arrival_does_not_jump_the_queue():
+    sched, clock = one_court(0)
+    for _ in range(5):
+        play(sched, clock)
+    late = sched.add_player("晚到")
+    waiting = [p.name for p in sched.waiting()]
+    # 只打了一兩場的老面孔還是排在剛到、0 場的人前面
+    assert waiting[0] != "晚到"
+    assert sched.priority(late) > min(sched.priority(p) for p in sched.waiting() if p is not late)
+
+
+def test_break_time_is_not_counted():
+    sched, clock = one_court(0)
+    p = sched.get("e8")
+    clock.now += 600
+    sched.toggle_active("e8")
+    clock.now += 3600
+    assert p.active_seconds(clock.now) == 600
+    sched.toggle_active("e8")
+    clock.now += 300
+    assert p.active_seconds(clock.now) == 900
+    assert p.last_end == clock.now - 300   # 回來後才開始算等待
+
+
+def test_longer_wait_goes_first():
+    clock = Clock()
+    sched = Scheduler(rng=random.Random(0), clock=clock)
+    a = sched.add_player("甲")
+    b = sched.add_player("乙")
+    a.last_end -= 1800   # 一樣的場次與到場時間，甲多等了半小時
+    sched._reindex(a.id)
+    assert sched.priority(a) < sched.priority(b)
+    assert [p.name for p in sched.waiting()] == ["甲", "乙"]
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import matchlog
+from matchlog import MatchLog, MatchRecord, query_archive, write_archive
+
+
+def match(i, day, court=1, players=("甲", "乙", "丙", "丁"), winner=None):
+    end = datetime(2026, 3, day, 20, 0).timestamp() + 60 * i
+    return MatchRecord(court, players[:2], players[2:], start=end - 600, end=end,
+                       winner=winner, id=f"m{day}-{i}")
+
+
+def test_record_round_trip_and_legacy_strings():
+    r = match(0, 6, winner=2)
+    assert MatchRecord.from_dict(r.to_dict()).to_dict() == r.to_dict()
+    old = MatchRecord.from_dict("場地 2: 甲+乙 vs 丙+丁 (🏆 隊伍 1)")
+    assert (old.court, old.team1, old.team2, old.winner) == (2, ("甲", "乙"), ("丙", "丁"), 1)
+    partial = MatchRecord.from_dict("場地 3: 甲+乙")
+    assert (partial.team1, partial.team2) == (("甲", "乙"), ())
+    assert MatchRecord.from_dict("亂七八糟") is None
+
+
+def test_overflow_takes_oldest_batch():
+    log = MatchLog()
+    total = matchlog.RECENT_SIZE + matchlog.ARCHIVE_BATCH
+    for i in range(total):
+        log.add(match(i, 6))
+    assert log.take_overflow() == []
+    log.add(match(total, 6))
+    old = log.take_overflow()
+    # 和 MatchLog 一樣新的在前
+    assert [r.id for r in old] == [f"m6-{i}" for i in reversed(range(total + 1 - matchlog.RECENT_SIZE))]
+    assert len(log) == matchlog.RECENT_SIZE
+    assert log[0].id == f"m6-{total}"   # 新的在前
+    log.put_back(old)
+    assert len(log) == total + 1 and log[-1].id == "m6-0"
+
+
+def test_archive_round_trip_with_filters(tmp_path):
+    archive = str(tmp_path / "archive")
+    first = [match(i, 6, winner=1) for i in range(5)]
+    second = [match(i, 13, players=("戊", "乙", "己", "庚")) for i in range(3)]
+    write_archive(first + second, archive_dir=archive)
+
+    df = query_archive(archive)
+    assert sorted(df["id"]) == sorted(r.id for r in first + second)
+    row = df[df["id"] == "m6-0"].iloc[0]
+    assert (row["team1_a"], row["team2_b"], row["winner"], row["date"]) == ("甲", "丁", 1, "2026-03-06")
+    assert row["end"] == first[0].end
+
+    assert sorted(query_archive(archive, player="戊")["id"]) == sorted(r.id for r in second)
+    assert sorted(query_archive(archive, player="乙", start_date="2026-03-07")["id"]) == \
+        sorted(r.id for r in second)
+    assert len(query_archive(archive, end_date="2026-03-06")) == 5
+    assert len(query_archive(archive, player="沒這個人")) == 0
+
+
+def test_archive_drops_duplicate_batches(tmp_path):
+    archive = str(tmp_path / "archive")
+    batch = [match(i, 6) for i in range(4)]
+    write_archive(batch, archive_dir=archive)
+    write_archive(batch, archive_dir=archive)   # 寫完封存、還沒存檔就當機，重來一次
+    assert len(query_archive(archive)) == 4
+
+
+def test_query_missing_archive(tmp_path):
+    df = query_archive(str(tmp_path / "nothing"))
+    assert len(df) == 0 and "date" in df.columns
@@ -0,0 +1,53 @@
+import random
+
+from nameindex import NameIndex, normalize
+
+
+def test_normalize_ignores_emoji_width_and_case():
+    assert normalize("ＡＢＣ小明") == normalize("abc小明")
+    assert normalize("🏸小明✨") == "小明"
+    assert normalize("Kevin 🇹🇼") == "kevin"
+    assert normalize("👍🏻") == "👍🏻"   # 全是符號時保留原字串，不會變成空 key
+
+
+def test_exact_normalized_and_alias():
+    index = NameIndex({"小明": [], "Kevin": ["阿凱"]})
+    assert index.suggest("小明") == ("小明", 1.0)
+    assert index.suggest("🏸 小明") == ("小明", 1.0)
+    assert index.suggest("ＫＥＶＩＮ") == ("Kevin", 1.0)
+    assert index.suggest("阿凱") == ("Kevin", 1.0)
+
+
+def test_typo_and_no_match():
+    index = NameIndex({"王大明": [], "李小華": [], "陳志豪": []})
+    name, score = index.suggest("王大名")
+    assert name == "王大明" and 0.6 <= score < 1.0
+    assert index.suggest("張三") is None
+
+
+def test_rename_keeps_old_name_as_alias():
+    index = NameIndex({"小明": ["明明"]})
+    index.rename("小明", "王小明")
+    assert "小明" not in index
+    assert index.members["王小明"] == ["明明", "小明"]
+    assert index.suggest("小明") == ("王小明", 1.0)
+    assert index.suggest("明明") == ("王小明", 1.0)
+
+
+def test_remove_drops_all_keys():
+    index = NameIndex({"小明": ["明明"], "小華": []})
+    index.remove("小明")
+    assert index.suggest("明明") is None
+    assert index.suggest("小明") != ("小明", 1.0)
+    assert len(index) == 1
+
+
+def test_finds_typos_among_many_members():
+    rng = random.Random(0)
+    chars = "王李張陳林黃吳劉蔡楊明華志豪文雅婷怡君偉傑宏"
+    names = sorted({"".join(rng.sample(chars, 3)) for _ in range(1500)})
+    index = NameIndex({n: [] for n in names})
+    for name in rng.sample(names, 50):
+        decorated = name + "🏸"
+        assert index.suggest(decorated) == (name, 1.0)
+        assert index.suggest(name[:2] + "X" + name[2:])[0] == name
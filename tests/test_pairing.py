@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+
+from pairing import DENSE_LIMIT, PairMatrix, pair_key
+
+
+def play(matrix, matches):
+    for pids in matches:
+        matrix.record(pids)
+
+
+def random_matches(rng, ids, n):
+    return [rng.sample(ids, 4) for _ in range(n)]
+
+
+def reference_counts(matches):
+    counts = {}
+    for a, b, c, d in matches:
+        for x, y, kind in ((a, b, 0), (c, d, 0), (a, c, 1), (a, d, 1), (b, c, 1), (b, d, 1)):
+            counts.setdefault((min(x, y), max(x, y)), [0, 0])[kind] += 1
+    return counts
+
+
+def test_record_and_counts():
+    m = PairMatrix()
+    m.record([1, 2, 3, 4])
+    m.record([1, 2, 3, 5])
+    assert m.counts(1, 2) == (2, 0)
+    assert m.counts(2, 1) == (2, 0)
+    assert m.counts(1, 3) == (0, 2)
+    assert m.counts(4, 5) == (0, 0)
+    assert m.met([1, 2, 3, 4]) == 2 + 2 + 2 + 1 + 1 + 1
+
+
+def test_switches_to_sparse_above_limit_and_keeps_counts():
+    rng = random.Random(0)
+    low = random_matches(rng, list(range(60)), 200)
+    m = PairMatrix()
+    play(m, low)
+    assert m.dense
+    dense_sub = m.submatrix(list(range(60)))
+
+    high = random_matches(rng, list(range(DENSE_LIMIT - 10, DENSE_LIMIT + 50)), 50)
+    play(m, high)
+    assert not m.dense
+    expected = reference_counts(low + high)
+    for (a, b), (p, o) in expected.items():
+        assert m.counts(a, b) == (p, o)
+    # 稀疏模式取出的子矩陣和密集時一樣
+    sparse_sub = m.submatrix(list(range(60)))
+    assert np.array_equal(dense_sub[0], sparse_sub[0])
+    assert np.array_equal(dense_sub[1], sparse_sub[1])
+
+
+def test_round_trip_in_both_modes():
+    rng = random.Random(1)
+    for ids in (list(range(50)), list(range(DENSE_LIMIT + 100))):
+        m = PairMatrix()
+        play(m, random_matches(rng, ids, 100))
+        again = PairMatrix.from_dict(m.to_dict())
+        assert again.dense == m.dense
+        assert again.to_dict() == m.to_dict()
+        assert again.max_id() == m.max_id()
+
+
+def test_drop_clears_row_in_both_modes():
+    for big in (False, True):
+        m = PairMatrix()
+        m.record([1, 2, 3, 4])
+        m.record([2, 5, 3, 6])
+        if big:
+            m.record([DENSE_LIMIT + 1, 7, 8, 9])
+        dropped = m.drop(2)
+        assert sorted(dropped) == sorted(pair_key(2, x) for x in (1, 3, 4, 5, 6))
+        assert all(m.counts(2, x) == (0, 0) for x in range(10))
+        assert m.counts(1, 3) == (0, 1)
+        assert m.drop(2) == []
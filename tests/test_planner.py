@@ -0,0 +1,66 @@
+import random
+
+import planner
+from scheduler import LEVELS
+
+
+def players(n, seed=0):
+    rng = random.Random(seed)
+    return [(f"p{i}", rng.choice(LEVELS), None) for i in range(n)]
+
+
+def full_cost(search):
+    """從頭重算整份排程的成本，和退火時一路累加的結果比對"""
+    fresh = planner._Search(search.n, search.courts, search.rounds, search.strength,
+                            search.masks, search.balancing, random.Random(0))
+    fresh.slots = [list(s) for s in search.slots]
+    fresh.is_sitting = [list(s) for s in search.is_sitting]
+    for slots in fresh.slots:
+        for p in slots:
+            fresh.games[p] += 1
+    cost = sum(planner.FAIR_WEIGHT * g * g for g in fresh.games)
+    for r in range(fresh.rounds):
+        cost += fresh._sit_cost_all(r)
+        for c in range(fresh.courts):
+            cost += fresh._add_court(r, c)
+    return cost
+
+
+def test_incremental_cost_matches_full_recompute():
+    ps = players(18)
+    search = planner._Search(18, 3, 8, [1500.0 + 50 * i for i in range(18)],
+                             [1 << LEVELS.index(lv) for _, lv, _ in ps], True, random.Random(1))
+    search.seed()
+    assert abs(search.cost - full_cost(search)) < 1e-6
+    rng = random.Random(2)
+    for _ in range(2000):
+        r = rng.randrange(search.rounds)
+        if search.sitting[r] and rng.random() < 0.5:
+            search.cost += search.swap_sitter(r, rng.randrange(12), rng.randrange(len(search.sitting[r])))
+        else:
+            search.cost += search.swap_slots(r, rng.randrange(12), rng.randrange(12))
+    assert abs(search.cost - full_cost(search)) < 1e-6
+
+
+def test_games_are_balanced():
+    plan = planner.plan_evening(players(22), n_courts=4, n_rounds=12, seed=0,
+                                iterations=20_000, time_budget=5.0)
+    games = plan.games()
+    assert max(games.values()) - min(games.values()) <= 1
+    assert plan.stats["incompatible"] == 0
+
+
+def test_every_round_uses_each_player_once():
+    names = [p[0] for p in players(17)]
+    plan = planner.plan_evening(players(17), n_courts=3, n_rounds=6, seed=1,
+                                iterations=5_000, time_budget=5.0)
+    for courts, sitting in zip(plan.rounds, plan.sitting):
+        on_court = [name for team1, team2 in courts for name in team1 + team2]
+        assert len(on_court) == len(set(on_court)) == 12
+        assert sorted(on_court + sitting) == sorted(names)
+
+
+def test_same_seed_same_plan():
+    a = planner.plan_evening(players(12), 2, 5, seed=3, iterations=3_000, time_budget=5.0)
+    b = planner.plan_evening(players(12), 2, 5, seed=3, iterations=3_000, time_budget=5.0)
+    assert a.rounds == b.rounds
@@ -0,0 +1,53 @@
+import random
+
+from scheduler import Scheduler
+
+
+def make_sched(n_players=16, courts=2):
+    sched = Scheduler(rng=random.Random(0), clock=lambda: 1000.0)
+    for i in range(n_players):
+        sched.add_player(f"p{i}")
+    sched.set_court_count(courts)
+    return sched
+
+
+def test_more_courts_show_up_in_preview():
+    sched = make_sched()
+    assert set(sched.preview()) == {1, 2}
+    sched.set_court_count(3)
+    assert set(sched.preview()) == {1, 2, 3}
+    assert set(sched.fill_courts()) == {1, 2, 3}
+
+
+def test_removed_court_is_not_filled():
+    sched = make_sched(courts=3)
+    assert set(sched.preview()) == {1, 2, 3}
+    sched.set_court_count(2)
+    assert set(sched.preview()) == {1, 2}
+    assert set(sched.fill_courts()) == {1, 2}
+    assert set(sched.courts) == {1, 2}
+    assert set(sched.court_status) == {1, 2}
+
+
+def test_set_court_count_returns_added_and_removed():
+    sched = make_sched(courts=2)
+    assert sched.set_court_count(4) == ([3, 4], [])
+    assert sched.set_court_count(4) == ([], [])
+    assert sched.set_court_count(1) == ([], [2, 3, 4])
+    assert set(sched.courts) == {1}
+    assert set(sched.court_status) == {1}
+
+
+def test_removing_occupied_court_frees_its_players():
+    sched = make_sched(courts=2)
+    sched.fill_courts()
+    sched.start_game(2)
+    on_court2 = sched.court_names(2)
+    sched.set_court_count(1)
+    assert 2 not in sched.courts and 2 not in sched.court_started
+    waiting = {p.name for p in sched.waiting()}
+    assert set(on_court2) <= waiting
+    assert sched.on_court() == set(sched.courts[1])
+    # 空出來的人馬上可以排到剩下的場地
+    sched.reset_court(1)
+    assert set(sched.fill_courts()) == {1}
@@ -0,0 +1,93 @@
+import http.client
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import scoreboard
+from scheduler import Scheduler
+from storage import StateStore
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """看板伺服器 (背景輪詢存檔)，回傳 (存檔, 連線函式)"""
+    monkeypatch.setattr(scoreboard, "POLL_SECONDS", 0.05)
+    sched = Scheduler(rng=random.Random(0), clock=lambda: 1000.0)
+    for i in range(10):
+        sched.add_player(f"p{i}")
+    sched.fill_courts()
+    store = StateStore(str(tmp_path / "state.json"))
+    store.snapshot(sched.to_dict())
+
+    board = scoreboard.Board(store.path)
+    threading.Thread(target=board.poll_forever, daemon=True).start()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), scoreboard.make_handler(board))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def get(path, etag=None):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+        conn.request("GET", path, headers={"If-None-Match": etag} if etag else {})
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, resp.getheader("ETag"), body
+
+    yield store, get
+    server.shutdown()
+    server.server_close()
+
+
+def test_board_content(served):
+    store, get = served
+    status, etag, body = get("/api/board")
+    assert status == 200 and etag
+    board = json.loads(body)
+    assert [c["id"] for c in board["courts"]] == [1, 2]
+    assert [len(c["players"]) for c in board["courts"]] == [4, 4]
+    assert [w["name"] for w in board["waiting"]] == [p.name for p in Scheduler.from_dict(store.load()).waiting()]
+
+
+def test_etag_gives_304_until_state_changes(served):
+    store, get = served
+    _, etag, _ = get("/api/board")
+    status, same, body = get("/api/board", etag)
+    assert (status, same, body) == (304, etag, b"")
+    store.append("set", ["courts", "2"], [])
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        status, new, _ = get("/api/board", etag)
+        if status == 200:
+            break
+        time.sleep(0.05)
+    assert status == 200 and new != etag
+
+
+def test_long_poll_returns_on_change(served):
+    store, get = served
+    _, etag, _ = get("/api/board")
+    threading.Timer(0.3, store.append, args=("set", ["courts", "2"], [])).start()
+    start = time.time()
+    status, new, body = get("/api/board?wait=10", etag)
+    assert status == 200 and new != etag
+    assert time.time() - start < 5
+    assert json.loads(body)["courts"][1]["players"] == []
+
+
+def test_long_poll_times_out_with_304(served):
+    _, get = served
+    _, etag, _ = get("/api/board")
+    start = time.time()
+    assert get("/api/board?wait=0.3", etag)[0] == 304
+    assert time.time() - start >= 0.25
+    assert get("/api/board?wait=abc", etag)[0] == 304   # 參數壞掉就不等
+
+
+def test_page_and_404(served):
+    _, get = served
+    status, _, body = get("/")
+    assert status == 200 and b"/api/board" in body
+    assert get("/nope")[0] == 404
@@ -0,0 +1,120 @@
+import json
+import os
+
+from storage import Cursor, StateStore, apply_event
+
+
+def make_store(tmp_path, data=None):
+    store = StateStore(str(tmp_path / "state.json"))
+    store.snapshot(data or {"players": {}, "courts": {}})
+    return store
+
+
+def test_apply_event_does_not_modify_old_state():
+    old = {"players": {"a": {"games": 1}}, "courts": {"1": ["a"]}}
+    new = apply_event(old, {"op": "set", "path": ["players", "a", "games"], "value": 2})
+    assert old["players"]["a"]["games"] == 1
+    assert new["players"]["a"]["games"] == 2
+    assert new["courts"] is old["courts"]   # 沒改到的分支共用
+
+
+def test_replay_skips_torn_last_line(tmp_path):
+    store = make_store(tmp_path)
+    store.append("set", ["players", "a"], {"games": 1})
+    store.append_many([("set", ["players", "b"], {"games": 0}, {}),
+                       ("set", ["courts", "1"], ["a", "b"], {})])
+    # 當機：最後一個動作只寫了半行
+    with open(store.log_path, "ab") as f:
+        f.write(b'{"seq": 99, "events": [{"op": "set", "path": ["players", "c"], "val')
+
+    reader = StateStore(store.path)
+    data = reader.load()
+    assert set(data["players"]) == {"a", "b"}
+    assert data["courts"] == {"1": ["a", "b"]}
+
+    # 接著寫的事件不會黏在壞掉的那行後面
+    reader.append("set", ["players", "d"], {"games": 0})
+    data = StateStore(store.path).load()
+    assert set(data["players"]) == {"a", "b", "d"}
+
+
+def test_append_after_torn_line_tracks_file_size(tmp_path):
+    store = make_store(tmp_path)
+    store.append("set", ["players", "a"], {"games": 1})
+    with open(store.log_path, "ab") as f:
+        f.write(b'{"seq": 99, "op": "set", "pa')
+
+    store.append("set", ["players", "b"], {"games": 0})
+    assert store._log_bytes == os.path.getsize(store.log_path)
+    # 位移正確：之後的同步只讀新的行，不會整份重讀
+    other = StateStore(store.path)
+    other.load()
+    other.append("set", ["players", "c"], {"games": 0})
+    cursor = Cursor()
+    cursor.seq = store.seq
+    data = store.sync(cursor)
+    assert set(data["players"]) == {"a", "b", "c"}
+    assert store._log_bytes == os.path.getsize(store.log_path)
+
+
+def test_batch_is_one_line_with_one_seq(tmp_path):
+    store = make_store(tmp_path)
+    before = store.seq
+    record = []
+    store.append_many([("set", ["players", "a"], {"games": 1}, {}),
+                       ("set", ["players", "a", "games"], 2, {}),
+                       ("del", ["courts", "1"], None, {})], record=record)
+    assert store.seq == before + 1
+    with open(store.log_path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1 and len(json.loads(lines[0])["events"]) == 3
+    # 每筆都記下寫入前的值 (依序套用)
+    assert [b for _, b in record][1] == 1
+    assert StateStore(store.path).load()["players"] == {"a": {"games": 2}}
+
+
+def test_sync_across_compaction(tmp_path):
+    """另一台裝置讀到一半時被壓縮成快照，下次同步仍拿到完整的狀態"""
+    writer = make_store(tmp_path)
+    reader = StateStore(writer.path)
+    cursor = Cursor()
+    reader.load(cursor)
+
+    writer.append("set", ["players", "a"], {"games": 1})
+    assert reader.sync(cursor)["players"] == {"a": {"games": 1}}
+
+    writer.append("set", ["players", "b"], {"games": 0})
+    writer.snapshot()   # 日誌被刪掉，b 只在快照裡
+    writer.append("set", ["players", "c"], {"games": 0})   # 新日誌
+    data = reader.sync(cursor)
+    assert set(data["players"]) == {"a", "b", "c"}
+    assert reader.sync(cursor) is None
+    assert cursor.seq == writer.seq
+
+
+def test_shared_store_cursors(tmp_path):
+    """同一個 StateStore 給兩個 session 用：各自的 cursor 知道自己看過哪一版"""
+    store = make_store(tmp_path)
+    mine, other = Cursor(), Cursor()
+    store.load(mine)
+    store.load(other)
+
+    store.append("set", ["players", "a"], {"games": 1}, cursor=mine)
+    assert store.sync(mine) is None   # 自己寫的不用再同步
+    assert store.sync(other)["players"] == {"a": {"games": 1}}
+
+    store.snapshot(cursor=mine)
+    assert store.sync(other) is None
+    assert not os.path.exists(store.log_path)
+
+
+def test_append_pulls_other_writers_first(tmp_path):
+    a = make_store(tmp_path)
+    b = StateStore(a.path)
+    cursor_b = Cursor()
+    b.load(cursor_b)
+    a.append("set", ["players", "a"], {"games": 1})
+    b.append("set", ["players", "b"], {"games": 0}, cursor=cursor_b)
+    # b 寫之前先讀進 a 的修改，seq 不重複；cursor 不前進，下次同步拿到合併後的狀態
+    assert b.seq == a.seq + 1
+    assert set(b.sync(cursor_b)["players"]) == {"a", "b"}
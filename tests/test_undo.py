@@ -0,0 +1,100 @@
+from storage import MISSING, StateStore
+from undo import Step, UndoLog
+
+
+def make_devices(tmp_path):
+    """同一份存檔的兩台裝置"""
+    a = StateStore(str(tmp_path / "state.json"))
+    a.snapshot({"players": {"甲": {"games": 0}, "乙": {"games": 0}},
+                "courts": {"1": ["甲"], "2": []}, "history": []})
+    b = StateStore(a.path)
+    b.load()
+    return a, b
+
+
+def do(store, label, changes):
+    """在 store 上做一個動作，回傳可以復原的 Step"""
+    journal = []
+    store.append_many(changes, record=journal)
+    return Step.from_journal(label, journal)
+
+
+def replay(store, step, undo=True):
+    store.append_many([(op, path, value, extra) for op, path, value, extra in step.events(undo=undo)])
+
+
+def test_undo_and_redo(tmp_path):
+    a, _ = make_devices(tmp_path)
+    step = do(a, "結束", [("insert", ["history"], {"id": "m1"}, {"index": 0}),
+                        ("set", ["players", "甲", "games"], 1, {}),
+                        ("set", ["courts", "1"], [], {}),
+                        ("del", ["players", "乙"], None, {})])
+    after = a.state
+    replay(a, step, undo=True)
+    assert a.state["history"] == []
+    assert a.state["players"] == {"甲": {"games": 0}, "乙": {"games": 0}}
+    assert a.state["courts"]["1"] == ["甲"]
+    assert step.conflicts(a.state, undo=False) == []
+    replay(a, step, undo=False)
+    assert a.state == after
+
+
+def test_undo_keeps_other_devices_unrelated_changes(tmp_path):
+    a, b = make_devices(tmp_path)
+    step = do(a, "甲 +1", [("set", ["players", "甲", "games"], 1, {})])
+    b.append("set", ["courts", "2"], ["乙"])   # 別台裝置改了別的欄位
+
+    a.load()   # 復原前先同步
+    assert step.conflicts(a.state) == []
+    replay(a, step)
+    data = StateStore(a.path).load()
+    assert data["players"]["甲"]["games"] == 0
+    assert data["courts"]["2"] == ["乙"]
+
+
+def test_undo_refused_after_other_device_changed_same_path(tmp_path):
+    a, b = make_devices(tmp_path)
+    step = do(a, "移除乙", [("del", ["players", "乙"], None, {})])
+    b.append("set", ["players", "乙"], {"games": 3})   # 別台裝置又把乙加回來
+
+    a.load()
+    assert step.conflicts(a.state) == [("players", "乙")]
+
+
+def test_redo_refused_after_other_device_changed_same_path(tmp_path):
+    a, b = make_devices(tmp_path)
+    step = do(a, "清除場地", [("set", ["courts", "1"], [], {})])
+    replay(a, step)   # 復原
+    b.append("set", ["courts", "1"], ["甲", "乙"])
+
+    a.load()
+    assert step.conflicts(a.state, undo=False) == [("courts", "1")]
+
+
+def test_insert_conflicts_when_other_device_removed_it(tmp_path):
+    a, b = make_devices(tmp_path)
+    step = do(a, "結束", [("insert", ["history"], {"id": "m1"}, {"index": 0})])
+    b.append("remove", ["history"], {"id": "m1"})
+    a.load()
+    assert step.conflicts(a.state) == [("history",)]
+
+
+def test_step_records_missing_before_value(tmp_path):
+    a, _ = make_devices(tmp_path)
+    step = do(a, "新增", [("set", ["players", "丙"], {"games": 0}, {})])
+    assert step.changes[0][2] is MISSING
+    replay(a, step)
+    assert "丙" not in a.state["players"]
+
+
+def test_undo_log_limits_and_clears_redo():
+    log = UndoLog(max_steps=2)
+    steps = [Step(str(i), [("set", ("x",), i, i + 1)]) for i in range(3)]
+    for step in steps:
+        log.record(step)
+    assert list(log.done) == steps[1:]
+    assert log.pop_undo() is steps[2]
+    assert log.peek_redo() is steps[2]
+    log.record(Step("新的", [("set", ("y",), 0, 1)]))
+    assert log.peek_redo() is None
+    assert not log.record(Step("沒有修改", []))
@@ -0,0 +1,111 @@
+from collections import deque
+
+from storage import MISSING, get_path
+
+MAX_STEPS = 30            # 最多可以復原幾步
+VOLATILE = ("staged",)    # 會自動重算的欄位：復原時不檢查有沒有被改過
+
+
+class Step:
+    """一個可以復原的動作：寫進日誌的每筆修改，記下路徑上修改前後的值
+
+    存檔狀態不會被就地修改 (storage.apply_event 只複製路徑上的那幾層)，
+    所以這裡留的是舊值/新值的參考，不是整份狀態的複本；記憶體只和改到的
+    那幾個欄位有關，和名單多大無關。
+    """
+    __slots__ = ("label", "changes", "games")
+
+    def __init__(self, label, changes, games=None):
+        self.label = label
+        self.changes = changes        # [(op, path, 修改前, 修改後)]，insert 的修改前後都是插入的那筆
+        self.games = dict(games or {})  # 名字 -> 這一步讓累計場次加了幾場 (會員名錄用)
+
+    @classmethod
+    def from_journal(cls, label, journal, games=None):
+        """journal: StateStore.append(record=...) 收集到的 [(事件, 修改前的值)]"""
+        changes = []
+        for event, before in journal:
+            op, path = event["op"], tuple(event["path"])
+            if op == "insert":
+                changes.append(("insert", path, event["value"], event["value"]))
+            elif op == "del":
+                changes.append(("set", path, before, MISSING))
+            else:
+                changes.append(("set", path, before, event["value"]))
+        return cls(label, changes, games)
+
+    def conflicts(self, state, undo=True):
+        """其他裝置之後又改過的路徑 (這時候復原/重做會蓋掉別人的修改)"""
+        bad = []
+        for op, path, before, after in self.changes:
+            if path[0] in VOLATILE:
+                continue
+            current = get_path(state, path)
+            if op == "insert":
+                items = current if isinstance(current, list) else []
+                if (after in items) != undo:
+                    bad.append(path)
+                continue
+            expected = after if undo else before
+            if current is not expected and current != expected:
+                bad.append(path)
+        # 同一個路徑在這一步裡可能寫了好幾次，只回報一次
+        return sorted(set(bad))
+
+    def events(self, undo=True):
+        """要寫進日誌的事件 [(op, path, value, extra)]：復原時倒著把每筆改回去"""
+        out = []
+        changes = reversed(self.changes) if undo else self.changes
+        for op, path, before, after in changes:
+            if op == "insert":
+                out.append(("remove", path, after, {}) if undo else ("insert", path, after, {"index": 0}))
+                continue
+            value = before if undo else after
+            if value is MISSING:
+                out.append(("del", path, None, {}))
+            else:
+                out.append(("set", path, value, {}))
+        return out
+
+    def players(self):
+        """這一步動到的球員名字"""
+        return sorted({path[1] for _, path, _, _ in self.changes
+                       if len(path) >= 2 and path[0] == "players"})
+
+
+class UndoLog:
+    """每台裝置自己的復原 / 重做紀錄 (最多 max_steps 步，太舊的自動丟掉)"""
+
+    def __init__(self, max_steps=MAX_STEPS):
+        self.done = deque(maxlen=max_steps)
+        self.undone = deque(maxlen=max_steps)
+
+    def record(self, step):
+        """記下新的一步 (沒有修改就不記)；做了新動作後，之前復原的就不能重做了"""
+        if not step.changes:
+            return False
+        self.done.append(step)
+        self.undone.clear()
+        return True
+
+    def peek_undo(self):
+        return self.done[-1] if self.done else None
+
+    def peek_redo(self):
+        return self.undone[-1] if self.undone else None
+
+    def pop_undo(self):
+        step = self.done.pop()
+        self.undone.append(step)
+        return step
+
+    def pop_redo(self):
+        step = self.undone.pop()
+        self.done.append(step)
+        return step
+
+    def discard(self, step):
+        """別的裝置改過、已經無法復原/重做的那一步"""
+        for stack in (self.done, self.undone):
+            if step in stack:
+                stack.remove(step)